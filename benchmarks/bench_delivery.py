@@ -0,0 +1,158 @@
+"""Сквозной бенчмарк выдачи против локального minecraft_bot/mock_server.js.
+
+Режимы:
+  oneshot — give_minecraft_currency на каждый заказ (новый Node-процесс и подключение);
+  daemon  — то же через постоянную сессию BotSession (без переподключения);
+  batch   — заказы ставятся в очередь выдачи, их разбирает исполнитель плагина
+            (объединение заказов одного игрока, завершение, уведомления).
+Отчёт: заказов в минуту и длительность этапов (p50/p95) по отметкам таймлайна.
+Нужен npm install в minecraft_bot (mineflayer, minecraft-protocol).
+
+    python benchmarks/bench_delivery.py --modes oneshot,daemon,batch --orders 10 --json delivery.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from plugin_env import (FakeCardinal, MockServer, load_plugin, unload_plugin, mock_bot_config,
+                        use_plugin_config_for_node, percentile)
+
+ONESHOT_STAGES = ('bot_connected', 'logged_in', 'pay_sent', 'pay_confirmed')
+
+
+def stage_durations(start: float, marks: dict, stages, finish=None) -> dict:
+    """Длительность каждого этапа от предыдущей отметки (сек); 'return' — от последней отметки до возврата"""
+    durations = {}
+    previous = start
+    for stage in stages:
+        if marks.get(stage):
+            durations[stage] = marks[stage] - previous
+            previous = marks[stage]
+    if finish is not None:
+        durations['return'] = finish - previous
+    return durations
+
+
+def direct_deliveries(plugin, orders: int, players: int, amount: int):
+    """oneshot/daemon: выдачи по одной, длительности этапов по таймлайну Node-бота"""
+    samples = []
+    failures = 0
+    for i in range(orders):
+        started = time.time()
+        result = plugin.give_minecraft_currency(f"Player{i % players}", amount)
+        finished = time.time()
+        if not result.get('success'):
+            failures += 1
+            continue
+        marks = {stage: ts / 1000 for stage, ts in (result.get('timeline') or {}).items()}
+        samples.append(stage_durations(started, marks, ONESHOT_STAGES, finished))
+    return samples, failures
+
+
+def queued_deliveries(plugin, c: FakeCardinal, orders: int, players: int, amount: int, timeout: float):
+    """batch: подтверждённые заказы в очередь, ждём, пока исполнитель их завершит"""
+    order_ids = []
+    for i in range(orders):
+        order_id = f"D{i:05d}"
+        buyer_id = 1000 + i
+        plugin.orders_info[order_id] = {'buyer_id': buyer_id, 'chat_id': buyer_id, 'buyer_username': f"buyer{buyer_id}", 'order_id': order_id}
+        plugin.pending_orders[order_id] = {
+            'order_id': order_id, 'amount': amount, 'lot_title': 'bench', 'price': 100,
+            'date': time.strftime("%Y-%m-%d %H:%M:%S"), 'status': 'ready_for_admin',
+            'waiting_for_username': False, 'minecraft_username': f"Player{i % players}"
+        }
+        plugin.mark_order_stage(order_id, 'confirmed')
+        order_ids.append(order_id)
+    for order_id in order_ids:
+        plugin.start_delivery(order_id)
+
+    deadline = time.time() + timeout
+    while time.time() < deadline and any(order_id in plugin.pending_orders for order_id in order_ids):
+        time.sleep(0.5)
+
+    samples = []
+    failures = 0
+    for order_id in order_ids:
+        # Выданный заказ уже перенесён из orders_info в архив
+        record = plugin.orders_info.get(order_id) or plugin.find_archived_order(order_id) or {}
+        timeline = record.get('timeline', {})
+        if 'buyer_notified' not in timeline:
+            failures += 1
+            continue
+        stages = [stage for stage in plugin.ORDER_STAGES[plugin.ORDER_STAGES.index('queued') + 1:]]
+        samples.append(stage_durations(timeline['queued'], timeline, stages))
+    return samples, failures
+
+
+def run(mode: str, args) -> dict:
+    server = MockServer(port=args.port, reply_delay=args.reply_delay, balance=args.orders * args.amount * 2).start()
+    plugin = load_plugin(config_overrides=mock_bot_config(args.port))
+    use_plugin_config_for_node(plugin)
+    c = FakeCardinal()
+    plugin.init_commands(c)
+    try:
+        started = time.time()
+        if mode == 'daemon':
+            plugin.bot_session = plugin.BotSession()
+            if not plugin.bot_session.start():
+                raise RuntimeError("Постоянная сессия не подключилась к mock_server.js")
+            started = time.time()
+        if mode == 'batch':
+            samples, failures = queued_deliveries(plugin, c, args.orders, args.players, args.amount, args.timeout)
+        else:
+            samples, failures = direct_deliveries(plugin, args.orders, args.players, args.amount)
+        elapsed = time.time() - started
+    finally:
+        if plugin.bot_session:
+            plugin.bot_session.stop()
+        unload_plugin(plugin)
+        server.stop()
+
+    stages = {}
+    for sample in samples:
+        for stage, seconds in sample.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "mode": mode,
+        "orders": args.orders,
+        "delivered": len(samples),
+        "failed": failures,
+        "server_transfers": len(server.payments()),
+        "orders_per_minute": round(len(samples) / elapsed * 60, 2) if elapsed else 0,
+        "stages_sec": {stage: {"p50": round(percentile(sorted(values), 0.5), 3), "p95": round(percentile(sorted(values), 0.95), 3)}
+                       for stage, values in stages.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="oneshot,daemon,batch")
+    parser.add_argument("--orders", type=int, default=10)
+    parser.add_argument("--players", type=int, default=3, help="разных игроков (в batch заказы одного игрока объединяются)")
+    parser.add_argument("--amount", type=int, default=1000000)
+    parser.add_argument("--port", type=int, default=25599)
+    parser.add_argument("--reply-delay", type=int, default=50, help="задержка ответов сервера, мс")
+    parser.add_argument("--timeout", type=float, default=900, help="сколько ждать очередь в режиме batch, сек")
+    parser.add_argument("--json", help="записать результаты в файл")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    results = []
+    for mode in args.modes.split(","):
+        result = run(mode, args)
+        results.append(result)
+        print(f"{mode}: {result['delivered']}/{result['orders']} выдано, {result['orders_per_minute']} заказов/мин, "
+              f"переводов на сервере {result['server_transfers']}")
+        for stage, values in result["stages_sec"].items():
+            print(f"    {stage:<18} p50 {values['p50']:>7} с   p95 {values['p95']:>7} с")
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "delivery", "args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Пропускная способность minecraft_currency_handler на синтетическом потоке событий.
+
+Поток: buyers покупателей, concurrent заказов одновременно в работе. Каждый заказ —
+NewOrderEvent, затем никнейм (иногда с опечаткой и повторным вводом), затем «+»;
+между ними — посторонние сообщения в чатах. Перед замером в хранилище лежит
+--pending ожидающих заказов других покупателей: сообщения просматривают весь список.
+Очередь выдачи копится, но Node-бот не запускается — замеряется только приём.
+
+    python benchmarks/bench_handler.py --pending 100,1000,10000 --orders 500 --json handler.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from plugin_env import (FakeCardinal, load_plugin, unload_plugin, new_message_event, new_order_event,
+                        percentile, written_bytes)
+
+NICK_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_"
+CHATTER = ("привет", "когда выдача?", "спасибо", "ок", "а можно быстрее?", "подскажите пожалуйста")
+
+
+def random_nick(rng: random.Random) -> str:
+    return "".join(rng.choice(NICK_CHARS) for _ in range(rng.randint(4, 14)))
+
+
+def preload_pending(plugin, count: int, first_buyer: int):
+    """Ожидающие никнейма заказы других покупателей — фон, на котором идёт замер"""
+    pending, info = {}, {}
+    for i in range(count):
+        order_id = f"P{i:06d}"
+        buyer_id = first_buyer + i
+        pending[order_id] = {
+            'order_id': order_id, 'amount': 1000000, 'lot_title': '1кк монет', 'price': 100,
+            'date': '2024-01-01 00:00:00', 'status': 'waiting_username',
+            'waiting_for_username': True, 'minecraft_username': None
+        }
+        info[order_id] = {'buyer_id': buyer_id, 'chat_id': buyer_id, 'buyer_username': f"buyer{buyer_id}", 'order_id': order_id}
+    plugin.save_pending_orders(pending)
+    plugin.save_orders_info(info)
+
+
+def build_stream(c: FakeCardinal, buyers: int, orders: int, concurrent: int, rng: random.Random):
+    """Список событий: у каждого заказа свой порядок шагов, заказы перемешаны окнами по concurrent"""
+    scripts = []
+    for i in range(orders):
+        buyer_id = 1 + i % buyers
+        order_id = f"B{i:06d}"
+        steps = [("order", order_id, buyer_id)]
+        if rng.random() < 0.1:
+            steps.append(("message", buyer_id, "ник " + random_nick(rng) + "!"))  # отклонённый никнейм
+        steps.append(("message", buyer_id, random_nick(rng)))
+        if rng.random() < 0.05:
+            steps += [("message", buyer_id, "-"), ("message", buyer_id, random_nick(rng))]
+        steps.append(("message", buyer_id, "+"))
+        scripts.append(steps)
+
+    events = []
+    # Покупатель ведёт один заказ за раз: окна из concurrent заказов разных покупателей
+    for start in range(0, len(scripts), concurrent):
+        window = [list(steps) for steps in scripts[start:start + concurrent]]
+        seen_buyers = set()
+        active = []
+        for steps in window:
+            buyer_id = steps[0][2]
+            if buyer_id in seen_buyers:
+                events.extend(make_event(c, step) for step in steps)
+            else:
+                seen_buyers.add(buyer_id)
+                active.append(steps)
+        while active:
+            steps = rng.choice(active)
+            events.append(make_event(c, steps.pop(0)))
+            if not steps:
+                active.remove(steps)
+            if rng.random() < 0.2:
+                chatter_id = 900000 + rng.randint(0, 999)
+                events.append(new_message_event(chatter_id, chatter_id, rng.choice(CHATTER)))
+    return events
+
+
+def make_event(c: FakeCardinal, step):
+    if step[0] == "order":
+        _, order_id, buyer_id = step
+        return new_order_event(c, order_id, buyer_id, buyer_id)
+    _, buyer_id, text = step
+    return new_message_event(buyer_id, buyer_id, text)
+
+
+def run(pending: int, buyers: int, orders: int, concurrent: int, seed: int, log_level: str) -> dict:
+    plugin = load_plugin(config_overrides={
+        "load_shedding": {"enabled": False},
+        "stock_sync": {"enabled": False},
+        "logging": {"level": log_level, "max_bytes": 1 << 40},
+    })
+    preload_pending(plugin, pending, first_buyer=100000)
+    c = FakeCardinal()
+    plugin.init_commands(c)
+    # Выдача не входит в замер: исполнитель очереди считается уже запущенным
+    plugin.delivery_worker_running = True
+
+    events = build_stream(c, buyers, orders, concurrent, random.Random(seed))
+    bytes_before = written_bytes(plugin)
+    latencies = []
+    started = time.perf_counter()
+    for event in events:
+        t0 = time.perf_counter()
+        plugin.minecraft_currency_handler(c, event)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    json_bytes = written_bytes(plugin) - bytes_before
+
+    unload_plugin(plugin)
+    log_bytes = os.path.getsize(plugin.LOG_PATH) if os.path.exists(plugin.LOG_PATH) else 0
+    latencies.sort()
+    return {
+        "pending": pending,
+        "events": len(events),
+        "confirmed": sum(1 for data in plugin.pending_orders.values() if data.get('status') == 'queued'),
+        "events_per_sec": round(len(events) / elapsed, 1),
+        "latency_ms": {q: round(percentile(latencies, float(q)) * 1000, 3) for q in ("0.5", "0.95", "0.99")},
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "json_bytes_written": json_bytes,
+        "log_bytes_written": log_bytes,
+        "get_order_calls": c.account.get_order_calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pending", default="100,1000,10000", help="размеры фона ожидающих заказов через запятую")
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=300, help="заказов в потоке")
+    parser.add_argument("--concurrent", type=int, default=20, help="заказов одновременно в работе")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--json", help="записать результаты в файл")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    results = []
+    print(f"{'pending':>8} {'events':>7} {'ev/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>9} {'JSON KiB':>10} {'log KiB':>8}")
+    for pending in (int(value) for value in args.pending.split(",")):
+        result = run(pending, args.buyers, args.orders, args.concurrent, args.seed, args.log_level)
+        results.append(result)
+        latency = result["latency_ms"]
+        print(f"{pending:>8} {result['events']:>7} {result['events_per_sec']:>9} {latency['0.5']:>8} {latency['0.95']:>8} "
+              f"{latency['0.99']:>8} {result['max_ms']:>9} {result['json_bytes_written'] // 1024:>10} {result['log_bytes_written'] // 1024:>8}")
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "handler", "args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
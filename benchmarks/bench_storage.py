@@ -0,0 +1,169 @@
+"""Микробенчмарки хранилища: загрузка и сохранение заказов от 100 до 100k записей.
+
+Для каждого бэкенда из BACKENDS и каждого его хранилища замеряются время сохранения
+и загрузки (медиана по --repeat), байт записано и пиковая память операции (tracemalloc,
+отдельным прогоном, чтобы трассировка не искажала время). Бэкенды: горячие JSON-файлы
+(ожидающие заказы, информация о заказах) и архив выполненных заказов — помесячный
+NDJSON, куда заказы дописываются по одному (archive_order), и сжатый gzip прошлый
+месяц; архив читается потоково (iter_archive). Результаты — в отчёт --json.
+
+    python benchmarks/bench_storage.py --sizes 100,1000,10000,100000 --json storage.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from plugin_env import load_plugin, unload_plugin
+
+
+def make_pending(count: int) -> dict:
+    return {
+        f"{i:08X}": {
+            'order_id': f"{i:08X}", 'amount': 1000000 * (1 + i % 5), 'lot_title': '1кк монет на анархии', 'price': 100 + i % 400,
+            'date': '2024-05-01 12:00:00', 'status': ('waiting_username', 'queued', 'ready_for_admin')[i % 3],
+            'waiting_for_username': i % 3 == 0, 'minecraft_username': None if i % 3 == 0 else f"Player_{i}"
+        }
+        for i in range(count)
+    }
+
+
+def make_orders_info(count: int) -> dict:
+    """Записи в том виде, в каком их оставляет выданный заказ: таймлайн этапов и попытки выдачи"""
+    base = 1714550400.0
+    info = {}
+    for i in range(count):
+        start = base + i * 60
+        info[f"{i:08X}"] = {
+            'buyer_id': 100000 + i, 'chat_id': 200000 + i, 'buyer_username': f"buyer{i}", 'order_id': f"{i:08X}",
+            'timeline': {stage: start + offset for offset, stage in enumerate(
+                ('paid', 'intake_done', 'after_payment_sent', 'nickname_received', 'confirmed', 'queued',
+                 'bot_connected', 'logged_in', 'pay_sent', 'pay_confirmed', 'buyer_notified'))},
+            'attempts': [{'cid': f"{i:010x}", 'account': 'Bot', 'started': start + 5, 'finished': start + 15,
+                          'success': True, 'error': None, 'stage': None,
+                          'timeline': {'bot_connected': int((start + 6) * 1000), 'pay_confirmed': int((start + 14) * 1000)}}]
+        }
+    return info
+
+
+def make_archived(count: int) -> list:
+    """Выполненные заказы в том виде, в каком их пишет archive_order"""
+    info = make_orders_info(count)
+    return [dict(order_data, status='completed', completed_date='2024-05-01 12:10:00', completed_by='auto_bot',
+                 **{key: info[order_id][key] for key in ('buyer_id', 'chat_id', 'buyer_username', 'timeline', 'attempts')})
+            for order_id, order_data in make_pending(count).items()]
+
+
+def plugin_json_backend(plugin):
+    """Текущий бэкенд плагина: JSON-файлы через load_*/save_*"""
+    return {
+        'pending_orders': (plugin.save_pending_orders, plugin.load_pending_orders, plugin.PENDING_ORDERS_PATH),
+        'orders_info': (plugin.save_orders_info, plugin.load_orders_info, plugin.ORDERS_PATH),
+    }
+
+
+def plugin_archive_backend(plugin):
+    """Архив: заказы дописываются по одному в партицию текущего месяца; прошлые месяцы хранятся сжатыми"""
+    current_path = plugin.archive_partition_path(time.strftime("%Y-%m"))
+    closed_month = '2000-01'
+
+    def archive(records, compress=False):
+        shutil.rmtree(plugin.ARCHIVE_DIR, ignore_errors=True)
+        for record in records:
+            plugin.archive_order(record['order_id'], record, save_info=False)
+        if compress:
+            # Партиция становится прошлым месяцем и сжимается, как при смене месяца
+            os.replace(current_path, plugin.archive_partition_path(closed_month))
+            with plugin.archive_lock:
+                plugin.compress_archive_partitions()
+
+    def read():
+        # Архив читается потоково — в память не собираем, считаем записи
+        return sum(1 for _ in plugin.iter_archive())
+
+    return {
+        'archive': (archive, read, current_path),
+        'archive_gz': (lambda records: archive(records, compress=True), read,
+                       plugin.archive_partition_path(closed_month, compressed=True)),
+    }
+
+
+# Бэкенды хранилища, которые поддерживает плагин: имя → фабрика {хранилище: (save, load, путь)}
+BACKENDS = {
+    'json': plugin_json_backend,
+    'archive': plugin_archive_backend,
+}
+
+STORES = {
+    'pending_orders': make_pending,
+    'orders_info': make_orders_info,
+    'archive': make_archived,
+    'archive_gz': make_archived,
+}
+
+
+def measure(func, repeat: int):
+    """Медиана времени (сек) и пиковая память (байт) вызова func"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def run(sizes, repeat: int) -> list:
+    plugin = load_plugin()
+    results = []
+    try:
+        for backend_name, factory in BACKENDS.items():
+            for store, (save, load, path) in factory(plugin).items():
+                for size in sizes:
+                    data = STORES[store](size)
+                    save_sec, save_peak = measure(lambda: save(data), repeat)
+                    file_bytes = os.path.getsize(path)
+                    load_sec, load_peak = measure(load, repeat)
+                    loaded = load()
+                    # Потоковые хранилища возвращают число прочитанных записей
+                    loaded_count = loaded if isinstance(loaded, int) else len(loaded)
+                    results.append({
+                        'backend': backend_name, 'store': store, 'orders': size,
+                        'save_ms': round(save_sec * 1000, 2), 'load_ms': round(load_sec * 1000, 2),
+                        'bytes_written': file_bytes, 'bytes_per_order': round(file_bytes / size, 1),
+                        'save_peak_kib': save_peak // 1024, 'load_peak_kib': load_peak // 1024,
+                        'roundtrip_ok': loaded_count == size,
+                    })
+                    print(f"{backend_name:<8} {store:<15} {size:>7} {results[-1]['save_ms']:>10} {results[-1]['load_ms']:>10} "
+                          f"{file_bytes // 1024:>10} {results[-1]['save_peak_kib']:>10} {results[-1]['load_peak_kib']:>10}", flush=True)
+    finally:
+        unload_plugin(plugin)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="записать отчёт в файл")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    print(f"{'backend':<8} {'store':<15} {'orders':>7} {'save ms':>10} {'load ms':>10} {'file KiB':>10} {'save KiB':>10} {'load KiB':>10}")
+    results = run([int(size) for size in args.sizes.split(",")], args.repeat)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "storage", "args": vars(args), "python": sys.version.split()[0], "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Окружение для бенчмарков: плагин без FunPay Cardinal и Telegram.
+
+FunPayAPI и telebot подменяются минимальными модулями, Cardinal — объектом
+FakeCardinal (account.get_order, send_message, telegram.bot). Каждый запуск
+плагина получает свою рабочую папку, поэтому storage/ репозитория не трогается.
+"""
+import importlib.util
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_PATH = os.path.join(REPO_DIR, "minecraft_currency.py")
+
+
+class Obj:
+    """Объект с произвольными атрибутами (заказ, сообщение, чат)"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class NewMessageEvent:
+    def __init__(self, message):
+        self.message = message
+
+
+class NewOrderEvent:
+    def __init__(self, order):
+        self.order = order
+
+
+class InlineKeyboardMarkup:
+    def __init__(self, row_width=3, **kwargs):
+        self.rows = []
+
+    def add(self, *buttons):
+        self.rows.append(buttons)
+
+    def row(self, *buttons):
+        self.rows.append(buttons)
+
+
+class InlineKeyboardButton:
+    def __init__(self, text, callback_data=None, **kwargs):
+        self.text = text
+        self.callback_data = callback_data
+
+
+def install_stubs():
+    """Регистрирует в sys.modules заглушки FunPayAPI и telebot (всегда — события создаёт бенчмарк)"""
+    funpay = types.ModuleType("FunPayAPI")
+    funpay.enums = types.SimpleNamespace()
+    updater = types.ModuleType("FunPayAPI.updater")
+    events = types.ModuleType("FunPayAPI.updater.events")
+    events.NewMessageEvent = NewMessageEvent
+    events.NewOrderEvent = NewOrderEvent
+    funpay.updater = updater
+    updater.events = events
+
+    telebot = types.ModuleType("telebot")
+    telebot_types = types.ModuleType("telebot.types")
+    telebot_types.Message = object
+    telebot_types.CallbackQuery = object
+    telebot_types.InlineKeyboardMarkup = InlineKeyboardMarkup
+    telebot_types.InlineKeyboardButton = InlineKeyboardButton
+    telebot.types = telebot_types
+
+    sys.modules.update({
+        "FunPayAPI": funpay,
+        "FunPayAPI.updater": updater,
+        "FunPayAPI.updater.events": events,
+        "telebot": telebot,
+        "telebot.types": telebot_types,
+    })
+
+
+class FakeBot:
+    """telegram.bot: сообщения копятся в sent, обработчики команд регистрируются в handlers"""
+
+    def __init__(self):
+        self.sent = []
+        self.handlers = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return Obj(message_id=len(self.sent))
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.sent.append((chat_id, text))
+
+    def send_document(self, chat_id, document, **kwargs):
+        self.sent.append((chat_id, getattr(document, "name", "document")))
+
+    def answer_callback_query(self, *args, **kwargs):
+        pass
+
+    def delete_message(self, *args, **kwargs):
+        pass
+
+    def message_handler(self, **kwargs):
+        def decorator(func):
+            self.handlers.append(("message", kwargs, func))
+            return func
+        return decorator
+
+    def callback_query_handler(self, **kwargs):
+        def decorator(func):
+            self.handlers.append(("callback", kwargs, func))
+            return func
+        return decorator
+
+
+class FakeAccount:
+    id = 1
+
+    def __init__(self):
+        self.orders = {}
+        self.get_order_calls = 0
+
+    def get_order(self, order_id):
+        self.get_order_calls += 1
+        return self.orders[order_id]
+
+
+class FakeCardinal:
+    def __init__(self):
+        self.account = FakeAccount()
+        self.telegram = Obj(bot=FakeBot())
+        self.chat = []
+
+    def send_message(self, chat_id, text, *args, **kwargs):
+        self.chat.append((chat_id, text))
+        return True
+
+
+def new_order_event(c: FakeCardinal, order_id, buyer_id, chat_id, amount=1, price=100):
+    """NewOrderEvent; заказ заодно становится доступен через c.account.get_order"""
+    order = Obj(id=order_id, buyer_id=buyer_id, chat_id=chat_id, buyer_username=f"buyer{buyer_id}",
+                amount=amount, price=price, description="1кк монет")
+    c.account.orders[order_id] = order
+    return NewOrderEvent(order)
+
+
+def new_message_event(author_id, chat_id, text):
+    return NewMessageEvent(Obj(author_id=author_id, chat_id=chat_id, text=text))
+
+
+def load_plugin(workdir=None, config_overrides=None):
+    """Загружает свежий экземпляр плагина в рабочей папке workdir (по умолчанию — временной).
+
+    config_overrides накладываются на конфигурацию по умолчанию до импорта,
+    чтобы настройки логирования применились сразу.
+    """
+    install_stubs()
+    workdir = workdir or tempfile.mkdtemp(prefix="mc_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    # Обработчик лога от предыдущего экземпляра пишет в чужую папку — снимаем его
+    plugin_logger = logging.getLogger("FPC.minecraft_currency")
+    for handler in list(plugin_logger.handlers):
+        plugin_logger.removeHandler(handler)
+
+    spec = importlib.util.spec_from_file_location("minecraft_currency", PLUGIN_PATH)
+    plugin = importlib.util.module_from_spec(spec)
+    if config_overrides:
+        # Конфигурация по умолчанию есть только в самом плагине: импортируем дважды
+        spec.loader.exec_module(plugin)
+        config = merge_config(plugin.create_default_config(), config_overrides)
+        plugin.stop_logging()
+        for handler in list(plugin_logger.handlers):
+            plugin_logger.removeHandler(handler)
+        with open(plugin.CONFIG_PATH, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
+        plugin = importlib.util.module_from_spec(spec)
+    sys.modules["minecraft_currency"] = plugin
+    spec.loader.exec_module(plugin)
+    return plugin
+
+
+def unload_plugin(plugin):
+    """Дописывает лог и останавливает фоновые службы экземпляра"""
+    plugin.RUNNING = False
+    if plugin.metrics_server:
+        plugin.metrics_server.shutdown()
+    plugin.stop_logging()
+
+
+def merge_config(base: dict, overrides: dict) -> dict:
+    """Рекурсивное наложение настроек"""
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merge_config(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def percentile(sorted_values, q):
+    """Перцентиль по отсортированной выборке (ближайший ранг)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def written_bytes(plugin) -> int:
+    """Байт записано в JSON-файлы плагина (по счётчикам /metrics)"""
+    with plugin.metrics_lock:
+        return sum(stats[2] for stats in plugin.metrics['writes'].values())
+
+
+class MockServer:
+    """minecraft_bot/mock_server.js в отдельном процессе; события сервера копятся в events"""
+
+    def __init__(self, port=25599, ledger=None, **options):
+        self.port = port
+        self.ledger = ledger
+        self.options = options
+        self.process = None
+        self.events = []
+
+    def start(self, timeout=30):
+        args = ["node", os.path.join(REPO_DIR, "minecraft_bot", "mock_server.js"), f"--port={self.port}"]
+        if self.ledger:
+            args.append(f"--ledger={self.ledger}")
+        args += [f"--{key.replace('_', '-')}={value}" for key, value in self.options.items()]
+        self.process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8")
+        listening = threading.Event()
+
+        def read_events():
+            for line in self.process.stdout:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.events.append(event)
+                if event.get("event") == "listening":
+                    listening.set()
+
+        threading.Thread(target=read_events, daemon=True).start()
+        if not listening.wait(timeout):
+            self.stop()
+            raise RuntimeError("mock_server.js не запустился (нужен npm install в minecraft_bot)")
+        return self
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except Exception:
+                self.process.kill()
+
+    def payments(self):
+        return [event for event in self.events if event.get("event") == "pay"]
+
+
+def mock_bot_config(port: int, **overrides) -> dict:
+    """Настройки бота для работы с mock_server.js"""
+    config = {
+        "minecraft_bot": {
+            "enabled": True,
+            "server": "127.0.0.1",
+            "port": port,
+            "bot_username": "BenchBot",
+            "password": "bench",
+            "anarchy": "an210",
+            "check_online": False
+        },
+        "load_shedding": {"enabled": False},
+        "stock_sync": {"enabled": False},
+    }
+    return merge_config(config, overrides)
+
+
+def use_plugin_config_for_node(plugin):
+    """simple_bot.js читает конфигурацию этого экземпляра плагина, а не ../../storage"""
+    os.environ["MC_CURRENCY_CONFIG"] = os.path.abspath(plugin.CONFIG_PATH)
@@ -0,0 +1,312 @@
+"""Долгий прогон (soak) конвейера выдачи с внесением сбоев.
+
+Плагин работает в дочернем процессе (--worker) с FakeCardinal и потоком заказов,
+бот выдаёт валюту на minecraft_bot/mock_server.js. Управляющий процесс вносит сбои:
+  - кики на /pay и потерянные подтверждения перевода (настройки mock_server.js);
+  - недоступность сервера (сервер останавливается на --outage-sec — таймауты подключения);
+  - падения Node (kill -9 Node-процессов воркера — чужие simple_bot.js на машине не трогаем);
+  - «диск заполнен» при записи хранилища (OSError ENOSPC в write_json_file внутри воркера);
+  - перезапуск плагина посреди выдачи (kill -9 группы процессов воркера, как только заказ в статусе
+    delivering, и новый запуск на тех же файлах).
+В конце — прогон без сбоев (--drain-sec) и проверка: ни один заказ не оплачен дважды
+(журнал переводов сервера) и не потерян. Отчёт: задержка восстановления после сбоев,
+рост памяти по снимкам tracemalloc, число потоков и открытых файлов воркера.
+Только Linux/macOS (группы процессов, pgrep); нужен npm install в minecraft_bot.
+
+    python benchmarks/soak.py --hours 4 --rate 6 --json soak.json
+"""
+import argparse
+import errno
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from plugin_env import (FakeCardinal, MockServer, load_plugin, mock_bot_config, new_message_event, new_order_event,
+                        use_plugin_config_for_node, percentile)
+
+def read_jsonl(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass  # строка, оборванная kill -9
+    return records
+
+
+def append_jsonl(path: str, record: dict):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# ---------------------------------------------------------------- воркер
+
+def run_worker(args):
+    """Дочерний процесс: плагин, поток заказов, «диск заполнен», снимки памяти"""
+    tracemalloc.start()
+    created_path = os.path.join(args.workdir, "created.jsonl")
+    stats_path = os.path.join(args.workdir, "worker_stats.jsonl")
+    plugin = load_plugin(workdir=os.path.join(args.workdir, "plugin"), config_overrides=mock_bot_config(args.port, delivery_budget_sec=60))
+    use_plugin_config_for_node(plugin)
+
+    original_write = plugin.write_json_file
+
+    def flaky_write(path, data, indent=4):
+        if random.random() < args.disk_full_rate:
+            raise OSError(errno.ENOSPC, "No space left on device (soak)", path)
+        return original_write(path, data, indent)
+
+    plugin.write_json_file = flaky_write
+
+    c = FakeCardinal()
+    plugin.init_commands(c)
+    next_id = len(read_jsonl(created_path))
+    first_snapshot = tracemalloc.take_snapshot()
+    next_stats = time.time()
+    interval = 60 / args.rate if args.rate > 0 else None
+    next_order = time.time()
+    while True:
+        now = time.time()
+        if interval and now >= next_order:
+            order_id = f"S{next_id:06d}"
+            buyer_id = 10000 + next_id
+            append_jsonl(created_path, {"order_id": order_id, "player": f"Soak{next_id:06d}", "ts": now})
+            for event in (new_order_event(c, order_id, buyer_id, buyer_id),
+                          new_message_event(buyer_id, buyer_id, f"Soak{next_id:06d}"),
+                          new_message_event(buyer_id, buyer_id, "+")):
+                try:
+                    plugin.minecraft_currency_handler(c, event)
+                except Exception as e:
+                    append_jsonl(stats_path, {"ts": time.time(), "handler_error": repr(e)})
+            next_id += 1
+            next_order = now + random.expovariate(1 / interval)
+        if now >= next_stats:
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().compare_to(first_snapshot, "lineno")[:3]
+            append_jsonl(stats_path, {
+                "ts": now, "pid": os.getpid(), "traced_bytes": current, "peak_bytes": peak,
+                "threads": threading.active_count(),
+                "open_files": len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None,
+                "pending": len(plugin.pending_orders),
+                "top_growth": [str(stat) for stat in top]
+            })
+            next_stats = now + args.stats_interval
+        time.sleep(0.2)
+
+
+# ---------------------------------------------------------------- управляющий процесс
+
+class Soak:
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="mc_soak_")
+        self.ledger = os.path.join(self.workdir, "ledger.jsonl")
+        self.faults = []
+        self.server = None
+        self.worker = None
+        self.worker_log = open(os.path.join(self.workdir, "worker.err"), "a")
+
+    def start_server(self, kicks=True):
+        self.server = MockServer(port=self.args.port, ledger=self.ledger, balance=10 ** 15,
+                                 reply_delay=self.args.reply_delay,
+                                 kick_rate=self.args.kick_rate if kicks else 0,
+                                 drop_confirm_rate=self.args.drop_confirm_rate if kicks else 0).start()
+
+    def start_worker(self, rate, disk_full_rate):
+        command = [sys.executable, os.path.abspath(__file__), "--worker", f"--workdir={self.workdir}",
+                   f"--port={self.args.port}", f"--rate={rate}", f"--disk-full-rate={disk_full_rate}",
+                   f"--stats-interval={self.args.stats_interval}"]
+        # Своя группа процессов: Node-процессы воркера наследуют её, и сбои задевают только их
+        self.worker = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=self.worker_log, start_new_session=True)
+
+    def kill_worker(self):
+        """kill -9 воркера вместе с его Node-процессами"""
+        if self.worker and self.worker.poll() is None:
+            try:
+                os.killpg(self.worker.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.worker.wait()
+
+    def kill_worker_node(self) -> int:
+        """kill -9 Node-процессов воркера (всё в его группе, кроме самого воркера). Возвращает их число"""
+        if not self.worker or self.worker.poll() is not None:
+            return 0
+        found = subprocess.run(["pgrep", "-g", str(self.worker.pid)], capture_output=True, text=True, check=False)
+        killed = 0
+        for pid in (int(line) for line in found.stdout.split() if line.isdigit()):
+            if pid == self.worker.pid:
+                continue
+            try:
+                os.kill(pid, signal.SIGKILL)
+                killed += 1
+            except ProcessLookupError:
+                pass
+        return killed
+
+    def delivering_orders(self) -> list:
+        """Заказы, которые воркер выдаёт прямо сейчас (статус delivering в его pending-файле)"""
+        path = os.path.join(self.workdir, "plugin", "storage", "cache", "pending_minecraft_orders.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                pending = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return []
+        return [order_id for order_id, data in pending.items() if data.get("status") == "delivering"]
+
+    def fault(self, kind: str, **details):
+        self.faults.append(dict(details, kind=kind, ts=time.time()))
+        print(f"[{time.strftime('%H:%M:%S')}] сбой: {kind} {details or ''}", flush=True)
+
+    def run(self):
+        args = self.args
+        self.start_server()
+        self.start_worker(args.rate, args.disk_full_rate)
+        end = time.time() + args.hours * 3600
+        schedule = {
+            "restart": time.time() + random.expovariate(1 / args.restart_every),
+            "node_crash": time.time() + random.expovariate(1 / args.node_crash_every),
+            "connect_timeout": time.time() + random.expovariate(1 / args.outage_every),
+        }
+        try:
+            while time.time() < end:
+                # Пора перезапускать — часто проверяем, не началась ли выдача, чтобы попасть в её середину
+                time.sleep(0.05 if time.time() >= schedule["restart"] else 1)
+                now = time.time()
+                if self.worker.poll() is not None:
+                    self.fault("worker_died")
+                    self.start_worker(args.rate, args.disk_full_rate)
+                if now >= schedule["restart"]:
+                    delivering = self.delivering_orders()
+                    if delivering:
+                        self.fault("restart", orders=delivering)
+                        self.kill_worker()
+                        self.start_worker(args.rate, args.disk_full_rate)
+                        schedule["restart"] = now + random.expovariate(1 / args.restart_every)
+                if now >= schedule["node_crash"]:
+                    self.fault("node_crash", processes=self.kill_worker_node())
+                    schedule["node_crash"] = now + random.expovariate(1 / args.node_crash_every)
+                if now >= schedule["connect_timeout"]:
+                    self.fault("connect_timeout")
+                    self.server.stop()
+                    time.sleep(args.outage_sec)
+                    self.start_server()
+                    schedule["connect_timeout"] = time.time() + random.expovariate(1 / args.outage_every)
+
+            # Без новых заказов и сбоев: всё, что осталось в очереди, должно выдаться
+            print(f"[{time.strftime('%H:%M:%S')}] дорабатываем очередь без сбоев ({args.drain_sec} сек)", flush=True)
+            self.kill_worker()
+            self.server.stop()
+            self.start_server(kicks=False)
+            self.start_worker(0, 0)
+            time.sleep(args.drain_sec)
+        finally:
+            self.kill_worker()
+            if self.server:
+                self.server.stop()
+        return self.report()
+
+    def report(self) -> dict:
+        created = read_jsonl(os.path.join(self.workdir, "created.jsonl"))
+        ledger = read_jsonl(self.ledger)
+        plugin_dir = os.path.join(self.workdir, "plugin", "storage", "cache")
+        pending = json.load(open(os.path.join(plugin_dir, "pending_minecraft_orders.json"), encoding="utf-8")) \
+            if os.path.exists(os.path.join(plugin_dir, "pending_minecraft_orders.json")) else {}
+
+        transfers = {}
+        for record in ledger:
+            transfers.setdefault(record["player"], []).append(record)
+        double_paid = [order["order_id"] for order in created if len(transfers.get(order["player"], [])) > 1]
+        lost = [order["order_id"] for order in created if order["order_id"] not in pending and not transfers.get(order["player"])]
+        stuck = [order_id for order_id in pending if order_id.startswith("S")]
+
+        pay_times = sorted(record["ts"] / 1000 for record in ledger)
+        recovery = {}
+        for fault in self.faults:
+            later = [ts for ts in pay_times if ts > fault["ts"]]
+            if later:
+                recovery.setdefault(fault["kind"], []).append(later[0] - fault["ts"])
+
+        stats = read_jsonl(os.path.join(self.workdir, "worker_stats.jsonl"))
+        samples = [record for record in stats if "traced_bytes" in record]
+        segments = {}
+        for record in samples:
+            segments.setdefault(record["pid"], []).append(record)
+        longest = max(segments.values(), key=len) if segments else []
+        memory = {}
+        if len(longest) >= 2:
+            hours = max((longest[-1]["ts"] - longest[0]["ts"]) / 3600, 1e-9)
+            memory = {
+                "segment_minutes": round((longest[-1]["ts"] - longest[0]["ts"]) / 60, 1),
+                "traced_start_kib": longest[0]["traced_bytes"] // 1024,
+                "traced_end_kib": longest[-1]["traced_bytes"] // 1024,
+                "growth_kib_per_hour": round((longest[-1]["traced_bytes"] - longest[0]["traced_bytes"]) / 1024 / hours, 1),
+                "threads_start_end": [longest[0]["threads"], longest[-1]["threads"]],
+                "open_files_start_end": [longest[0]["open_files"], longest[-1]["open_files"]],
+                "top_growth": longest[-1]["top_growth"],
+            }
+
+        return {
+            "workdir": self.workdir,
+            "orders_created": len(created),
+            "transfers": len(ledger),
+            "double_paid": double_paid,
+            "lost": lost,
+            "still_pending_after_drain": stuck,
+            "faults": {kind: sum(1 for fault in self.faults if fault["kind"] == kind) for kind in {fault["kind"] for fault in self.faults}},
+            "recovery_sec": {kind: {"p50": round(percentile(sorted(values), 0.5), 1), "max": round(max(values), 1)}
+                             for kind, values in recovery.items()},
+            "handler_errors": sum(1 for record in stats if "handler_error" in record),
+            "memory": memory,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--rate", type=float, default=6, help="новых заказов в минуту")
+    parser.add_argument("--port", type=int, default=25598)
+    parser.add_argument("--reply-delay", type=int, default=100)
+    parser.add_argument("--kick-rate", type=float, default=0.03)
+    parser.add_argument("--drop-confirm-rate", type=float, default=0.03)
+    parser.add_argument("--disk-full-rate", type=float, default=0.002, help="доля записей хранилища, падающих с ENOSPC")
+    parser.add_argument("--restart-every", type=float, default=900, help="среднее время между перезапусками плагина, сек")
+    parser.add_argument("--node-crash-every", type=float, default=600)
+    parser.add_argument("--outage-every", type=float, default=1200)
+    parser.add_argument("--outage-sec", type=float, default=45)
+    parser.add_argument("--drain-sec", type=float, default=600)
+    parser.add_argument("--stats-interval", type=float, default=60)
+    parser.add_argument("--json", help="записать отчёт в файл")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    report = Soak(args).run()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "soak", "args": vars(args), "report": report}, f, ensure_ascii=False, indent=2)
+    if report["double_paid"] or report["lost"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+// Локальная замена Funtime для бенчмарков выдачи: сервер minecraft-protocol (1.19.4),
+// который ведёт себя как хаб Funtime для simple_bot.js:
+//   - после входа просит /login, на /login <пароль> отвечает об успешной авторизации;
+//   - /an<номер> — «переход на анархию»;
+//   - /pay <ник> <сумма> — первый ввод просит подтверждение, повтор в течение 10 сек переводит;
+//   - /balance — баланс бота;
+//   - кики и задержки ответов настраиваются аргументами.
+// События сервера печатаются JSON-строками в stdout, переводы дописываются в --ledger=<файл>.
+//
+//   node mock_server.js --port=25599 --balance=100000000 --reply-delay=50 --kick-rate=0.05
+const fs = require('fs');
+const mc = require('minecraft-protocol');
+
+const VERSION = '1.19.4';
+const CONFIRM_WINDOW_MS = 10000;
+
+function parseOptions(argv) {
+    const options = {
+        host: '127.0.0.1',
+        port: 25599,
+        balance: 1000000000,         // начальный баланс каждого аккаунта бота
+        replyDelay: 50,              // задержка ответа на команду, мс
+        loginPromptDelay: 300,       // через сколько после входа просить /login, мс
+        kickRate: 0,                 // вероятность кика на первом вводе /pay
+        dropConfirmRate: 0,          // вероятность «потерять» ответ на подтверждение (перевод при этом проходит)
+        offline: [],                 // ники, на которые /pay отвечает «игрок не найден»
+        ledger: null                 // файл журнала переводов (JSON-строки)
+    };
+    for (const arg of argv) {
+        const match = /^--([a-z-]+)=(.*)$/.exec(arg);
+        if (!match) continue;
+        const key = match[1].replace(/-([a-z])/g, (_, ch) => ch.toUpperCase());
+        const value = match[2];
+        if (key === 'offline') options.offline = value.split(',').filter(Boolean).map(name => name.toLowerCase());
+        else if (key === 'host' || key === 'ledger') options[key] = value;
+        else if (key in options) options[key] = Number(value);
+    }
+    return options;
+}
+
+function emit(payload) {
+    console.log(JSON.stringify(Object.assign({ ts: Date.now() }, payload)));
+}
+
+function startMockServer(options) {
+    const mcData = require('minecraft-data')(VERSION);
+    const loginPacket = mcData.loginPacket;
+    const balances = new Map();
+    const stats = { joins: 0, pays: 0, kicks: 0, dropped: 0 };
+
+    const server = mc.createServer({
+        'online-mode': false,
+        host: options.host,
+        port: options.port,
+        version: VERSION,
+        motd: 'Funtime mock',
+        maxPlayers: 100,
+        enforceSecureProfile: false
+    });
+
+    server.on('listening', () => emit({ event: 'listening', host: options.host, port: options.port }));
+
+    server.on('playerJoin', (client) => {
+        stats.joins++;
+        const account = client.username.toLowerCase();
+        if (!balances.has(account)) balances.set(account, options.balance);
+        const session = { loggedIn: false, anarchy: null, pendingPay: null };
+
+        client.write('login', Object.assign({}, loginPacket, {
+            entityId: client.id,
+            isHardcore: false,
+            gameMode: 0,
+            previousGameMode: 255,
+            worldName: 'minecraft:overworld',
+            hashedSeed: [0, 0],
+            maxPlayers: server.maxPlayers,
+            viewDistance: 10,
+            simulationDistance: 10,
+            reducedDebugInfo: false,
+            enableRespawnScreen: true,
+            isDebug: false,
+            isFlat: true
+        }));
+        client.write('position', { x: 0, y: 64, z: 0, yaw: 0, pitch: 0, flags: 0x00, teleportId: 1 });
+        // update_health с ненулевым здоровьем — по нему mineflayer выдаёт spawn
+        client.write('update_health', { health: 20, food: 20, foodSaturation: 5 });
+        emit({ event: 'join', account: client.username });
+
+        const say = (text) => {
+            setTimeout(() => {
+                if (client.state === mc.states.PLAY) {
+                    client.write('system_chat', { content: JSON.stringify({ text: text }), isActionBar: false });
+                }
+            }, options.replyDelay);
+        };
+
+        setTimeout(() => say('Авторизуйтесь: /login <пароль>'), options.loginPromptDelay);
+
+        client.on('chat_command', (packet) => handleCommand(packet.command));
+        client.on('chat_message', (packet) => {
+            if (packet.message && packet.message.startsWith('/')) handleCommand(packet.message.slice(1));
+        });
+        client.on('end', () => emit({ event: 'leave', account: client.username }));
+
+        function handleCommand(command) {
+            const [name, ...args] = command.trim().split(/\s+/);
+            const lower = name.toLowerCase();
+            if (lower === 'login') {
+                session.loggedIn = true;
+                say('Вы успешно авторизовались!');
+            } else if (/^an\d+$/.test(lower)) {
+                if (!session.loggedIn) return say('Сначала авторизуйтесь: /login <пароль>');
+                session.anarchy = lower;
+                say(`Вы перешли на анархию ${lower.slice(2)}`);
+            } else if (lower === 'balance' || lower === 'money') {
+                say(`Баланс: ${balances.get(account).toLocaleString('en-US')}$`);
+            } else if (lower === 'pay') {
+                handlePay(args[0], parseInt(args[1]));
+            }
+        }
+
+        function handlePay(player, amount) {
+            if (!session.anarchy) return say('Эта команда доступна только на анархии');
+            if (!player || isNaN(amount) || amount <= 0) return say('Использование: /pay <ник> <сумма>');
+
+            const now = Date.now();
+            const pending = session.pendingPay;
+            const confirming = pending && pending.player === player && pending.amount === amount && now - pending.at < CONFIRM_WINDOW_MS;
+            if (!confirming) {
+                if (Math.random() < options.kickRate) {
+                    stats.kicks++;
+                    emit({ event: 'kick', account: client.username, player: player, amount: amount });
+                    client.end('Вы были кикнуты с сервера: Потеряно соединение');
+                    return;
+                }
+                if (options.offline.includes(player.toLowerCase())) return say(`Игрок ${player} не найден`);
+                session.pendingPay = { player: player, amount: amount, at: now };
+                return say(`Для подтверждения перевода ${amount.toLocaleString('en-US')}$ игроку ${player} введите команду ещё раз`);
+            }
+
+            session.pendingPay = null;
+            const balance = balances.get(account);
+            if (amount > balance) return say('Недостаточно средств для перевода');
+            balances.set(account, balance - amount);
+            stats.pays++;
+            const record = { event: 'pay', account: client.username, player: player, amount: amount, balance: balance - amount };
+            emit(record);
+            if (options.ledger) fs.appendFileSync(options.ledger, JSON.stringify(Object.assign({ ts: now }, record)) + '\n');
+            if (Math.random() < options.dropConfirmRate) {
+                stats.dropped++;
+                return;
+            }
+            say(`Вы перевели ${amount.toLocaleString('en-US')}$ игроку ${player}`);
+        }
+    });
+
+    server.on('error', (error) => emit({ event: 'error', message: error.message }));
+    return { server, balances, stats };
+}
+
+module.exports = { startMockServer, parseOptions };
+
+if (require.main === module) {
+    const { stats } = startMockServer(parseOptions(process.argv.slice(2)));
+    const shutdown = () => {
+        emit(Object.assign({ event: 'stats' }, stats));
+        process.exit(0);
+    };
+    process.on('SIGINT', shutdown);
+    process.on('SIGTERM', shutdown);
+}
@@ -1,22 +1,67 @@
 const mineflayer = require('mineflayer');
 
+// Ответы сервера, по которым понятно, почему перевод не прошёл
+const FAILURE_PATTERNS = [
+    { name: 'insufficient_funds', re: /недостаточно|not enough|insufficient/i },
+    { name: 'player_offline', re: /не найден|не в сети|не онлайн|offline|not found/i }
+];
+const BAN_PATTERN = /забанен|бан|заблокирован|banned/i;
+// Строка баланса в скорборде: "Баланс: 1,234,567$", "Монет: 1 234" — там нет ничего, кроме статистики игрока
+const BALANCE_PATTERN = /(?:баланс|balance|монет|деньги|money)[^\d]*(\d[\d\s.,]*)/i;
+// Ответ на /balance — только сообщение, начинающееся с "Баланс:": реклама вида "Купи 1000 монет" балансом не считается
+const BALANCE_REPLY_PATTERN = /^\s*(?:ваш\s+)?(?:баланс|balance)\s*:\s*(\d[\d\s.,]*)/i;
+
+function parseBalance(text, pattern = BALANCE_PATTERN) {
+    const match = pattern.exec(text || '');
+    if (!match) return null;
+    let digits = match[1].trim().replace(/[\s,]/g, '');
+    // Одна точка с 1-2 цифрами после неё — дробная часть, иначе точки разделяют разряды
+    digits = /^\d+\.\d{1,2}$/.test(digits) ? digits.split('.')[0] : digits.replace(/\./g, '');
+    const value = parseInt(digits);
+    return isNaN(value) ? null : value;
+}
+
+function namedError(name, message) {
+    const error = new Error(message);
+    error.name = name;
+    return error;
+}
+
+function reasonToText(reason) {
+    if (typeof reason === 'string') return reason;
+    try {
+        return JSON.stringify(reason);
+    } catch (e) {
+        return String(reason);
+    }
+}
+
 class SimpleFuntimeBot {
-    constructor() {
+    // account — ник дополнительного аккаунта из minecraft_bot.extra_accounts (по умолчанию основной)
+    constructor(account = null) {
         this.bot = null;
         this.isConnected = false;
+        // Абсолютный срок выполнения задания (мс с эпохи), задаётся Python-стороной
+        this.deadline = null;
+        // Время прохождения этапов задания (мс с эпохи) — попадает в таймлайн заказа
+        this.marks = {};
+        // Кэш таб-листа: ники игроков онлайн в нижнем регистре (playerJoined/playerLeft)
+        this.onlinePlayers = new Set();
         this.config = {
             username: 'unk',
             password: 'unk',
             anarchy: 'an210',
             host: 'funtime.su',
             port: 25565,
-            version: '1.19.4'
+            version: '1.19.4',
+            checkOnline: true
         };
         // Try to load live JSON config saved by the Python plugin
         try {
             const fs = require('fs');
             const path = require('path');
-            const cfgPath = path.join(__dirname, '..', '..', 'storage', 'cache', 'minecraft_currency_config.json');
+            // MC_CURRENCY_CONFIG — путь к конфигурации вне папки Cardinal (бенчмарки с mock_server.js)
+            const cfgPath = process.env.MC_CURRENCY_CONFIG || path.join(__dirname, '..', '..', 'storage', 'cache', 'minecraft_currency_config.json');
             if (fs.existsSync(cfgPath)) {
                 const raw = fs.readFileSync(cfgPath, { encoding: 'utf8' });
                 const json = JSON.parse(raw || '{}');
@@ -27,6 +72,12 @@ class SimpleFuntimeBot {
                     this.config.anarchy = mb.anarchy || this.config.anarchy;
                     this.config.host = mb.server || this.config.host;
                     this.config.port = mb.port || this.config.port;
+                    if (typeof mb.check_online === 'boolean') this.config.checkOnline = mb.check_online;
+                    const extra = (mb.extra_accounts || []).find(acc => account && acc.username === account);
+                    if (extra) {
+                        this.config.username = extra.username;
+                        this.config.password = extra.password || this.config.password;
+                    }
                 }
             }
         } catch (e) {
@@ -51,19 +102,32 @@ class SimpleFuntimeBot {
 
             this.setupEventHandlers();
 
+            const connectBudget = this.remainingMs(30000);
             return new Promise((resolve, reject) => {
                 const timeout = setTimeout(() => {
-                    reject(new Error('Connection timeout'));
-                }, 30000);
+                    reject(connectBudget < 30000
+                        ? this.deadlineError('connect')
+                        : namedError('connect_timeout', 'Connection timeout'));
+                }, connectBudget);
 
                 this.bot.once('spawn', () => {
                     clearTimeout(timeout);
                     this.isConnected = true;
+                    this.mark('bot_connected');
                     resolve(true);
                 });
 
+                this.bot.once('kicked', (reason) => {
+                    clearTimeout(timeout);
+                    const text = reasonToText(reason);
+                    reject(namedError(BAN_PATTERN.test(text) ? 'banned' : 'kicked', text));
+                });
+
                 this.bot.once('error', (err) => {
                     clearTimeout(timeout);
+                    if (['ECONNREFUSED', 'ETIMEDOUT', 'ENOTFOUND', 'ECONNRESET'].includes(err.code)) {
+                        err.name = 'connect_timeout';
+                    }
                     reject(err);
                 });
             });
@@ -73,7 +137,18 @@ class SimpleFuntimeBot {
     }
 
     setupEventHandlers() {
+        this.bot.on('playerJoined', (player) => {
+            if (player && player.username) this.onlinePlayers.add(player.username.toLowerCase());
+        });
+
+        this.bot.on('playerLeft', (player) => {
+            if (player && player.username) this.onlinePlayers.delete(player.username.toLowerCase());
+        });
+
         this.bot.on('spawn', () => {
+            // Смена сервера (анархии) присылает новый таб-лист — пересобираем кэш
+            this.onlinePlayers = new Set(Object.keys(this.bot.players || {}).map(name => name.toLowerCase()));
+
             // Авторизация на анархии
             setTimeout(() => {
                 const loginCmd = this.config.anarchy ? `/login ${this.config.anarchy}` : '/login an210';
@@ -97,35 +172,144 @@ class SimpleFuntimeBot {
 
         this.bot.on('kicked', (reason) => {
             this.isConnected = false;
+            this.kickReason = reasonToText(reason);
         });
     }
 
+    mark(stage) {
+        this.marks[stage] = Date.now();
+    }
+
+    remainingMs(limitMs) {
+        if (!this.deadline) return limitMs;
+        return Math.max(0, Math.min(limitMs, this.deadline - Date.now()));
+    }
+
+    deadlineError(stage) {
+        const error = namedError('deadline_exceeded', `Deadline exceeded at stage ${stage}`);
+        error.stage = stage;
+        return error;
+    }
+
+    // Этап начинается только если до срока хватает времени на его ожидание
+    async stage(name, durationMs) {
+        if (this.deadline && Date.now() + durationMs > this.deadline) {
+            throw this.deadlineError(name);
+        }
+        await this.delay(durationMs);
+    }
+
+    isPlayerOnline(playerName) {
+        // Сервер без таб-листа (виден только сам бот) — проверить нельзя, не блокируем выдачу
+        if (this.onlinePlayers.size <= 1) {
+            return true;
+        }
+        return this.onlinePlayers.has(playerName.toLowerCase());
+    }
+
     async giveMoney(playerName, amount) {
         if (!this.isConnected) {
             throw new Error('Bot not connected');
         }
 
-        try {
-            // Ждем стабилизации подключения
-            await this.delay(3000);
-            
-            // Переходим на правильную анархию
-            const anarCmd = this.config.anarchy ? `/${this.config.anarchy}` : '/an210';
-            this.bot.chat(anarCmd);
-            await this.delay(3000);
+        // Ждем стабилизации подключения (логин отправляет обработчик spawn)
+        await this.stage('login', 3000);
+        this.mark('logged_in');
+        
+        // Переходим на правильную анархию
+        const anarCmd = this.config.anarchy ? `/${this.config.anarchy}` : '/an210';
+        this.bot.chat(anarCmd);
+        await this.stage('anarchy', 3000);
 
-            // Перевод денег (двукратный ввод для FunTime)
+        await this.sendPay(playerName, amount);
+        return true;
+    }
+
+    async sendPay(playerName, amount) {
+        if (!this.isConnected) {
+            throw new Error('Bot not connected');
+        }
+
+        // Игрок не в сети — /pay заведомо не пройдёт
+        if (this.config.checkOnline && !this.isPlayerOnline(playerName)) {
+            const offlineError = new Error(`Player ${playerName} is not online`);
+            offlineError.name = 'player_offline';
+            throw offlineError;
+        }
+
+        // Слушаем ответы сервера, чтобы распознать отказ в переводе
+        let failure = null;
+        const onMessage = (text, position) => {
+            // Сообщения игроков в чате не считаем ответом сервера
+            if (failure || position === 'chat') return;
+            const matched = FAILURE_PATTERNS.find(pattern => pattern.re.test(text));
+            if (matched) failure = namedError(matched.name, text);
+        };
+        this.bot.on('messagestr', onMessage);
+
+        try {
+            // Перевод денег (двукратный ввод для FunTime): второй ввод подтверждает перевод,
+            // поэтому бюджет проверяется до первого ввода — после подтверждения не прерываемся
             const command = `/pay ${playerName} ${amount}`;
+            if (this.deadline && Date.now() + 5000 > this.deadline) {
+                throw this.deadlineError('pay');
+            }
             
+            this.mark('pay_sent');
             this.bot.chat(command);
             await this.delay(2000);
             this.bot.chat(command);
             await this.delay(3000);
-            
-            return true;
-            
-        } catch (error) {
-            throw error;
+        } finally {
+            this.bot.removeListener('messagestr', onMessage);
+        }
+
+        if (!this.isConnected && this.kickReason) {
+            throw namedError(BAN_PATTERN.test(this.kickReason) ? 'banned' : 'kicked', this.kickReason);
+        }
+        if (failure) {
+            throw failure;
+        }
+        this.mark('pay_confirmed');
+    }
+
+    // Баланс бота: сначала скорборд (без лишних команд), затем ответ на /balance
+    async readBalance(timeoutMs = 3000) {
+        const sidebar = this.bot.scoreboard && this.bot.scoreboard.sidebar;
+        if (sidebar && sidebar.items) {
+            for (const item of sidebar.items) {
+                const text = item.displayName ? item.displayName.toString() : item.name;
+                const value = parseBalance(text);
+                if (value !== null) return value;
+            }
+        }
+        if (timeoutMs <= 0) return null;
+
+        return new Promise((resolve) => {
+            const onMessage = (text, position) => {
+                if (position === 'chat') return;
+                const value = parseBalance(text, BALANCE_REPLY_PATTERN);
+                if (value !== null) {
+                    clearTimeout(timer);
+                    this.bot.removeListener('messagestr', onMessage);
+                    resolve(value);
+                }
+            };
+            const timer = setTimeout(() => {
+                this.bot.removeListener('messagestr', onMessage);
+                resolve(null);
+            }, timeoutMs);
+            this.bot.on('messagestr', onMessage);
+            this.bot.chat('/balance');
+        });
+    }
+
+    // Баланс после перевода — не ошибка, если не прочитался; срок задания не превышаем
+    async balanceAfterPay() {
+        try {
+            return await this.readBalance(this.remainingMs(3000));
+        } catch (e) {
+            return null;
         }
     }
 
@@ -142,29 +326,46 @@ class SimpleFuntimeBot {
     }
 }
 
+// Идентификатор попытки выдачи от плагина (--cid=...): попадает в каждую JSON-строку вывода
+let correlationId = null;
+
+function printJson(payload) {
+    console.log(JSON.stringify(correlationId ? Object.assign({ cid: correlationId }, payload) : payload));
+}
+
 // Простая функция для выдачи денег
-async function payPlayer(playerName, amount) {
-    const bot = new SimpleFuntimeBot();
+async function payPlayer(playerName, amount, deadline, account) {
+    const bot = new SimpleFuntimeBot(account);
+    bot.deadline = deadline || null;
     
     try {
         await bot.connect();
         await bot.giveMoney(playerName, amount);
+        const balance = await bot.balanceAfterPay();
         
-        console.log(JSON.stringify({
+        printJson({
             success: true,
             player: playerName,
             amount: amount,
+            account: bot.config.username,
+            balance: balance,
+            timeline: bot.marks,
             message: `Successfully transferred ${amount.toLocaleString()} coins to ${playerName}`
-        }));
+        });
         
         return true;
         
     } catch (error) {
-        console.log(JSON.stringify({
+        const balance = error.name === 'insufficient_funds' ? await bot.balanceAfterPay() : null;
+        printJson({
             success: false,
             error: error.name || 'unknown_error',
+            stage: error.stage,
+            account: bot.config.username,
+            balance: balance,
+            timeline: bot.marks,
             message: error.message
-        }));
+        });
         
         return false;
         
@@ -180,21 +381,21 @@ async function testConnection() {
     try {
         await bot.connect();
         
-        console.log(JSON.stringify({
+        printJson({
             success: true,
             isConnected: bot.isConnected,
             message: 'Bot connection test successful'
-        }));
+        });
         
         return true;
         
     } catch (error) {
-        console.log(JSON.stringify({
+        printJson({
             success: false,
             isConnected: false,
             error: error.name || 'connection_error',
             message: error.message
-        }));
+        });
         
         return false;
         
@@ -203,22 +404,173 @@ async function testConnection() {
     }
 }
 
+// Проверка баланса аккаунта
+async function checkBalance(account) {
+    const bot = new SimpleFuntimeBot(account);
+
+    try {
+        await bot.connect();
+        // Логин и переход на анархию выполняет обработчик spawn
+        await bot.delay(5000);
+        const balance = await bot.readBalance(5000);
+
+        printJson({
+            success: balance !== null,
+            account: bot.config.username,
+            balance: balance,
+            error: balance === null ? 'balance_unknown' : undefined,
+            message: balance === null ? 'Balance not found in scoreboard or /balance reply' : `Balance: ${balance}`
+        });
+
+        return balance !== null;
+
+    } catch (error) {
+        printJson({
+            success: false,
+            account: bot.config.username,
+            error: error.name || 'connection_error',
+            message: error.message
+        });
+
+        return false;
+
+    } finally {
+        await bot.disconnect();
+    }
+}
+
+// Постоянная сессия: команды — JSON-строки в stdin, события — JSON-строки в stdout.
+// {"cmd":"watch","player":"X"} / {"cmd":"unwatch","player":"X"} — ждать появления игрока в таб-листе
+// {"cmd":"pay","id":"...","cid":"...","player":"X","amount":N} — перевод без переподключения
+// {"cmd":"balance","id":"..."} — прочитать баланс бота
+// {"cmd":"quit"} — отключиться
+async function runDaemon() {
+    const bot = new SimpleFuntimeBot();
+    const watched = new Set();
+    const emit = (payload) => console.log(JSON.stringify(payload));
+    let commandChain = Promise.resolve();
+
+    try {
+        await bot.connect();
+        // Логин и переход на анархию выполняет обработчик spawn
+        await bot.delay(5000);
+    } catch (error) {
+        emit({ event: 'end', error: error.name || 'connection_error', reason: error.message });
+        process.exit(1);
+    }
+
+    bot.bot.on('playerJoined', (player) => {
+        const name = player && player.username ? player.username.toLowerCase() : null;
+        if (name && watched.has(name)) {
+            emit({ event: 'player_online', player: player.username });
+        }
+    });
+
+    bot.bot.on('kicked', (reason) => {
+        emit({ event: 'end', error: 'kicked', reason: typeof reason === 'string' ? reason : JSON.stringify(reason) });
+    });
+
+    bot.bot.on('end', () => {
+        emit({ event: 'end', error: 'disconnected', reason: 'connection closed' });
+        process.exit(1);
+    });
+
+    const handleCommand = async (cmd) => {
+        if (cmd.cmd === 'watch' && cmd.player) {
+            const name = cmd.player.toLowerCase();
+            watched.add(name);
+            if (bot.onlinePlayers.has(name)) {
+                emit({ event: 'player_online', player: cmd.player });
+            }
+        } else if (cmd.cmd === 'unwatch' && cmd.player) {
+            watched.delete(cmd.player.toLowerCase());
+        } else if (cmd.cmd === 'pay') {
+            bot.deadline = cmd.deadline || null;
+            bot.marks = {};
+            try {
+                await bot.sendPay(cmd.player, cmd.amount);
+                emit({
+                    event: 'pay_result',
+                    id: cmd.id,
+                    cid: cmd.cid,
+                    success: true,
+                    player: cmd.player,
+                    amount: cmd.amount,
+                    balance: await bot.balanceAfterPay(),
+                    timeline: bot.marks,
+                    message: `Successfully transferred ${Number(cmd.amount).toLocaleString()} coins to ${cmd.player}`
+                });
+            } catch (error) {
+                const balance = error.name === 'insufficient_funds' ? await bot.balanceAfterPay() : null;
+                emit({ event: 'pay_result', id: cmd.id, cid: cmd.cid, success: false, error: error.name || 'unknown_error', stage: error.stage, balance: balance, timeline: bot.marks, message: error.message });
+            } finally {
+                bot.deadline = null;
+            }
+        } else if (cmd.cmd === 'balance') {
+            emit({ event: 'balance_result', id: cmd.id, balance: await bot.readBalance(5000) });
+        } else if (cmd.cmd === 'quit') {
+            await bot.disconnect();
+            process.exit(0);
+        }
+    };
+
+    const rl = require('readline').createInterface({ input: process.stdin });
+    rl.on('line', (line) => {
+        let cmd;
+        try {
+            cmd = JSON.parse(line);
+        } catch (e) {
+            return;
+        }
+        // Команды выполняются строго по очереди, чтобы /pay не перемешивались
+        commandChain = commandChain.then(() => handleCommand(cmd));
+    });
+    rl.on('close', () => {
+        commandChain.then(() => bot.disconnect()).then(() => process.exit(0));
+    });
+
+    emit({ event: 'ready', online: bot.onlinePlayers.size });
+}
+
 // Экспорт функций
-module.exports = { SimpleFuntimeBot, payPlayer, testConnection };
+module.exports = { SimpleFuntimeBot, payPlayer, testConnection, checkBalance, runDaemon };
 
 // Если запущен напрямую
 if (require.main === module) {
-    const args = process.argv.slice(2);
+    // --deadline=<мс с эпохи> — общий срок задания; --account=<ник> — дополнительный аккаунт;
+    // --cid=<id> — идентификатор попытки выдачи; остальные аргументы позиционные
+    const rawArgs = process.argv.slice(2);
+    const deadlineArg = rawArgs.find(arg => arg.startsWith('--deadline='));
+    const deadline = deadlineArg ? parseInt(deadlineArg.split('=')[1]) || null : null;
+    const accountArg = rawArgs.find(arg => arg.startsWith('--account='));
+    const account = accountArg ? accountArg.split('=')[1] : null;
+    const cidArg = rawArgs.find(arg => arg.startsWith('--cid='));
+    correlationId = cidArg ? cidArg.split('=')[1] : null;
+    const args = rawArgs.filter(arg => !arg.startsWith('--deadline=') && !arg.startsWith('--account=') && !arg.startsWith('--cid='));
     
     if (args.length === 0) {
-        console.log(JSON.stringify({
+        printJson({
             success: false,
             error: 'no_command',
-            message: 'Usage: node simple_bot.js <player> <amount> or node simple_bot.js test'
-        }));
+            message: 'Usage: node simple_bot.js <player> <amount>, node simple_bot.js test, node simple_bot.js balance or node simple_bot.js daemon'
+        });
         process.exit(1);
     }
     
+    // Проверка баланса
+    if (args[0].toLowerCase() === 'balance') {
+        checkBalance(account).then(success => {
+            process.exit(success ? 0 : 1);
+        });
+        return;
+    }
+    
+    // Постоянная сессия
+    if (args[0].toLowerCase() === 'daemon') {
+        runDaemon();
+        return;
+    }
+
     // Команда тестирования
     if (args[0].toLowerCase() === 'test') {
         // Optional overrides: anarchy, retryIntervalSec, maxAttempts
@@ -242,11 +594,11 @@ if (require.main === module) {
     
     // Команда выдачи денег
     if (args.length < 2) {
-        console.log(JSON.stringify({
+        printJson({
             success: false,
             error: 'invalid_args',
             message: 'Usage: node simple_bot.js <player> <amount>'
-        }));
+        });
         process.exit(1);
     }
     
@@ -254,11 +606,11 @@ if (require.main === module) {
     const amount = parseInt(args[1]);
     
     if (isNaN(amount) || amount <= 0) {
-        console.log(JSON.stringify({
+        printJson({
             success: false,
             error: 'invalid_amount',
             message: 'Invalid amount'
-        }));
+        });
         process.exit(1);
     }
     
@@ -304,9 +656,9 @@ if (require.main === module) {
 
     // Log applied config (password unmasked by user request)
     const applied = Object.assign({}, SimpleFuntimeBot.prototype.config);
-    console.error(JSON.stringify({ info: 'applied_config', config: applied }));
+    console.error(JSON.stringify({ info: 'applied_config', cid: correlationId, config: applied }));
 
-    payPlayer(playerName, amount).then(success => {
+    payPlayer(playerName, amount, deadline, account).then(success => {
         process.exit(success ? 0 : 1);
     });
 }
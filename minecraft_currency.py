@@ -6,13 +6,29 @@ if TYPE_CHECKING:
 import os
 import json
 import logging
+import logging.handlers
+import queue
+import gzip
+import shutil
+import atexit
 import traceback
 import threading
 import subprocess
 import time
+import uuid
+import heapq
+import bisect
+import itertools
+import csv
+import io
+import sys
+import tracemalloc
+from collections import Counter
 from datetime import datetime, timedelta
 import html
 import re
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from FunPayAPI.updater.events import NewMessageEvent, NewOrderEvent
 from FunPayAPI import enums
@@ -33,13 +49,73 @@ IS_STARTED = False
 
 # Хранение данных о заказах
 orders_info = {}  # Информация о заказах для сопоставления
+orders_info_dirty_since = None  # Время первого ещё не сохранённого изменения orders_info (этапы, попытки выдачи)
 pending_orders = {}  # Ожидающие выдачи валюты
+buyers_index = {}  # История подтверждённых никнеймов: buyer_id → {никнейм: {count, last_used}}
+bot_balances = {}  # Последний известный баланс аккаунтов бота: ник → {balance, updated_at}
+funds_alert_active = False  # Администратор уже предупреждён о нехватке средств под очередь
+stock_state = {}  # Последнее выставленное на лоты количество: lot_id → {amount, active, deactivated_by_sync}
+stock_sync_wakeup = threading.Event()
+stock_sync_running = False
 
 # Telegram бот и конфигурация
 bot = None
 config = {}
 cardinal_instance = None
 
+# Очередь автоматической выдачи (обрабатывается одним потоком): куча (закреплён?, ключ, №, order_id).
+# Актуальная запись заказа — в queued_entries, остальные его записи в куче устарели и пропускаются
+delivery_queue = []
+queued_entries = {}
+queue_seq = itertools.count()
+delivery_queue_lock = threading.Lock()
+delivery_wakeup = threading.Event()
+delivery_worker_running = False
+delivery_lock = threading.Lock()  # Сессии бота с одного аккаунта не должны пересекаться
+service_time = {'ewma_sec': None, 'samples': 0}  # Скользящая оценка длительности одного задания выдачи
+load_shedding = {'active': False, 'since': None, 'reason': None, 'lots': {}}  # lots: lot_id → был ли лот активен
+load_shedding_lock = threading.Lock()
+stage_stats = {}  # Гистограммы длительности этапов заказа: день → {этап: [счётчики по корзинам]}
+stage_stats_lock = threading.Lock()
+sales_stats = {'hourly': [], 'daily': []}  # Кольцевые массивы корзин продаж: [номер часа/дня, счётчики SALES_FIELDS...]
+sales_stats_lock = threading.Lock()
+
+# Счётчики для /metrics (с момента запуска плагина)
+metrics = {
+    'deliveries': {},        # исход выдачи → число заказов
+    'node_runs': {},         # режим запуска Node-скрипта → [запусков, суммарная длительность]
+    'get_order_cache': {'hit': 0, 'miss': 0},
+    'writes': {},            # файл → [записей, суммарное время, байт]
+    'stage_latency': {},     # этап → [счётчики по корзинам, сумма секунд]
+    'last_attempt': None     # последняя попытка выдачи: cid, заказы, исход
+}
+metrics_lock = threading.Lock()
+metrics_server = None
+order_cache = {}  # order_id → (истекает, заказ FunPay): повторные get_order в пределах ORDER_CACHE_TTL
+profile_lock = threading.Lock()  # Одновременно идёт не больше одного /mc_profile
+workers = {}  # ident потока → {name, stage, orders, since}: чем сейчас занят каждый поток плагина
+workers_lock = threading.Lock()
+node_processes = {}  # pid → (режим, время запуска, процесс): работающие Node-процессы бота
+archive_lock = threading.Lock()
+# Индексы /mc_find по активным и архивным заказам: отсортированные номера (поиск по префиксу через bisect),
+# точные ключи nick:/buyer:/id: → номера заказов, order_id → (ключи заказа, сводка для выдачи результатов)
+search_index = {'order_ids': [], 'exact': {}, 'orders': {}}
+search_lock = threading.Lock()
+
+# Состояние здоровья бота (circuit breaker): closed — выдаём, open — копим очередь, half_open — пробная выдача
+bot_health = {
+    'state': 'closed',
+    'failures': 0,
+    'last_cause': None,
+    'last_error': None,
+    'changed_at': None
+}
+bot_health_lock = threading.Lock()
+
+# Постоянная сессия Minecraft бота (поднимается, пока есть отложенные заказы)
+bot_session = None
+parked_monitor_running = False
+
 # Состояния для редактирования настроек
 user_states = {}  # Хранит текущее состояние пользователя при редактировании
 
@@ -51,6 +127,75 @@ LOG_PATH = os.path.join(LOG_DIR, "minecraft_currency.log")
 CONFIG_PATH = os.path.join("storage", "cache", "minecraft_currency_config.json")
 ORDERS_PATH = os.path.join("storage", "cache", "minecraft_currency_orders.json")
 PENDING_ORDERS_PATH = os.path.join("storage", "cache", "pending_minecraft_orders.json")
+BUYERS_PATH = os.path.join("storage", "cache", "minecraft_currency_buyers.json")
+BALANCES_PATH = os.path.join("storage", "cache", "minecraft_currency_balances.json")
+STOCK_PATH = os.path.join("storage", "cache", "minecraft_currency_stock.json")
+LOAD_SHEDDING_PATH = os.path.join("storage", "cache", "minecraft_currency_load_shedding.json")
+STATS_PATH = os.path.join("storage", "cache", "minecraft_currency_stats.json")
+SALES_PATH = os.path.join("storage", "cache", "minecraft_currency_sales.json")
+# Архив завершённых и отменённых заказов: orders_YYYY-MM.ndjson, прошлые месяцы сжаты в .ndjson.gz
+ARCHIVE_DIR = os.path.join("storage", "cache", "minecraft_currency_archive")
+EXPORT_DIR = os.path.join("storage", "cache", "minecraft_currency_exports")
+
+# Сколько последних никнеймов хранить для одного покупателя
+BUYER_HISTORY_LIMIT = 5
+
+# Этапы заказа в порядке прохождения; длительность этапа — время от предыдущего отмеченного этапа
+ORDER_STAGES = ('paid', 'intake_done', 'after_payment_sent', 'nickname_received', 'confirmed', 'queued',
+                'bot_connected', 'logged_in', 'pay_sent', 'pay_confirmed', 'buyer_notified')
+# Этапы бота при повторной попытке перезаписываются — в таймлайне остаётся последняя попытка
+BOT_STAGES = ('bot_connected', 'logged_in', 'pay_sent', 'pay_confirmed')
+STAGE_NAMES = {
+    'paid': 'Оплата',
+    'intake_done': 'Приём заказа',
+    'after_payment_sent': 'Сообщение после оплаты',
+    'nickname_received': 'Ожидание никнейма',
+    'confirmed': 'Подтверждение никнейма',
+    'queued': 'Постановка в очередь',
+    'bot_connected': 'Очередь и подключение бота',
+    'logged_in': 'Вход на анархию',
+    'pay_sent': 'Подготовка к переводу',
+    'pay_confirmed': 'Перевод',
+    'buyer_notified': 'Уведомление покупателя',
+    'total': 'Всего (оплата → уведомление)'
+}
+# Верхние границы корзин гистограмм, сек (логарифмическая шкала); последняя корзина — переполнение
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+STATS_RETENTION_DAYS = 8
+# Счётчики корзины продаж (после номера корзины); fail_* — неуспешные попытки выдачи по причинам
+SALES_FIELDS = ('orders', 'coins', 'rubles', 'delivery_sec', 'delivered', 'cancelled',
+                'fail_connect_timeout', 'fail_kick', 'fail_ban', 'fail_insufficient_funds', 'fail_bad_player', 'fail_other')
+SALES_HOURLY_SIZE = 48  # Часовые корзины за двое суток
+SALES_DAILY_SIZE = 62   # Дневные корзины за два месяца
+# /mc_find: заказов на странице и предел совпадений по префиксу номера
+FIND_PAGE_SIZE = 5
+FIND_MAX_PREFIX_MATCHES = 200
+# Статусы заказов, которыми распоряжается очередь выдачи: ручная выдача их пропускает
+WORKER_STATUSES = ('queued', 'parked', 'delivering')
+ORDER_STATUS_NAMES = {
+    'waiting_username': '⏳ ждёт ник',
+    'awaiting_confirmation': '❓ ждёт подтверждения ника',
+    'ready_for_admin': '👤 ждёт администратора',
+    'queued': '📦 в очереди выдачи',
+    'delivering': '🚚 выдаётся ботом',
+    'waiting_funds': '💸 ждёт пополнения бота',
+    'parked': '🕒 ждёт игрока',
+    'completed': '✅ выполнен',
+    'cancelled': '❌ отменён',
+    'unknown': '📁 в архиве'
+}
+# Сколько секунд ответ get_order считается свежим
+ORDER_CACHE_TTL = 60
+# Этапы и попытки выдачи копятся в памяти и сохраняются в orders_info не чаще раза за столько секунд
+ORDERS_INFO_FLUSH_SEC = 30
+# /mc_profile: период снятия стеков потоков и предельная длительность захвата
+PROFILE_INTERVAL_SEC = 0.005
+PROFILE_MAX_SEC = 600
+# Поток, стоящий в ожидании внутри этих модулей, простаивает — его стек не считаем
+PROFILE_IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py', 'socketserver.py')
+
+# Допустимый никнейм Minecraft: 3-16 символов, латиница, цифры и подчёркивание
+MINECRAFT_USERNAME_RE = re.compile(r"^[A-Za-z0-9_]{3,16}$")
 
 os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
 os.makedirs(os.path.dirname(ORDERS_PATH), exist_ok=True)
@@ -59,33 +204,147 @@ os.makedirs(os.path.dirname(PENDING_ORDERS_PATH), exist_ok=True)
 # Настройка логирования
 logger = logging.getLogger("FPC.minecraft_currency")
 logger.setLevel(logging.INFO)
+# Категории логов — уровень каждой задаётся в настройках (logging.categories)
+intake_logger = logger.getChild("intake")
+delivery_logger = logger.getChild("delivery")
+storage_logger = logger.getChild("storage")
+telegram_logger = logger.getChild("telegram")
+log_listener = None
+
+def read_logging_config() -> Dict:
+    """Настройки логирования читаются из файла напрямую: load_config сам пишет в лог"""
+    try:
+        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f).get('logging', {})
+    except Exception:
+        return {}
 
-if not logger.handlers:
-    file_handler = logging.FileHandler(LOG_PATH, encoding='utf-8')
-    file_handler.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+def parse_log_level(value, default=logging.NOTSET) -> int:
+    """Уровень логирования из строки настроек (неизвестное значение — уровень по умолчанию)"""
+    level = logging.getLevelName(str(value).upper()) if value else default
+    return level if isinstance(level, int) else default
+
+def gzip_rotator(source: str, dest: str):
+    """Ротация лога: старый файл сжимается"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def cardinal_log_handlers() -> list:
+    """Обработчики родительских логгеров (лог и консоль Cardinal), куда запись попала бы при propagate"""
+    handlers = []
+    parent = logger.parent
+    while parent:
+        handlers.extend(parent.handlers)
+        if not parent.propagate:
+            break
+        parent = parent.parent
+    return handlers
+
+def setup_logging():
+    """Уровни по категориям и запись в файл через очередь: потоки обработчиков не ждут диск"""
+    global log_listener
+    log_cfg = read_logging_config()
+    logger.setLevel(parse_log_level(log_cfg.get('level'), logging.INFO))
+    categories = log_cfg.get('categories', {})
+    for category_logger in (intake_logger, delivery_logger, storage_logger, telegram_logger):
+        level = categories.get(category_logger.name.rsplit('.', 1)[-1])
+        category_logger.setLevel(parse_log_level(level))
+    # Обработчики Cardinal вызываются из фонового потока очереди (ниже), а не синхронно из потока плагина
+    logger.propagate = False
+
+    if logger.handlers:
+        return
+    backup_count = log_cfg.get('backup_count', 5)
+    if log_cfg.get('rotation', 'size') == 'time':
+        file_handler = logging.handlers.TimedRotatingFileHandler(LOG_PATH, when=log_cfg.get('when', 'midnight'),
+                                                                 backupCount=backup_count, encoding='utf-8')
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=log_cfg.get('max_bytes', 5 * 1024 * 1024),
+                                                            backupCount=backup_count, encoding='utf-8')
+    file_handler.namer = lambda name: name + ".gz"
+    file_handler.rotator = gzip_rotator
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+
+    handlers = [file_handler]
+    if log_cfg.get('propagate_to_cardinal', True):
+        handlers += cardinal_log_handlers()
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Дописывает очередь логов в файл и останавливает фоновый поток"""
+    global log_listener
+    if log_listener:
+        log_listener.stop()
+        log_listener = None
+
+setup_logging()
 
 LOGGER_PREFIX = "[MINECRAFT CURRENCY]"
 
+def metrics_inc(group: str, key: str, value=1):
+    """Увеличивает счётчик метрик"""
+    with metrics_lock:
+        metrics[group][key] = metrics[group].get(key, 0) + value
+
+def set_worker_stage(stage: str, order_ids=None):
+    """Текущий этап работы потока и заказы, которыми он занят (для /mc_debug)"""
+    with workers_lock:
+        workers[threading.get_ident()] = {'name': threading.current_thread().name, 'stage': stage,
+                                          'orders': list(order_ids or []), 'since': time.time()}
+
+def clear_worker_stage():
+    """Поток закончил работу плагина"""
+    with workers_lock:
+        workers.pop(threading.get_ident(), None)
+
+def start_worker(name: str, target, *args) -> threading.Thread:
+    """Фоновый поток плагина с именем mc-<name>; пока он жив, он числится в реестре потоков"""
+    def run():
+        set_worker_stage('работает')
+        try:
+            target(*args)
+        finally:
+            clear_worker_stage()
+
+    thread = threading.Thread(target=run, name=f"mc-{name}", daemon=True)
+    thread.start()
+    return thread
+
+def write_json_file(path: str, data, indent=4):
+    """Запись JSON-файла с учётом времени и объёма записи в метриках"""
+    started = time.time()
+    content = json.dumps(data, ensure_ascii=False, indent=indent)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    with metrics_lock:
+        stats = metrics['writes'].setdefault(os.path.basename(path), [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += time.time() - started
+        stats[2] += len(content.encode('utf-8'))
+
 def load_config() -> Dict:
     """Загрузка конфигурации плагина"""
-    logger.info("Загрузка конфигурации...")
+    storage_logger.debug("Загрузка конфигурации...")
     
     try:
         if os.path.exists(CONFIG_PATH):
             with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
                 config = json.load(f)
-            logger.info("Конфигурация загружена.")
+            storage_logger.debug("Конфигурация загружена.")
             return config
         else:
-            logger.info("Файл конфигурации не найден, создание по умолчанию...")
+            storage_logger.info("Файл конфигурации не найден, создание по умолчанию...")
             config = create_default_config()
             save_config(config)
             return config
     except Exception as e:
-        logger.error(f"Ошибка загрузки конфигурации: {e}")
+        storage_logger.error(f"Ошибка загрузки конфигурации: {e}")
         return create_default_config()
 
 def create_default_config() -> Dict:
@@ -99,16 +358,93 @@ def create_default_config() -> Dict:
     "check_lot_ids": False,
     # Список доверенных отправителей уведомлений об оплате (по умолчанию FunPay имеет id 0)
     "trusted_payment_senders": [0],
+    # Circuit breaker: после N подряд сбоев инфраструктуры выдача приостанавливается до успешной проверки
+    "circuit_breaker": {
+        "failure_threshold": 3,
+        "probe_interval_sec": 60
+    },
+    # Перед выдачей сверять сумму с известным балансом бота и выбирать аккаунт, которому хватит средств
+    "check_balance_before_delivery": True,
+    # Количество на лотах по балансу бота: (баланс - незавершённые заказы) / coins_per_unit.
+    # lot_ids пуст — используются allowed_lot_ids; max_amount — верхняя граница количества (None — без неё)
+    "stock_sync": {
+        "enabled": True,
+        "lot_ids": [],
+        "interval_sec": 300,
+        "max_amount": None
+    },
+    # Порядок выдачи: время оплаты минус бонусы за сумму, цену и повторного покупателя.
+    # Бонус ограничен max_boost_sec — заказ не обгонят заказы, оплаченные позже чем через max_boost_sec
+    "scheduler": {
+        "amount_boost_sec_per_million": 5,
+        "price_boost_sec_per_100_rub": 0,
+        "repeat_buyer_boost_sec": 60,
+        "max_boost_sec": 600
+    },
+    # Ограничение приёма при большой очереди: включается выше порогов, выключается ниже low_water.
+    # actions: warn — уведомить администратора, delay_notice — предупреждать новых покупателей,
+    # deactivate_lots — выключить лоты (stock_sync.lot_ids / allowed_lot_ids) до разгрузки очереди
+    "load_shedding": {
+        "enabled": True,
+        "max_backlog_orders": 20,
+        "max_drain_minutes": 30,
+        "low_water_orders": 10,
+        "low_water_drain_minutes": 15,
+        "actions": ["warn", "delay_notice"],
+        "delay_notice": "⚠️ Сейчас много заказов: выдача займёт {eta}. Заказ будет выполнен автоматически, спасибо за терпение!"
+    },
+    # Метрики в формате Prometheus: http://host:port/metrics (только локальный адрес по умолчанию)
+    "metrics": {
+        "enabled": False,
+        "host": "127.0.0.1",
+        "port": 9787
+    },
+    # Оценка ожидания для {eta}: начальное время одного задания и вес нового замера в скользящем среднем
+    "eta": {
+        "default_service_sec": 40,
+        "ewma_alpha": 0.2
+    },
+    # Общий бюджет времени на одно задание выдачи (все этапы и резервный запуск), сек
+    "delivery_budget_sec": 120,
+    # Логирование (применяется при перезапуске): уровни INFO/DEBUG/WARNING по категориям,
+    # ротация по размеру ("size") или по времени ("time"), старые файлы сжимаются в .gz
+    "logging": {
+        "level": "INFO",
+        "categories": {
+            "intake": "INFO",
+            "delivery": "INFO",
+            "storage": "INFO",
+            "telegram": "INFO"
+        },
+        "rotation": "size",
+        "max_bytes": 5242880,
+        "when": "midnight",
+        "backup_count": 5,
+        "propagate_to_cardinal": True
+    },
+    # Выгрузка истории заказов (/mc_export): части .gz не больше max_part_mb (лимит документа Telegram — 50 МБ)
+    "export": {
+        "max_part_mb": 45
+    },
+    # Несколько заказов одного игрока в очереди выдавать одним переводом
+    "coalesce_deliveries": True,
+    # Повторные покупатели: предлагать никнейм из прошлых заказов / подтверждать его автоматически
+    "suggest_last_nickname": True,
+    "auto_confirm_returning_buyers": False,
+    # Игрок не в сети — откладывать заказ до его входа на сервер (не дольше таймаута)
+    "park_offline_orders": True,
+    "parked_order_timeout_minutes": 120,
         "messages": {
             "after_payment": "💰 Спасибо за покупку!\n\n"
                            "✅Ваш заказ принят и будет конвертирован в валюту Minecraft.\n"
                            "➗Укажите ваш никнейм в Minecraft для выдачи валюты.\n\n"
-                           "Пример: Steve",
+                           "Пример: Steve\n\n"
+                           "⏱ Выдача после указания никнейма займёт {eta}.",
             "processing": "⏳ Ваш заказ #{order_id} принят в обработку!\n"
                          "Сумма: {amount:,} монет\n"
                          "Никнейм: {username}\n\n"
-                         "🤖 Бот сейчас подключится к серверу и переведет вам валюту автоматически!\n"
-                         "Ожидайте 1-2 минуты...",
+                         "🤖 Бот подключится к серверу и переведет вам валюту автоматически!\n"
+                         "Место в очереди: {position}. Ожидайте {eta}...",
             "completed": "✅ Валюта успешно переведена!\n"
                         "Заказ #{order_id} выполнен.\n"
                         "Переведено {amount:,} монет игроку {username}\n\n"
@@ -123,16 +459,19 @@ def create_default_config() -> Dict:
             "server": "funtime.su",
             "password": "password",
             "anarchy": "an210",
-            "test_username": "Test_user"
+            "test_username": "Test_user",
+            # Перед /pay проверять по таб-листу, что игрок онлайн
+            "check_online": True,
+            # Дополнительные аккаунты бота на том же сервере: [{"username": "...", "password": "..."}]
+            "extra_accounts": []
         }
     }
 
 def save_config(cfg: Dict):
     """Сохранение конфигурации"""
-    logger.info("Сохранение конфигурации...")
-    with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-        json.dump(cfg, f, ensure_ascii=False, indent=4)
-    logger.info("Конфигурация сохранена.")
+    storage_logger.debug("Сохранение конфигурации...")
+    write_json_file(CONFIG_PATH, cfg)
+    storage_logger.debug("Конфигурация сохранена.")
 
 def load_orders_info() -> Dict:
     """Загрузка информации о заказах"""
@@ -149,25 +488,26 @@ def load_orders_info() -> Dict:
                         else:
                             return json.loads(file_content)
                 except (json.JSONDecodeError, Exception) as e:
-                    logger.error(f"Ошибка при чтении файла {ORDERS_PATH}: {e}")
+                    storage_logger.error(f"Ошибка при чтении файла {ORDERS_PATH}: {e}")
                     return {}
             else:
                 return {}
     except Exception as e:
-        logger.error(f"Ошибка при доступе к файлу {ORDERS_PATH}: {e}")
+        storage_logger.error(f"Ошибка при доступе к файлу {ORDERS_PATH}: {e}")
         return {}
 
 def save_orders_info(orders: Dict):
     """Сохранение информации о заказах"""
+    global orders_info_dirty_since
     file_lock = threading.Lock()
     
     try:
         with file_lock:
-            with open(ORDERS_PATH, 'w', encoding='utf-8') as f:
-                json.dump(orders, f, ensure_ascii=False, indent=4)
-            logger.info("Информация о заказах сохранена.")
+            write_json_file(ORDERS_PATH, orders)
+            orders_info_dirty_since = None
+            storage_logger.debug("Информация о заказах сохранена.")
     except Exception as e:
-        logger.error(f"Ошибка сохранения информации о заказах: {e}")
+        storage_logger.error(f"Ошибка сохранения информации о заказах: {e}")
 
 def load_pending_orders() -> Dict:
     """Загрузка ожидающих заказов"""
@@ -179,10 +519,768 @@ def load_pending_orders() -> Dict:
     except json.JSONDecodeError:
         return {}
 
-def save_pending_orders(orders: Dict):
-    """Сохранение ожидающих заказов"""
-    with open(PENDING_ORDERS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+def save_pending_orders(orders: Dict, *order_ids):
+    """Сохранение ожидающих заказов; order_ids — изменённые заказы, в индексе поиска обновляются только они"""
+    write_json_file(PENDING_ORDERS_PATH, orders)
+    if order_ids:
+        index_active_orders(orders, order_ids)
+
+def archive_partition_path(month: str, compressed=False) -> str:
+    return os.path.join(ARCHIVE_DIR, f"orders_{month}.ndjson" + (".gz" if compressed else ""))
+
+def archive_partitions() -> List[Tuple[str, str]]:
+    """Партиции архива по возрастанию месяца: (месяц, путь)"""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    partitions = []
+    for name in os.listdir(ARCHIVE_DIR):
+        match = re.fullmatch(r"orders_(\d{4}-\d{2})\.ndjson(\.gz)?", name)
+        if match:
+            partitions.append((match.group(1), os.path.join(ARCHIVE_DIR, name)))
+    return sorted(partitions)
+
+def compress_archive_partitions():
+    """Сжимает партиции прошлых месяцев: в них больше ничего не дописывается"""
+    current_month = datetime.now().strftime("%Y-%m")
+    for month, path in archive_partitions():
+        if month >= current_month or path.endswith(".gz"):
+            continue
+        compressed_path = archive_partition_path(month, compressed=True)
+        with open(path, 'rb') as f_in, gzip.open(compressed_path + ".tmp", 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.replace(compressed_path + ".tmp", compressed_path)
+        os.remove(path)
+        storage_logger.info(f"{LOGGER_PREFIX} Архив заказов за {month} сжат")
+
+def archive_order(order_id, order_data=None, save_info=True):
+    """Переносит завершённый или отменённый заказ в архив и убирает его из orders_info"""
+    record = dict(order_data or {'order_id': order_id, 'status': 'unknown'})
+    info = orders_info.pop(order_id, None) or {}
+    for key in ('buyer_id', 'chat_id', 'buyer_username', 'timeline', 'attempts'):
+        if key in info:
+            record[key] = info[key]
+    record['archived_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    started = time.time()
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    path = archive_partition_path(record['archived_at'][:7])
+    try:
+        with archive_lock:
+            os.makedirs(ARCHIVE_DIR, exist_ok=True)
+            # Первая запись месяца — прошлый месяц закрыт, его можно сжать
+            if not os.path.exists(path):
+                compress_archive_partitions()
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except Exception as e:
+        storage_logger.error(f"{LOGGER_PREFIX} Ошибка записи заказа #{order_id} в архив: {e}")
+        # Запись о покупателе остаётся в orders_info, чтобы не потерять её
+        if info:
+            orders_info[order_id] = info
+        return
+    with metrics_lock:
+        stats = metrics['writes'].setdefault(os.path.basename(path), [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += time.time() - started
+        stats[2] += len(line.encode('utf-8'))
+    index_order(order_id, record)
+    if save_info:
+        save_orders_info(orders_info)
+
+def iter_archive(since_month=None, until_month=None):
+    """Записи архива по порядку архивации, партиция за партицией (файл целиком в память не читается)"""
+    for month, path in archive_partitions():
+        if (since_month and month < since_month) or (until_month and month > until_month):
+            continue
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+        except OSError as e:
+            storage_logger.error(f"{LOGGER_PREFIX} Ошибка чтения архива {path}: {e}")
+
+def find_archived_order(order_id):
+    """Последняя архивная запись заказа (или None): индекс поиска знает время архивации, читается одна партиция"""
+    with search_lock:
+        entry = search_index['orders'].get(order_id)
+    archived_at = entry[1][5] if entry else ''
+    if not archived_at:
+        return None
+    month = archived_at[:7]
+    for record in iter_archive(since_month=month, until_month=month):
+        if record.get('order_id') == order_id and record.get('archived_at') == archived_at:
+            return record
+    return None
+
+def trim_orders_info():
+    """orders_info хранит только активные заказы: остальное уходит в архив (перенос старых данных при запуске)"""
+    finished = [order_id for order_id in orders_info if order_id not in pending_orders]
+    for order_id in finished:
+        archive_order(order_id, save_info=False)
+    if finished:
+        save_orders_info(orders_info)
+        storage_logger.info(f"{LOGGER_PREFIX} В архив перенесено {len(finished)} завершённых заказов из orders_info")
+    with archive_lock:
+        compress_archive_partitions()
+
+def index_order(order_id, record: Dict):
+    """Добавляет или обновляет заказ в индексах поиска; неизменившийся заказ не трогает"""
+    keys = set()
+    if record.get('minecraft_username'):
+        keys.add('nick:' + record['minecraft_username'].lower())
+    if record.get('buyer_username'):
+        keys.add('buyer:' + str(record['buyer_username']).lower())
+    if record.get('buyer_id') is not None:
+        keys.add('id:' + str(record['buyer_id']))
+    summary = (record.get('status'), record.get('amount', 0), record.get('minecraft_username'),
+               record.get('buyer_username'), record.get('date') or record.get('archived_at') or '', record.get('archived_at') or '')
+
+    with search_lock:
+        old = search_index['orders'].get(order_id)
+        if old == (keys, summary):
+            return
+        if old is None:
+            bisect.insort(search_index['order_ids'], order_id)
+            old_keys = set()
+        else:
+            old_keys = old[0]
+        for key in old_keys - keys:
+            search_index['exact'][key].discard(order_id)
+            if not search_index['exact'][key]:
+                del search_index['exact'][key]
+        for key in keys - old_keys:
+            search_index['exact'].setdefault(key, set()).add(order_id)
+        search_index['orders'][order_id] = (keys, summary)
+
+def index_active_orders(orders: Dict, order_ids=None):
+    """Индексирует активные заказы (все или только order_ids) вместе с данными покупателя из orders_info"""
+    for order_id in (list(orders) if order_ids is None else order_ids):
+        order_data = orders.get(order_id)
+        if order_data is None:
+            continue
+        info = orders_info.get(order_id, {})
+        index_order(order_id, dict(order_data, buyer_id=info.get('buyer_id'), buyer_username=info.get('buyer_username')))
+
+def build_search_index():
+    """Построение индексов при запуске: архив читается потоково, дальше индексы обновляются на лету"""
+    started = time.time()
+    for record in iter_archive():
+        if record.get('order_id'):
+            index_order(record['order_id'], record)
+    index_active_orders(pending_orders)
+    storage_logger.info(f"{LOGGER_PREFIX} Индекс поиска: {len(search_index['orders'])} заказов за {time.time() - started:.2f} сек")
+
+def search_orders(query: str) -> List[str]:
+    """Номера заказов по префиксу номера или точному нику, логину покупателя FunPay, id покупателя — новые сначала"""
+    query = query.strip().lstrip('#')
+    if not query:
+        return []
+    found = set()
+    with search_lock:
+        order_ids = search_index['order_ids']
+        prefix = query.upper()
+        index = bisect.bisect_left(order_ids, prefix)
+        while index < len(order_ids) and order_ids[index].startswith(prefix) and len(found) < FIND_MAX_PREFIX_MATCHES:
+            found.add(order_ids[index])
+            index += 1
+        for key in ('nick:' + query.lower(), 'buyer:' + query.lower(), 'id:' + query):
+            found.update(search_index['exact'].get(key, ()))
+        dates = {order_id: search_index['orders'][order_id][1][4] for order_id in found}
+    return sorted(found, key=lambda order_id: (dates[order_id], order_id), reverse=True)
+
+# Колонки CSV-выгрузки истории заказов
+EXPORT_FIELDS = ('order_id', 'date', 'status', 'amount', 'price', 'lot_title', 'minecraft_username',
+                 'buyer_id', 'buyer_username', 'completed_date', 'completed_by', 'cancelled_date', 'cancelled_by',
+                 'attempts', 'delivery_sec')
+# Как часто (по объёму несжатых данных) проверять размер части выгрузки
+EXPORT_FLUSH_BYTES = 1024 * 1024
+
+def iter_order_history(since=None, until=None, statuses=None):
+    """Архивные, затем активные заказы с фильтром по дате оплаты (ГГГГ-ММ-ДД, включительно) и статусу"""
+    active = []
+    for order_id, order_data in list(pending_orders.items()):
+        record = dict(order_data)
+        info = orders_info.get(order_id, {})
+        for key in ('buyer_id', 'chat_id', 'buyer_username', 'timeline', 'attempts'):
+            if key in info:
+                record[key] = info[key]
+        active.append(record)
+
+    # Заказ архивируется не раньше месяца оплаты — более ранние партиции не читаем
+    for record in itertools.chain(iter_archive(since_month=since[:7] if since else None), active):
+        day = (record.get('date') or record.get('archived_at') or '')[:10]
+        if (since and day < since) or (until and day > until):
+            continue
+        if statuses and record.get('status') not in statuses:
+            continue
+        yield record
+
+def export_row(record: Dict) -> List:
+    """Строка CSV: число попыток выдачи и время от оплаты до уведомления покупателя вместо вложенных данных"""
+    timeline = record.get('timeline') or {}
+    row = dict(record)
+    row['attempts'] = len(record.get('attempts') or [])
+    row['delivery_sec'] = round(timeline['buyer_notified'] - timeline['paid'], 1) \
+        if 'paid' in timeline and 'buyer_notified' in timeline else ''
+    return ['' if row.get(field) is None else row[field] for field in EXPORT_FIELDS]
+
+def export_order_history(records, fmt: str, max_part_bytes: int):
+    """Потоковая запись заказов в сжатые части CSV/NDJSON. Отдаёт (путь, число заказов) каждой готовой части"""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    base = os.path.join(EXPORT_DIR, f"orders_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    part, raw, text, rows = 0, None, None, 0
+
+    try:
+        for record in records:
+            if raw is None:
+                part += 1
+                path = f"{base}_part{part}.{fmt}.gz"
+                raw = open(path, 'wb')
+                compressed = gzip.GzipFile(fileobj=raw, mode='wb')
+                text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+                if fmt == 'csv':
+                    writer = csv.writer(text)
+                    writer.writerow(EXPORT_FIELDS)
+                rows, unflushed = 0, 0
+            if fmt == 'csv':
+                row = export_row(record)
+                writer.writerow(row)
+                unflushed += sum(len(str(value)) for value in row)
+            else:
+                line = json.dumps(record, ensure_ascii=False) + "\n"
+                text.write(line)
+                unflushed += len(line)
+            rows += 1
+            # Сжатый размер известен только после сброса буферов gzip — сбрасываем раз в EXPORT_FLUSH_BYTES входных данных
+            if unflushed >= EXPORT_FLUSH_BYTES:
+                text.flush()
+                compressed.flush()
+                unflushed = 0
+                if raw.tell() >= max_part_bytes:
+                    text.close()
+                    raw.close()
+                    raw = None
+                    yield path, rows
+        if raw is not None:
+            text.close()
+            raw.close()
+            raw = None
+            yield path, rows
+    finally:
+        # Часть не дописана (ошибка записи или выгрузку прервали) — закрываем файлы и удаляем неполный архив
+        if raw is not None:
+            for handle in (text, raw):
+                try:
+                    handle.close()
+                except Exception:
+                    pass
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def load_buyers_index() -> Dict:
+    """Загрузка истории никнеймов покупателей"""
+    if not os.path.exists(BUYERS_PATH):
+        return {}
+    try:
+        with open(BUYERS_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+def save_buyers_index(index: Dict):
+    """Сохранение истории никнеймов покупателей"""
+    write_json_file(BUYERS_PATH, index)
+
+def record_buyer_nickname(buyer_id, nickname: str):
+    """Запоминает подтверждённый покупателем никнейм"""
+    if buyer_id is None or not nickname:
+        return
+
+    entry = buyers_index.setdefault(str(buyer_id), {"nicknames": {}})
+    nick_stats = entry["nicknames"].setdefault(nickname, {"count": 0, "last_used": None})
+    nick_stats["count"] += 1
+    nick_stats["last_used"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    entry["last_nickname"] = nickname
+
+    # Оставляем только последние BUYER_HISTORY_LIMIT никнеймов
+    if len(entry["nicknames"]) > BUYER_HISTORY_LIMIT:
+        recent = sorted(entry["nicknames"].items(), key=lambda kv: kv[1]["last_used"], reverse=True)
+        entry["nicknames"] = dict(recent[:BUYER_HISTORY_LIMIT])
+
+    try:
+        save_buyers_index(buyers_index)
+    except Exception as e:
+        intake_logger.error(f"{LOGGER_PREFIX} Ошибка сохранения истории никнеймов: {e}")
+
+def get_last_nickname(buyer_id) -> Tuple[str, int]:
+    """Последний подтверждённый никнейм покупателя и сколько раз он использовался"""
+    entry = buyers_index.get(str(buyer_id)) if buyer_id is not None else None
+    if not entry or not entry.get("last_nickname"):
+        return None, 0
+    nickname = entry["last_nickname"]
+    return nickname, entry["nicknames"].get(nickname, {}).get("count", 0)
+
+def load_bot_balances() -> Dict:
+    """Загрузка кэша балансов аккаунтов бота"""
+    if os.path.exists(BALANCES_PATH):
+        try:
+            with open(BALANCES_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, Exception) as e:
+            storage_logger.error(f"{LOGGER_PREFIX} Ошибка при чтении файла {BALANCES_PATH}: {e}")
+    return {}
+
+def save_bot_balances(balances: Dict):
+    """Сохранение кэша балансов аккаунтов бота"""
+    write_json_file(BALANCES_PATH, balances)
+
+def get_bot_accounts() -> List[str]:
+    """Ники аккаунтов бота: основной, затем дополнительные"""
+    mb = load_config().get('minecraft_bot', {})
+    accounts = [mb.get('bot_username', '')]
+    for account in mb.get('extra_accounts', []):
+        if account.get('username') and account['username'] not in accounts:
+            accounts.append(account['username'])
+    return accounts
+
+def record_bot_balance(account: str, balance: int):
+    """Запоминает баланс аккаунта бота с отметкой времени"""
+    bot_balances[account] = {'balance': int(balance), 'updated_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    save_bot_balances(bot_balances)
+    delivery_logger.info(f"{LOGGER_PREFIX} Баланс аккаунта {account}: {int(balance):,}")
+    stock_sync_wakeup.set()
+
+def get_cached_balance(account: str):
+    """Последний известный баланс аккаунта или None, если он ещё не читался"""
+    entry = bot_balances.get(account)
+    return entry['balance'] if entry else None
+
+def update_balance_after_delivery(account: str, amount: int, currency_result):
+    """Обновляет кэш по результату перевода: прочитанный ботом баланс или оценка по сумме"""
+    if currency_result.get('balance') is not None:
+        record_bot_balance(account, currency_result['balance'])
+        return
+    cached = get_cached_balance(account)
+    if currency_result['success'] and cached is not None:
+        record_bot_balance(account, max(cached - amount, 0))
+    elif currency_result.get('error') == 'insufficient_funds' and (cached is None or cached >= amount):
+        # Сервер отказал, а баланс не прочитался: известно лишь, что денег меньше суммы
+        record_bot_balance(account, amount - 1)
+
+def choose_delivery_account(amount: int):
+    """Аккаунт, которому хватит средств: сначала с известным достаточным балансом, затем с неизвестным"""
+    accounts = get_bot_accounts()
+    if not load_config().get('check_balance_before_delivery', True):
+        return accounts[0]
+    for account in accounts:
+        balance = get_cached_balance(account)
+        if balance is not None and balance >= amount:
+            return account
+    for account in accounts:
+        if get_cached_balance(account) is None:
+            return account
+    return None
+
+def check_funds_shortfall():
+    """Одно предупреждение администратору, когда суммарного баланса не хватает на очередь"""
+    global funds_alert_active
+    balances = [get_cached_balance(account) for account in get_bot_accounts()]
+    # Пока баланс хоть одного аккаунта неизвестен, нехватку не утверждаем
+    if any(balance is None for balance in balances):
+        return
+
+    total_balance = sum(balances)
+    queued_sum = sum(data.get('amount', 0) for data in list(pending_orders.values())
+                     if data.get('status') in ('queued', 'waiting_funds'))
+    if total_balance >= queued_sum:
+        funds_alert_active = False
+        return
+    if funds_alert_active:
+        return
+    funds_alert_active = True
+
+    delivery_logger.warning(f"{LOGGER_PREFIX} Баланс бота {total_balance:,} меньше суммы заказов в очереди {queued_sum:,}")
+    cfg = load_config()
+    if bot and cfg.get('notification_chat_id'):
+        try:
+            bot.send_message(cfg['notification_chat_id'],
+                             f"💸 НЕ ХВАТАЕТ СРЕДСТВ НА БОТЕ\n\n"
+                             f"Баланс аккаунтов: {total_balance:,} монет\n"
+                             f"Заказы в очереди: {queued_sum:,} монет\n\n"
+                             f"Пополните баланс бота и выполните /mc_balance — заказы продолжат выдаваться.")
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления о нехватке средств: {e}")
+
+def hold_for_funds(order_id):
+    """Ни одному аккаунту не хватает средств — заказ ждёт пополнения баланса"""
+    order_data = pending_orders.get(order_id)
+    if not order_data:
+        return
+    order_data['status'] = 'waiting_funds'
+    save_pending_orders(pending_orders, order_id)
+    delivery_logger.warning(f"{LOGGER_PREFIX} 💸 Заказ #{order_id} ждёт пополнения баланса бота ({order_data.get('amount', 0):,} монет)")
+
+def release_waiting_funds_orders():
+    """После обновления балансов возвращает в очередь заказы, на которые теперь хватает средств"""
+    for order_id, order_data in list(pending_orders.items()):
+        if order_data.get('status') == 'waiting_funds' and choose_delivery_account(order_data.get('amount', 0)):
+            delivery_logger.info(f"{LOGGER_PREFIX} ▶️ Заказ #{order_id} возвращён в очередь: средств достаточно")
+            start_delivery(order_id)
+
+def read_bot_balance(account: str):
+    """Читает баланс аккаунта через бота (постоянную сессию основного аккаунта или отдельный запуск)"""
+    primary = get_bot_accounts()[0]
+    if account == primary and bot_session and bot_session.is_alive():
+        return bot_session.balance()
+
+    bot_script_path = os.path.join(os.path.dirname(__file__), "minecraft_bot", "simple_bot.js")
+    command_args = ["node", bot_script_path, "balance"]
+    if account != primary:
+        command_args.append(f"--account={account}")
+    try:
+        result = run_node(command_args, 60, 'balance')
+    except subprocess.TimeoutExpired:
+        delivery_logger.warning(f"{LOGGER_PREFIX} Таймаут чтения баланса аккаунта {account}")
+        return None
+    except Exception as e:
+        delivery_logger.error(f"{LOGGER_PREFIX} Ошибка чтения баланса аккаунта {account}: {e}")
+        return None
+
+    result_data = parse_bot_output(result.stdout or "")
+    if not result_data or result_data.get('balance') is None:
+        delivery_logger.warning(f"{LOGGER_PREFIX} Не удалось прочитать баланс аккаунта {account}: {result_data}")
+        return None
+    return result_data['balance']
+
+def refresh_bot_balances() -> Dict:
+    """Перечитывает балансы всех аккаунтов бота и возобновляет заказы, ждущие средств"""
+    for account in get_bot_accounts():
+        # Сессии одного аккаунта не должны пересекаться с выдачей
+        with delivery_lock:
+            balance = read_bot_balance(account)
+        if balance is not None:
+            record_bot_balance(account, balance)
+    release_waiting_funds_orders()
+    check_funds_shortfall()
+    return {account: bot_balances.get(account) for account in get_bot_accounts()}
+
+def load_stock_state() -> Dict:
+    """Загрузка последнего выставленного на лоты количества"""
+    if os.path.exists(STOCK_PATH):
+        try:
+            with open(STOCK_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, Exception) as e:
+            storage_logger.error(f"{LOGGER_PREFIX} Ошибка при чтении файла {STOCK_PATH}: {e}")
+    return {}
+
+def save_stock_state(state: Dict):
+    """Сохранение выставленного на лоты количества"""
+    write_json_file(STOCK_PATH, state)
+
+def calculate_available_units():
+    """Сколько единиц товара бот ещё может выдать, или None, если баланс какого-то аккаунта неизвестен"""
+    cfg = load_config()
+    balances = [get_cached_balance(account) for account in get_bot_accounts()]
+    if any(balance is None for balance in balances):
+        return None
+
+    # Все незавершённые заказы уже обещаны покупателям
+    committed = sum(data.get('amount', 0) for data in list(pending_orders.values()))
+    units = max(sum(balances) - committed, 0) // cfg.get('coins_per_unit', 1000000)
+    max_amount = cfg.get('stock_sync', {}).get('max_amount')
+    if max_amount is not None:
+        units = min(units, max_amount)
+    return units
+
+def synced_lot_ids() -> List:
+    """Лоты, которыми управляет плагин (количество, выключение при перегрузке)"""
+    cfg = load_config()
+    return cfg.get('stock_sync', {}).get('lot_ids') or cfg.get('allowed_lot_ids', [])
+
+def sync_lot_stock(force=False) -> Dict:
+    """Выставляет на лоты доступное количество; запрос к FunPay — только если значение изменилось"""
+    lot_ids = synced_lot_ids()
+    units = calculate_available_units()
+    # Лоты выключены из-за перегрузки очереди — их вернёт снятие ограничения
+    if units is None or not lot_ids or not cardinal_instance or load_shedding['lots']:
+        return {}
+
+    changed = {}
+    for lot_id in lot_ids:
+        key = str(lot_id)
+        state = stock_state.get(key)
+        # Лот, выключенный администратором (а не синхронизацией), не включаем
+        may_activate = state is None or state['active'] or state.get('deactivated_by_sync', False)
+        active = units > 0 and may_activate
+        if not force and state and state['amount'] == units and state['active'] == active:
+            continue
+
+        try:
+            lot_fields = cardinal_instance.account.get_lot_fields(int(lot_id))
+            if state is None and not lot_fields.active:
+                may_activate = active = False
+            lot_fields.amount = units
+            lot_fields.active = active
+            cardinal_instance.account.save_lot(lot_fields)
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка обновления количества на лоте {lot_id}: {e}")
+            continue
+
+        stock_state[key] = {'amount': units, 'active': active, 'deactivated_by_sync': units == 0 and may_activate}
+        changed[key] = units
+        delivery_logger.info(f"{LOGGER_PREFIX} Лот {lot_id}: количество {units}, {'активен' if active else 'выключен'}")
+
+    if changed:
+        save_stock_state(stock_state)
+    return changed
+
+def stock_sync_loop():
+    """Периодическая синхронизация количества на лотах (и сразу после изменения баланса)"""
+    while True:
+        sync_cfg = load_config().get('stock_sync', {})
+        if sync_cfg.get('enabled', True):
+            set_worker_stage('синхронизация лотов')
+            try:
+                sync_lot_stock()
+            except Exception as e:
+                delivery_logger.error(f"{LOGGER_PREFIX} Ошибка синхронизации количества на лотах: {e}")
+        set_worker_stage('ожидание')
+        stock_sync_wakeup.wait(sync_cfg.get('interval_sec', 300))
+        stock_sync_wakeup.clear()
+
+def ensure_stock_sync():
+    """Запускает синхронизацию количества на лотах, если она ещё не запущена"""
+    global stock_sync_running
+    if stock_sync_running:
+        return
+    stock_sync_running = True
+    start_worker('stock-sync', stock_sync_loop)
+
+def load_stage_stats() -> Dict:
+    """Загрузка гистограмм длительности этапов"""
+    if os.path.exists(STATS_PATH):
+        try:
+            with open(STATS_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, Exception) as e:
+            storage_logger.error(f"{LOGGER_PREFIX} Ошибка при чтении файла {STATS_PATH}: {e}")
+    return {}
+
+def save_stage_stats():
+    """Сохранение гистограмм длительности этапов"""
+    with stage_stats_lock:
+        snapshot = {day: {stage: list(counts) for stage, counts in stages.items()} for day, stages in stage_stats.items()}
+    write_json_file(STATS_PATH, snapshot, indent=None)
+
+def touch_orders_info():
+    """Отмечает изменение orders_info; на диск изменения уходят пачкой, не чаще раза в ORDERS_INFO_FLUSH_SEC"""
+    global orders_info_dirty_since
+    if orders_info_dirty_since is None:
+        orders_info_dirty_since = time.time()
+    elif time.time() - orders_info_dirty_since >= ORDERS_INFO_FLUSH_SEC:
+        save_orders_info(orders_info)
+
+def flush_orders_info():
+    """Сохраняет накопленные изменения orders_info (заказ дошёл до администратора, отложен или плагин завершается)"""
+    if orders_info_dirty_since is not None:
+        save_orders_info(orders_info)
+
+def mark_order_stage(order_id, stage: str, ts=None):
+    """Отмечает этап в таймлайне заказа (время с эпохи — этапы Node-бота приходят из другого процесса)"""
+    info = orders_info.get(order_id)
+    if info is None:
+        return
+    timeline = info.setdefault('timeline', {})
+    if stage in timeline and stage not in BOT_STAGES:
+        return
+    timeline[stage] = ts if ts is not None else time.time()
+    touch_orders_info()
+
+def apply_bot_timeline(order_ids, bot_timeline):
+    """Переносит этапы из ответа Node-бота (мс с эпохи) в таймлайны заказов"""
+    for stage in BOT_STAGES:
+        if bot_timeline and bot_timeline.get(stage):
+            for order_id in order_ids:
+                mark_order_stage(order_id, stage, bot_timeline[stage] / 1000)
+
+def record_delivery_attempt(order_ids, cid: str, account, started: float, currency_result: Dict):
+    """Сохраняет попытку выдачи (cid, аккаунт, итог, этапы Node-бота) в заказах — для /mc_trace"""
+    attempt = {
+        'cid': cid,
+        'account': account,
+        'started': started,
+        'finished': time.time(),
+        'success': bool(currency_result.get('success')),
+        'error': currency_result.get('error'),
+        'stage': currency_result.get('stage'),
+        'timeline': currency_result.get('timeline') or {}
+    }
+    for order_id in order_ids:
+        if order_id in orders_info:
+            orders_info[order_id].setdefault('attempts', []).append(attempt)
+    touch_orders_info()
+
+def record_stage_latency(day: str, stage: str, seconds: float):
+    """Добавляет замер в гистограмму этапа за день"""
+    index = bisect.bisect_left(LATENCY_BUCKETS, max(seconds, 0))
+    with stage_stats_lock:
+        counts = stage_stats.setdefault(day, {}).setdefault(stage, [0] * (len(LATENCY_BUCKETS) + 1))
+        counts[index] += 1
+    with metrics_lock:
+        histogram = metrics['stage_latency'].setdefault(stage, [[0] * (len(LATENCY_BUCKETS) + 1), 0.0])
+        histogram[0][index] += 1
+        histogram[1] += max(seconds, 0)
+
+def finalize_order_timeline(order_id):
+    """Заказ выдан — длительности его этапов попадают в гистограммы"""
+    timeline = orders_info.get(order_id, {}).get('timeline', {})
+    day = datetime.now().strftime("%Y-%m-%d")
+    previous = None
+    for stage in ORDER_STAGES:
+        if stage not in timeline:
+            continue
+        if previous is not None:
+            record_stage_latency(day, stage, timeline[stage] - timeline[previous])
+        previous = stage
+    if 'paid' in timeline and 'buyer_notified' in timeline:
+        record_stage_latency(day, 'total', timeline['buyer_notified'] - timeline['paid'])
+
+    # Храним гистограммы только за последние дни
+    with stage_stats_lock:
+        for old_day in sorted(stage_stats)[:-STATS_RETENTION_DAYS]:
+            del stage_stats[old_day]
+    save_stage_stats()
+
+def merged_stage_counts(days: int) -> Dict[str, List[int]]:
+    """Суммарные гистограммы этапов за последние days дней"""
+    since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    merged = {}
+    with stage_stats_lock:
+        for day, stages in stage_stats.items():
+            if day < since:
+                continue
+            for stage, counts in stages.items():
+                total = merged.setdefault(stage, [0] * len(counts))
+                for i, count in enumerate(counts):
+                    total[i] += count
+    return merged
+
+def load_sales_stats() -> Dict:
+    """Загрузка корзин продаж; при смене набора счётчиков сохранённые корзины не используются"""
+    if os.path.exists(SALES_PATH):
+        try:
+            with open(SALES_PATH, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('fields') == list(SALES_FIELDS):
+                return {'hourly': data['hourly'], 'daily': data['daily']}
+        except (json.JSONDecodeError, Exception) as e:
+            storage_logger.error(f"{LOGGER_PREFIX} Ошибка при чтении файла {SALES_PATH}: {e}")
+    return {'hourly': [], 'daily': []}
+
+def save_sales_stats():
+    """Сохранение корзин продаж"""
+    with sales_stats_lock:
+        snapshot = {'fields': list(SALES_FIELDS), 'hourly': [list(b) for b in sales_stats['hourly']],
+                    'daily': [list(b) for b in sales_stats['daily']]}
+    write_json_file(SALES_PATH, snapshot, indent=None)
+
+def sales_slots(now=None) -> Tuple[int, int]:
+    """Номер текущего часа и дня (местное время)"""
+    now = now or datetime.now()
+    return now.toordinal() * 24 + now.hour, now.toordinal()
+
+def sales_bucket(ring: List, size: int, slot: int) -> List:
+    """Корзина слота в кольце; корзина, оставшаяся от прошлого круга, обнуляется. Вызывается под sales_stats_lock"""
+    if len(ring) != size:
+        ring[:] = [[-1] + [0] * len(SALES_FIELDS) for _ in range(size)]
+    bucket = ring[slot % size]
+    if bucket[0] != slot:
+        bucket[:] = [slot] + [0] * len(SALES_FIELDS)
+    return bucket
+
+def record_sales(**increments):
+    """Добавляет событие в часовую и дневную корзины за O(1) и сохраняет агрегаты"""
+    hour_slot, day_slot = sales_slots()
+    with sales_stats_lock:
+        for ring, size, slot in ((sales_stats['hourly'], SALES_HOURLY_SIZE, hour_slot),
+                                 (sales_stats['daily'], SALES_DAILY_SIZE, day_slot)):
+            bucket = sales_bucket(ring, size, slot)
+            for field, value in increments.items():
+                bucket[1 + SALES_FIELDS.index(field)] += value
+    save_sales_stats()
+
+def record_sale(order_id, order_data: Dict):
+    """Заказ завершён: количество, монеты, рубли и время от оплаты до уведомления покупателя"""
+    try:
+        rubles = float(order_data.get('price') or 0)
+    except (TypeError, ValueError):
+        rubles = 0
+    increments = {'orders': 1, 'coins': order_data.get('amount', 0), 'rubles': rubles}
+    timeline = orders_info.get(order_id, {}).get('timeline', {})
+    if 'paid' in timeline and 'buyer_notified' in timeline:
+        increments.update(delivery_sec=timeline['buyer_notified'] - timeline['paid'], delivered=1)
+    record_sales(**increments)
+
+def sales_totals(period: str) -> Dict:
+    """Сумма корзин за период: day — последние 24 часа, week — 7 дней, month — 30 дней (не зависит от объёма истории)"""
+    hour_slot, day_slot = sales_slots()
+    if period == 'day':
+        ring, first_slot, last_slot = sales_stats['hourly'], hour_slot - 23, hour_slot
+    else:
+        ring, first_slot, last_slot = sales_stats['daily'], day_slot - (6 if period == 'week' else 29), day_slot
+    totals = dict.fromkeys(SALES_FIELDS, 0)
+    with sales_stats_lock:
+        for bucket in ring:
+            if first_slot <= bucket[0] <= last_slot:
+                for i, field in enumerate(SALES_FIELDS):
+                    totals[field] += bucket[1 + i]
+    return totals
+
+def histogram_percentile(counts: List[int], q: float) -> float:
+    """Перцентиль по гистограмме с линейной интерполяцией внутри корзины"""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if count and cumulative + count >= rank:
+            lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+            if i >= len(LATENCY_BUCKETS):
+                return lower
+            return lower + (LATENCY_BUCKETS[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return LATENCY_BUCKETS[-1]
+
+def format_duration(seconds: float) -> str:
+    """Длительность для отчёта: 0.4 с, 12 с, 3.5 мин, 1.2 ч"""
+    if seconds < 10:
+        return f"{seconds:.1f} с"
+    if seconds < 60:
+        return f"{seconds:.0f} с"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+@lru_cache(maxsize=4096)
+def validate_minecraft_username(name: str) -> Tuple[bool, str]:
+    """Проверка никнейма по правилам Minecraft. Возвращает (валиден, причина отказа)"""
+    if not name:
+        return False, "никнейм пустой"
+    if MINECRAFT_USERNAME_RE.match(name):
+        return True, ""
+    if len(name) < 3 or len(name) > 16:
+        return False, f"длина никнейма должна быть от 3 до 16 символов (сейчас {len(name)})"
+    if any(ch.isspace() for ch in name):
+        return False, "никнейм не может содержать пробелы"
+    return False, "никнейм может содержать только латинские буквы, цифры и подчёркивание"
 
 def get_lot_info_by_order(c: Cardinal, order_event) -> Tuple[int, str]:
     """Получение информации о лоте из события заказа"""
@@ -201,20 +1299,20 @@ def get_lot_info_by_order(c: Cardinal, order_event) -> Tuple[int, str]:
             # Способ 1: Из атрибута amount (количество товара)
             if hasattr(order, 'amount') and order.amount:
                 quantity = int(order.amount)
-                logger.info(f"Количество единиц из order.amount: {quantity}")
+                intake_logger.info(f"Количество единиц из order.amount: {quantity}")
             
             # Способ 2: Из атрибута quantity
             elif hasattr(order, 'quantity') and order.quantity:
                 quantity = int(order.quantity)
-                logger.info(f"Количество единиц из order.quantity: {quantity}")
+                intake_logger.info(f"Количество единиц из order.quantity: {quantity}")
             
             # Способ 3: Из атрибута count
             elif hasattr(order, 'count') and order.count:
                 quantity = int(order.count)
-                logger.info(f"Количество единиц из order.count: {quantity}")
+                intake_logger.info(f"Количество единиц из order.count: {quantity}")
             
             else:
-                logger.warning(f"Не удалось найти количество единиц товара, используется значение по умолчанию: {quantity}")
+                intake_logger.warning(f"Не удалось найти количество единиц товара, используется значение по умолчанию: {quantity}")
             
             # Рассчитываем общее количество монет
             total_coins = quantity * coins_per_unit
@@ -230,37 +1328,78 @@ def get_lot_info_by_order(c: Cardinal, order_event) -> Tuple[int, str]:
             
             result_description = f"{description} ({total_coins:,} монет за {quantity} ед.)"
             
-            logger.info(f"Рассчитано количество валюты: {quantity} ед. × {coins_per_unit:,} = {total_coins:,} монет")
+            intake_logger.info(f"Рассчитано количество валюты: {quantity} ед. × {coins_per_unit:,} = {total_coins:,} монет")
             return total_coins, result_description
             
     except Exception as e:
-        logger.error(f"Ошибка получения информации о лоте: {e}")
+        intake_logger.error(f"Ошибка получения информации о лоте: {e}")
     
     # Возвращаем значения по умолчанию
     cfg = load_config()
     default_coins = cfg.get('coins_per_unit', 1000000)
-    logger.warning("Не удалось получить информацию о лоте, используются значения по умолчанию")
+    intake_logger.warning("Не удалось получить информацию о лоте, используются значения по умолчанию")
     return default_coins, f"Товар конвертирован в Minecraft валюту ({default_coins:,} монет за 1 ед.)"
 
 def is_allowed_lot(c: Cardinal, order_event) -> bool:
     """Проверка ID лотов принудительно отключена — разрешаем все заказы."""
-    logger.info(f"{LOGGER_PREFIX} Проверка ID лотов принудительно отключена — обрабатываем все заказы")
+    intake_logger.info(f"{LOGGER_PREFIX} Проверка ID лотов принудительно отключена — обрабатываем все заказы")
     return True
 
+def run_node(args: List[str], timeout: float, mode: str):
+    """Запуск Node-скрипта с учётом числа и длительности запусков в метриках"""
+    started = time.time()
+    try:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, encoding='utf-8', errors='replace')
+        node_processes[process.pid] = (mode, started, process)
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            node_processes.pop(process.pid, None)
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+    finally:
+        with metrics_lock:
+            stats = metrics['node_runs'].setdefault(mode, [0, 0.0])
+            stats[0] += 1
+            stats[1] += time.time() - started
+
+def get_order_cached(c: Cardinal, order_id):
+    """c.account.get_order с коротким кэшем: заказ запрашивается повторно при уведомлении и в обработчике"""
+    now = time.time()
+    entry = order_cache.get(order_id)
+    if entry and entry[0] > now:
+        metrics_inc('get_order_cache', 'hit')
+        return entry[1]
+
+    metrics_inc('get_order_cache', 'miss')
+    order = c.account.get_order(order_id)
+    if len(order_cache) > 256:
+        for cached_id, (expires, _) in list(order_cache.items()):
+            if expires <= now:
+                order_cache.pop(cached_id, None)
+    order_cache[order_id] = (now + ORDER_CACHE_TTL, order)
+    return order
+
 def test_minecraft_bot_connection():
     """Тестирование подключения Minecraft бота"""
+    # Постоянная сессия уже на сервере — второе подключение тем же аккаунтом выбило бы её
+    if bot_session and bot_session.is_alive():
+        return True
+
     try:
         # Используем упрощенный бот для тестирования
         bot_script_path = os.path.join(os.path.dirname(__file__), "minecraft_bot", "simple_bot.js")
         
         if not os.path.exists(bot_script_path):
-            logger.error(f"{LOGGER_PREFIX} Файл упрощенного бота не найден: {bot_script_path}")
+            delivery_logger.error(f"{LOGGER_PREFIX} Файл упрощенного бота не найден: {bot_script_path}")
             return False
             
         # Тестовое подключение
-        result = subprocess.run([
-            "node", bot_script_path, "test"
-        ], capture_output=True, text=True, timeout=30, encoding='utf-8', errors='replace')
+        result = run_node(["node", bot_script_path, "test"], 30, 'test')
         
         if result.returncode == 0:
             try:
@@ -269,7 +1408,7 @@ def test_minecraft_bot_connection():
                 for line in reversed(stdout_lines):
                     if line.strip().startswith('{') and 'success' in line:
                         status_data = json.loads(line.strip())
-                        logger.info(f"{LOGGER_PREFIX} Статус бота: {status_data}")
+                        delivery_logger.info(f"{LOGGER_PREFIX} Статус бота: {status_data}")
                         return status_data.get('success', False) and status_data.get('isConnected', False)
                         
                 # Если JSON не найден, проверяем по тексту
@@ -282,28 +1421,226 @@ def test_minecraft_bot_connection():
                     return True
                 return False
         else:
-            logger.error(f"{LOGGER_PREFIX} Ошибка тестирования бота: {result.stderr}")
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка тестирования бота: {result.stderr}")
             return False
             
     except subprocess.TimeoutExpired:
-        logger.warning(f"{LOGGER_PREFIX} Таймаут тестирования бота")
+        delivery_logger.warning(f"{LOGGER_PREFIX} Таймаут тестирования бота")
         return False
     except Exception as e:
-        logger.error(f"{LOGGER_PREFIX} Критическая ошибка тестирования бота: {e}")
+        delivery_logger.error(f"{LOGGER_PREFIX} Критическая ошибка тестирования бота: {e}")
         return False
 
-def give_minecraft_currency(username, amount):
-    """Автоматическая выдача валюты через упрощенный Minecraft бота"""
+class BotSession:
+    """Постоянная сессия Node-бота (simple_bot.js daemon): таб-лист, ожидание игроков и переводы без переподключения"""
+
+    def __init__(self, on_player_online=None):
+        self.process = None
+        self.ready = threading.Event()
+        self.on_player_online = on_player_online
+        self._pay_waiters = {}
+        self._write_lock = threading.Lock()
+
+    def start(self, ready_timeout=60) -> bool:
+        bot_script_path = os.path.join(os.path.dirname(__file__), "minecraft_bot", "simple_bot.js")
+        if not os.path.exists(bot_script_path):
+            delivery_logger.error(f"{LOGGER_PREFIX} Файл упрощенного бота не найден: {bot_script_path}")
+            return False
+
+        self.process = subprocess.Popen(["node", bot_script_path, "daemon"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True, encoding='utf-8', errors='replace', bufsize=1)
+        node_processes[self.process.pid] = ('daemon', time.time(), self.process)
+        with metrics_lock:
+            metrics['node_runs'].setdefault('daemon', [0, 0.0])[0] += 1
+        start_worker('session-reader', self._read_loop)
+        delivery_logger.info(f"{LOGGER_PREFIX} Запущена постоянная сессия бота (pid {self.process.pid})")
+
+        if not self.ready.wait(ready_timeout):
+            delivery_logger.warning(f"{LOGGER_PREFIX} Постоянная сессия бота не подключилась за {ready_timeout} сек")
+            self.stop()
+            return False
+        return True
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None and self.ready.is_set()
+
+    def send(self, payload: Dict) -> bool:
+        try:
+            with self._write_lock:
+                self.process.stdin.write(json.dumps(payload, ensure_ascii=False) + "\n")
+                self.process.stdin.flush()
+            return True
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки команды постоянной сессии: {e}")
+            return False
+
+    def watch(self, player: str):
+        self.send({"cmd": "watch", "player": player})
+
+    def unwatch(self, player: str):
+        self.send({"cmd": "unwatch", "player": player})
+
+    def pay(self, player: str, amount: int, deadline: float, cid=None) -> Dict:
+        request_id = uuid.uuid4().hex
+        waiter = {"event": threading.Event(), "result": None}
+        self._pay_waiters[request_id] = waiter
+
+        payload = {"cmd": "pay", "id": request_id, "cid": cid, "player": player, "amount": amount, "deadline": int(deadline * 1000)}
+        timeout = max(deadline - time.time(), 0) + NODE_EXIT_GRACE_SEC
+        if not self.send(payload):
+            self._pay_waiters.pop(request_id, None)
+            return {'success': False, 'error': 'session_unavailable', 'message': 'Постоянная сессия бота недоступна'}
+
+        if not waiter["event"].wait(timeout):
+            self._pay_waiters.pop(request_id, None)
+            # Команда уже у Node-бота — /pay мог уйти на сервер
+            return {'success': False, 'error': 'deadline_exceeded', 'stage': 'session', 'outcome_unknown': True,
+                    'message': 'Таймаут перевода через постоянную сессию'}
+        return waiter["result"]
+
+    def balance(self, timeout=15):
+        request_id = uuid.uuid4().hex
+        waiter = {"event": threading.Event(), "result": None}
+        self._pay_waiters[request_id] = waiter
+
+        if not self.send({"cmd": "balance", "id": request_id}) or not waiter["event"].wait(timeout):
+            self._pay_waiters.pop(request_id, None)
+            return None
+        return (waiter["result"] or {}).get('balance')
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.send({"cmd": "quit"})
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.process:
+            node_processes.pop(self.process.pid, None)
+        self.ready.clear()
+
+    def _handle_player_online(self, player):
+        try:
+            self.on_player_online(player)
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка обработки входа игрока: {e}")
+
+    def _read_loop(self):
+        set_worker_stage('чтение вывода постоянной сессии')
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line.startswith('{'):
+                if line:
+                    delivery_logger.info(f"{LOGGER_PREFIX} [session] {line}")
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            event = data.get("event")
+            if event == "ready":
+                delivery_logger.info(f"{LOGGER_PREFIX} Постоянная сессия бота готова, игроков в таб-листе: {data.get('online')}")
+                self.ready.set()
+            elif event == "player_online":
+                delivery_logger.info(f"{LOGGER_PREFIX} Игрок {data.get('player')} появился в сети")
+                if self.on_player_online:
+                    # Выдача и обращения к FunPay/Telegram — не в потоке чтения: ответы на /pay ждать не должны
+                    start_worker('player-online', self._handle_player_online, data.get("player"))
+            elif event == "pay_result":
+                delivery_logger.info(f"{LOGGER_PREFIX} [{data.get('cid')}] [session] {line}")
+                waiter = self._pay_waiters.pop(data.get("id"), None)
+                if waiter:
+                    waiter["result"] = {
+                        'success': bool(data.get('success')),
+                        'error': data.get('error'),
+                        'stage': data.get('stage'),
+                        'message': data.get('message', 'Успешно' if data.get('success') else 'Ошибка'),
+                        'player': data.get('player'),
+                        'amount': data.get('amount'),
+                        'balance': data.get('balance'),
+                        'timeline': data.get('timeline')
+                    }
+                    waiter["event"].set()
+            elif event == "balance_result":
+                waiter = self._pay_waiters.pop(data.get("id"), None)
+                if waiter:
+                    waiter["result"] = {'balance': data.get('balance')}
+                    waiter["event"].set()
+            elif event == "end":
+                delivery_logger.warning(f"{LOGGER_PREFIX} Постоянная сессия бота завершена: {data.get('error')} {data.get('reason')}")
+
+        # Процесс завершился — будим всех ожидающих перевода (прервавшийся перевод мог успеть пройти)
+        self.ready.clear()
+        for request_id, waiter in list(self._pay_waiters.items()):
+            waiter["result"] = {'success': False, 'error': 'session_closed', 'outcome_unknown': True,
+                                'message': 'Постоянная сессия бота завершилась'}
+            waiter["event"].set()
+        self._pay_waiters.clear()
+
+# Запас на запуск/завершение Node-процесса сверх срока задания и минимальный бюджет для резервного вызова
+NODE_EXIT_GRACE_SEC = 5
+MIN_FALLBACK_BUDGET_SEC = 20
+
+# Ошибки бота, при которых повторный запуск заведомо не поможет
+DEFINITE_BOT_ERRORS = ('player_offline', 'invalid_username', 'invalid_amount', 'insufficient_funds', 'banned')
+
+def parse_bot_output(stdout_content: str):
+    """Поиск итоговой JSON-строки в выводе Node-скрипта"""
+    stdout_lines = stdout_content.strip().split('\n') if stdout_content else []
+    for line in reversed(stdout_lines):
+        if line.strip().startswith('{') and ('success' in line or 'error' in line):
+            try:
+                return json.loads(line.strip())
+            except json.JSONDecodeError:
+                return None
+    return None
+
+def bot_failure_result(result_data) -> Dict:
+    """Результат неуспешной выдачи по JSON-ответу бота (с этапом, если срок задания истёк)"""
+    error = result_data.get('error', 'unknown')
+    message = result_data.get('message', 'Ошибка')
+    if error == 'deadline_exceeded':
+        message = f"Бюджет времени задания исчерпан на этапе {result_data.get('stage') or 'неизвестно'}"
+    return {'success': False, 'error': error, 'stage': result_data.get('stage'), 'balance': result_data.get('balance'),
+            'timeline': result_data.get('timeline'), 'outcome_unknown': bool(result_data.get('outcome_unknown')), 'message': message}
+
+def delivery_deadline() -> float:
+    """Абсолютный срок для нового задания выдачи"""
+    return time.time() + load_config().get('delivery_budget_sec', 120)
+
+def give_minecraft_currency(username, amount, deadline=None, account=None, cid=None):
+    """Автоматическая выдача валюты через упрощенный Minecraft бота (account — дополнительный аккаунт бота, cid — id попытки)"""
     # Подготовка путей и параметров
-    logger.info(f"{LOGGER_PREFIX} Начинаем выдачу {amount:,} монет игроку {username}")
+    log_prefix = f"{LOGGER_PREFIX} [{cid}]" if cid else LOGGER_PREFIX
+    delivery_logger.info(f"{log_prefix} Начинаем выдачу {amount:,} монет игроку {username}")
+    # Один срок на всё задание: подключение, логин, анархия, перевод, подтверждение, резервный запуск
+    if deadline is None:
+        deadline = delivery_deadline()
     bot_script_path = os.path.join(os.path.dirname(__file__), "minecraft_bot", "simple_bot.js")
 
     if not os.path.exists(bot_script_path):
-        logger.error(f"{LOGGER_PREFIX} Файл упрощенного бота не найден: {bot_script_path}")
+        delivery_logger.error(f"{log_prefix} Файл упрощенного бота не найден: {bot_script_path}")
         return {'success': False, 'error': 'bot_script_not_found', 'message': 'Файл Minecraft бота не найден'}
 
     cfg = load_config()
     mb = cfg.get('minecraft_bot', {})
+    # Дополнительный аккаунт: Node-скрипт берёт его пароль из конфигурации по нику
+    extra_account = account if account and account != mb.get('bot_username', '') else None
+
+    # Если бот уже на сервере (постоянная сессия основного аккаунта), переводим без нового подключения
+    if not extra_account and bot_session and bot_session.is_alive():
+        delivery_logger.info(f"{log_prefix} Перевод через постоянную сессию бота")
+        session_result = bot_session.pay(username, amount, deadline, cid)
+        delivery_logger.info(f"{log_prefix} Результат перевода: {session_result}")
+        if session_result['success']:
+            return {'success': True, 'message': session_result.get('message', 'Успешно'), 'player': username, 'amount': amount,
+                    'balance': session_result.get('balance'), 'timeline': session_result.get('timeline')}
+        # Новый запуск Node — только если команда не дошла до сессии; иначе /pay мог уже уйти на сервер
+        if session_result.get('error') != 'session_unavailable':
+            return bot_failure_result(session_result)
+
     bot_username = mb.get('bot_username', '')
     bot_password = mb.get('password', '')
     server = mb.get('server', 'funtime.su')
@@ -311,130 +1648,169 @@ def give_minecraft_currency(username, amount):
     anarchy = mb.get('anarchy', 'an210')
 
     # Первый (полный) вызов: передаём все параметры
-    command_args = ["node", bot_script_path, username, str(amount), bot_username, bot_password, server, str(port), anarchy]
+    option_args = [f"--deadline={int(deadline * 1000)}"]
+    if cid:
+        option_args.append(f"--cid={cid}")
+    if extra_account:
+        option_args.append(f"--account={extra_account}")
+        command_args = ["node", bot_script_path, username, str(amount)] + option_args
+    else:
+        command_args = ["node", bot_script_path, username, str(amount), bot_username, bot_password, server, str(port), anarchy] + option_args
     # Show full args (password unmasked) as requested
-    logger.info(f"{LOGGER_PREFIX} Запуск Node-скрипта с args: {command_args}")
+    if delivery_logger.isEnabledFor(logging.DEBUG):
+        delivery_logger.debug(f"{log_prefix} Запуск Node-скрипта с args: {command_args}")
 
+    # Node сам укладывается в срок; небольшой запас — на запуск и завершение процесса
+    remaining = deadline - time.time()
     try:
-        result = subprocess.run(command_args, capture_output=True, text=True, timeout=90, encoding='utf-8', errors='replace')
+        result = run_node(command_args, max(remaining, 0) + NODE_EXIT_GRACE_SEC, 'pay')
     except subprocess.TimeoutExpired:
-        logger.error(f"{LOGGER_PREFIX} ❌ Таймаут запуска Node-скрипта (90 сек)")
-        return {'success': False, 'error': 'timeout', 'message': 'Таймаут выполнения Node-скрипта'}
+        delivery_logger.error(f"{log_prefix} ❌ Таймаут запуска Node-скрипта ({remaining:.0f} сек)")
+        # Процесс убит без итога — неизвестно, успел ли он отправить /pay
+        return {'success': False, 'error': 'deadline_exceeded', 'stage': 'node_process', 'outcome_unknown': True,
+                'message': 'Бюджет времени задания исчерпан на этапе node_process'}
     except Exception as e:
-        logger.error(f"{LOGGER_PREFIX} Ошибка запуска Node-скрипта: {e}")
+        delivery_logger.error(f"{log_prefix} Ошибка запуска Node-скрипта: {e}")
         result = None
 
-    # Если результат отсутствует или код != 0, делаем резервный (простой) вызов
+    # Игрок не в сети и т.п. — резервный вызов ничего не изменит
+    if result is not None and result.returncode != 0:
+        result_data = parse_bot_output(result.stdout)
+        if result_data and result_data.get('error') in DEFINITE_BOT_ERRORS:
+            delivery_logger.info(f"{log_prefix} Результат перевода: {result_data}")
+            return bot_failure_result(result_data)
+        # Резервный вызов повторил бы перевод: допустим, только если первый точно не дошёл до /pay
+        if not result_data:
+            delivery_logger.error(f"{log_prefix} ❌ Node-скрипт завершился без итога (код {result.returncode}), исход перевода неизвестен")
+            return {'success': False, 'error': 'bot_execution_failed', 'outcome_unknown': True,
+                    'message': f"Node-скрипт завершился без итога (код {result.returncode})"}
+        if (result_data.get('timeline') or {}).get('pay_sent'):
+            delivery_logger.info(f"{log_prefix} Результат перевода: {result_data}")
+            return bot_failure_result(result_data)
+
+    # Если результат отсутствует или код != 0, делаем резервный (простой) вызов — если на него остался бюджет
     if not result or (hasattr(result, 'returncode') and result.returncode != 0):
-        logger.info(f"{LOGGER_PREFIX} Первый вызов неуспешен, пытаем fallback (node simple_bot.js <player> <amount>)")
-        fallback_args = ["node", bot_script_path, username, str(amount)]
+        remaining = deadline - time.time()
+        if remaining < MIN_FALLBACK_BUDGET_SEC:
+            delivery_logger.warning(f"{log_prefix} На резервный вызов не осталось времени ({remaining:.0f} сек)")
+            result_data = parse_bot_output(getattr(result, 'stdout', '') or '') if result else None
+            if result_data and result_data.get('error'):
+                return bot_failure_result(result_data)
+            return {'success': False, 'error': 'deadline_exceeded', 'stage': 'fallback', 'message': 'Бюджет времени задания исчерпан на этапе fallback'}
+
+        delivery_logger.info(f"{log_prefix} Первый вызов неуспешен, пытаем fallback (node simple_bot.js <player> <amount>)")
+        fallback_args = ["node", bot_script_path, username, str(amount)] + option_args
         try:
-            fallback_result = subprocess.run(fallback_args, capture_output=True, text=True, timeout=90, encoding='utf-8', errors='replace')
+            fallback_result = run_node(fallback_args, remaining + NODE_EXIT_GRACE_SEC, 'pay_fallback')
             result = fallback_result
         except subprocess.TimeoutExpired:
-            logger.error(f"{LOGGER_PREFIX} ❌ Таймаут резервного вызова Node-скрипта (90 сек)")
-            return {'success': False, 'error': 'timeout', 'message': 'Таймаут выполнения Node-скрипта (fallback)'}
+            delivery_logger.error(f"{log_prefix} ❌ Таймаут резервного вызова Node-скрипта ({remaining:.0f} сек)")
+            return {'success': False, 'error': 'deadline_exceeded', 'stage': 'node_process', 'outcome_unknown': True,
+                    'message': 'Бюджет времени задания исчерпан на этапе node_process (fallback)'}
         except Exception as e:
-            logger.error(f"{LOGGER_PREFIX} Ошибка резервного вызова Node-скрипта: {e}")
+            delivery_logger.error(f"{log_prefix} Ошибка резервного вызова Node-скрипта: {e}")
             return {'success': False, 'error': 'bot_execution_failed', 'message': str(e)}
 
     # Лог вывода
     try:
-        logger.info(f"{LOGGER_PREFIX} Результат выполнения бота (код: {result.returncode})")
-        logger.info(f"{LOGGER_PREFIX} Stdout: {result.stdout}")
-        if result.stderr:
-            logger.info(f"{LOGGER_PREFIX} Stderr: {result.stderr}")
+        delivery_logger.info(f"{log_prefix} Результат выполнения бота (код: {result.returncode})")
+        if delivery_logger.isEnabledFor(logging.DEBUG):
+            delivery_logger.debug(f"{log_prefix} Stdout: {result.stdout}")
+            if result.stderr:
+                delivery_logger.debug(f"{log_prefix} Stderr: {result.stderr}")
     except Exception:
-        logger.warning(f"{LOGGER_PREFIX} Невозможно прочитать результат выполнения бота")
+        delivery_logger.warning(f"{log_prefix} Невозможно прочитать результат выполнения бота")
 
     # Обработка результата
     if result and getattr(result, 'returncode', 1) == 0:
-        stdout_content = result.stdout or ""
-        try:
-            stdout_lines = stdout_content.strip().split('\n') if stdout_content else []
-            json_line = None
-            for line in reversed(stdout_lines):
-                if line.strip().startswith('{') and ('success' in line or 'error' in line):
-                    json_line = line.strip()
-                    break
-
-            if json_line:
-                result_data = json.loads(json_line)
-                logger.info(f"{LOGGER_PREFIX} Результат перевода: {result_data}")
-                if result_data.get('success'):
-                    return {'success': True, 'message': result_data.get('message', 'Успешно'), 'player': username, 'amount': amount}
-                else:
-                    return {'success': False, 'error': result_data.get('error', 'unknown'), 'message': result_data.get('message', 'Ошибка')}
+        result_data = parse_bot_output(result.stdout or "")
+        if result_data:
+            delivery_logger.info(f"{log_prefix} Результат перевода: {result_data}")
+            if result_data.get('success'):
+                return {'success': True, 'message': result_data.get('message', 'Успешно'), 'player': username, 'amount': amount,
+                        'balance': result_data.get('balance'), 'timeline': result_data.get('timeline')}
             else:
-                return {'success': True, 'message': 'Успешно выдано (без JSON)', 'player': username, 'amount': amount}
-        except json.JSONDecodeError:
-            return {'success': True, 'message': 'Успешно выдано (парсинг JSON не удался)', 'player': username, 'amount': amount}
+                return bot_failure_result(result_data)
+        else:
+            return {'success': True, 'message': 'Успешно выдано (без JSON)', 'player': username, 'amount': amount}
     else:
+        # Node-скрипт сообщил причину сбоя — передаём её как есть (нужна для классификации)
+        result_data = parse_bot_output(getattr(result, 'stdout', '') or '') if result else None
+        if result_data and result_data.get('error'):
+            return bot_failure_result(result_data)
         stderr_text = getattr(result, 'stderr', None) if result else 'Неизвестная ошибка'
-        logger.error(f"{LOGGER_PREFIX} ❌ Ошибка выполнения бота: {stderr_text}")
-        return {'success': False, 'error': 'bot_execution_failed', 'message': f'Ошибка выполнения бота: {stderr_text[:200] if stderr_text else "Неизвестная ошибка"}'}
+        delivery_logger.error(f"{log_prefix} ❌ Ошибка выполнения бота: {stderr_text}")
+        # Запущенный процесс упал без итога — /pay мог уйти на сервер
+        return {'success': False, 'error': 'bot_execution_failed', 'outcome_unknown': result is not None,
+                'message': f'Ошибка выполнения бота: {stderr_text[:200] if stderr_text else "Неизвестная ошибка"}'}
 
-def auto_complete_order_with_currency(order_id, admin_chat_id=None):
-    """Автоматическое завершение заказа с выдачей валюты"""
-    global pending_orders, orders_info
-    
-    # Находим заказ в ожидающих
-    order_data = pending_orders.get(order_id)
-    
-    if not order_data:
-        logger.error(f"{LOGGER_PREFIX} Заказ #{order_id} не найден в ожидающих для автозавершения")
-        return False
-    
+def complete_delivered_order(order_id, order_data):
+    """Завершение заказа после успешного перевода: статус, удаление из ожидающих, уведомление покупателя"""
     username = order_data.get('minecraft_username')
     amount = order_data.get('amount', 0)
+
+    order_data['status'] = 'completed'
+    order_data['completed_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    order_data['completed_by'] = 'auto_bot'
+    order_data['auto_completed'] = True
     
-    if not username:
-        logger.error(f"{LOGGER_PREFIX} Не указан никнейм для заказа #{order_id}")
-        return False
+    # Удаляем из ожидающих
+    pending_orders.pop(order_id, None)
+    save_pending_orders(pending_orders)
     
-    logger.info(f"{LOGGER_PREFIX} Начинаем автозавершение заказа #{order_id} для {username} на сумму {amount:,}")
+    # Уведомляем покупателя
+    cfg = load_config()
+    completion_msg = cfg['messages']['completed'].format(
+        order_id=order_id,
+        amount=amount,
+        username=username
+    )
+    completion_msg += f"\n\n🤖 Деньги переведены автоматически!"
     
-    # Пытаемся выдать валюту
-    currency_result = give_minecraft_currency(username, amount)
+    # Уведомляем только покупателя
+    if order_id in orders_info:
+        target_chat_id = orders_info[order_id]['chat_id']
+        try:
+            cardinal_instance.send_message(target_chat_id, completion_msg)
+            mark_order_stage(order_id, 'buyer_notified')
+            delivery_logger.info(f"{LOGGER_PREFIX} Уведомление о завершении отправлено покупателю в чат {target_chat_id}")
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления покупателю: {e}")
     
-    if currency_result['success']:
-        # Валюта выдана успешно, завершаем заказ
-        order_data['status'] = 'completed'
-        order_data['completed_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        order_data['completed_by'] = 'auto_bot'
-        order_data['auto_completed'] = True
-        
-        # Удаляем из ожидающих
-        del pending_orders[order_id]
-        save_pending_orders(pending_orders)
-        
-        # Уведомляем покупателя
-        cfg = load_config()
-        completion_msg = cfg['messages']['completed'].format(
-            order_id=order_id,
-            amount=amount,
-            username=username
-        )
-        completion_msg += f"\n\n🤖 Деньги переведены автоматически!"
-        
-        # Уведомляем только покупателя
-        if order_id in orders_info:
-            target_chat_id = orders_info[order_id]['chat_id']
-            try:
-                cardinal_instance.send_message(target_chat_id, completion_msg)
-                logger.info(f"{LOGGER_PREFIX} Уведомление о завершении отправлено покупателю в чат {target_chat_id}")
-            except Exception as e:
-                logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления покупателю: {e}")
-        
-        logger.info(f"{LOGGER_PREFIX} ✅ Заказ #{order_id} автоматически завершен - уведомлен только покупатель")
-        return True
-        
+    finalize_order_timeline(order_id)
+    record_sale(order_id, order_data)
+    archive_order(order_id, order_data)
+    delivery_logger.info(f"{LOGGER_PREFIX} ✅ Заказ #{order_id} автоматически завершен - уведомлен только покупатель")
+
+def report_failed_delivery(order_id, order_data, currency_result, admin_chat_id=None, outcome_unknown=False):
+    """Заказ не выдан (или исход перевода неизвестен): возвращаем его администратору и сообщаем об ошибке"""
+    username = order_data.get('minecraft_username')
+    amount = order_data.get('amount', 0)
+
+    order_data['status'] = 'ready_for_admin'
+    save_pending_orders(pending_orders, order_id)
+    flush_orders_info()
+
+    if outcome_unknown:
+        delivery_logger.error(f"{LOGGER_PREFIX} ⚠️ Исход перевода по заказу #{order_id} неизвестен (/pay уже отправлен): {currency_result['message']}")
     else:
         # Валюта не выдана, логируем ошибку
-        logger.error(f"{LOGGER_PREFIX} ❌ Не удалось автоматически выдать валюту для заказа #{order_id}: {currency_result['message']}")
-        
-        # Уведомляем администратора об ошибке
-        if admin_chat_id and bot:
+        delivery_logger.error(f"{LOGGER_PREFIX} ❌ Не удалось автоматически выдать валюту для заказа #{order_id}: {currency_result['message']}")
+    
+    # Уведомляем администратора об ошибке
+    if admin_chat_id and bot:
+        if outcome_unknown:
+            error_msg = f"⚠️ ИСХОД ПЕРЕВОДА НЕИЗВЕСТЕН\n\n" \
+                      f"Заказ: #{order_id}\n" \
+                      f"Игрок: {username}\n" \
+                      f"Сумма: {amount:,} монет\n" \
+                      f"Ошибка: {currency_result['message']}\n\n" \
+                      f"Команда /pay уже была отправлена — перевод мог пройти.\n" \
+                      f"Проверьте баланс бота и историю переводов на сервере, прежде чем выдавать снова!\n" \
+                      f"✅ /complete_{order_id} - Перевод прошёл / выдал вручную\n" \
+                      f"🤖 /auto_{order_id} - Перевода не было, выдать снова\n" \
+                      f"❌ /cancel_{order_id} - Отменить заказ"
+        else:
             error_msg = f"❌ ОШИБКА АВТОМАТИЧЕСКОЙ ВЫДАЧИ\n\n" \
                       f"Заказ: #{order_id}\n" \
                       f"Игрок: {username}\n" \
@@ -443,16 +1819,745 @@ def auto_complete_order_with_currency(order_id, admin_chat_id=None):
                       f"Требуется ручная выдача валюты!\n" \
                       f"✅ /complete_{order_id} - Выдал вручную\n" \
                       f"❌ /cancel_{order_id} - Отменить заказ"
-            
+        
+        try:
+            bot.send_message(admin_chat_id, error_msg)
+            delivery_logger.info(f"{LOGGER_PREFIX} Уведомление об ошибке автовыдачи отправлено администратору")
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления об ошибке: {e}")
+
+# Причины сбоя выдачи. Всё, кроме bad_player, — проблема сервера или аккаунта бота
+FAILURE_CAUSES = {
+    'timeout': 'connect_timeout',
+    'deadline_exceeded': 'connect_timeout',
+    'connect_timeout': 'connect_timeout',
+    'session_closed': 'connect_timeout',
+    'kicked': 'kick',
+    'banned': 'ban',
+    'insufficient_funds': 'insufficient_funds',
+    'player_offline': 'bad_player',
+    'invalid_username': 'bad_player',
+    'invalid_amount': 'bad_player'
+}
+FAILURE_CAUSE_NAMES = {
+    'connect_timeout': 'таймаут подключения',
+    'kick': 'бот кикнут с сервера',
+    'ban': 'аккаунт бота забанен',
+    'insufficient_funds': 'недостаточно средств у бота',
+    'bad_player': 'ошибка игрока',
+    'other': 'ошибка выполнения бота'
+}
+# При этих причинах заказ можно вернуть в очередь — но только если /pay ещё не отправлялся (см. payment_outcome_unknown)
+REQUEUE_CAUSES = ('connect_timeout', 'kick', 'ban', 'insufficient_funds')
+
+def payment_outcome_unknown(currency_result) -> bool:
+    """Неуспешная выдача, после которой перевод мог пройти: /pay уже отправлен (этап pay_sent) или исход не узнать"""
+    if currency_result.get('success'):
+        return False
+    return bool(currency_result.get('outcome_unknown') or (currency_result.get('timeline') or {}).get('pay_sent'))
+
+def classify_delivery_failure(currency_result) -> str:
+    """Причина неуспешной выдачи: connect_timeout, kick, ban, insufficient_funds, bad_player или other"""
+    error = currency_result.get('error') or ''
+    cause = FAILURE_CAUSES.get(error, 'other')
+    if cause == 'kick' and re.search(r"забанен|бан|заблокирован|banned", currency_result.get('message') or '', re.IGNORECASE):
+        cause = 'ban'
+    return cause
+
+def set_bot_health_state(new_state, reason=""):
+    """Смена состояния circuit breaker с одним уведомлением администратора"""
+    with bot_health_lock:
+        old_state = bot_health['state']
+        if old_state == new_state:
+            return
+        bot_health['state'] = new_state
+        bot_health['changed_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    delivery_logger.warning(f"{LOGGER_PREFIX} Состояние бота: {old_state} → {new_state} {reason}")
+
+    if new_state == 'open':
+        text = f"🔴 АВТОВЫДАЧА ПРИОСТАНОВЛЕНА\n\n" \
+               f"Причина: {reason}\n" \
+               f"Новые заказы копятся в очереди ({len(queued_entries)} сейчас), бот периодически проверяет подключение."
+        start_worker('bot-probe', bot_health_probe_loop)
+    elif new_state == 'half_open':
+        text = "🟡 Бот снова подключается к серверу — пробная выдача из очереди..."
+    else:
+        text = f"🟢 АВТОВЫДАЧА ВОССТАНОВЛЕНА\n\nВ очереди: {len(queued_entries)} заказов."
+
+    cfg = load_config()
+    if bot and cfg.get('notification_chat_id'):
+        try:
+            bot.send_message(cfg['notification_chat_id'], text)
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления о состоянии бота: {e}")
+
+def record_delivery_outcome(currency_result):
+    """Учёт результата выдачи в circuit breaker. Возвращает причину сбоя (или None при успехе)"""
+    if currency_result['success']:
+        with bot_health_lock:
+            bot_health['failures'] = 0
+        set_bot_health_state('closed')
+        return None
+
+    cause = classify_delivery_failure(currency_result)
+    # Нехватку средств отслеживает проверка баланса перед выдачей, это не сбой сервера
+    if cause in ('bad_player', 'insufficient_funds'):
+        return cause
+
+    threshold = load_config().get('circuit_breaker', {}).get('failure_threshold', 3)
+    with bot_health_lock:
+        bot_health['failures'] += 1
+        bot_health['last_cause'] = cause
+        bot_health['last_error'] = currency_result.get('message')
+        should_open = bot_health['state'] == 'half_open' or bot_health['failures'] >= threshold
+
+    if should_open:
+        set_bot_health_state('open', f"{FAILURE_CAUSE_NAMES.get(cause, cause)} ({currency_result.get('message')})")
+    return cause
+
+def bot_health_probe_loop():
+    """Фоновая проверка подключения, пока выдача приостановлена"""
+    while bot_health['state'] == 'open':
+        set_worker_stage('ожидание')
+        time.sleep(load_config().get('circuit_breaker', {}).get('probe_interval_sec', 60))
+        set_worker_stage('проверка подключения бота')
+        with delivery_lock:
+            connected = test_minecraft_bot_connection()
+        if connected:
+            set_bot_health_state('half_open')
+            delivery_wakeup.set()
+            return
+        delivery_logger.info(f"{LOGGER_PREFIX} Проверка подключения бота неуспешна, выдача по-прежнему приостановлена")
+
+def claim_orders(order_ids: List[str], from_queue=False) -> List[Tuple[str, Dict]]:
+    """Забирает заказы в выдачу (статус delivering). Очередь выдаёт только свои заказы, ручной запуск — только чужие очереди"""
+    batch = []
+    with delivery_queue_lock:
+        for order_id in order_ids:
+            order_data = pending_orders.get(order_id)
+            if not order_data:
+                continue
+            status = order_data.get('status')
+            if (status != 'queued') if from_queue else (status in WORKER_STATUSES):
+                delivery_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} пропущен: статус {status}")
+                continue
+            order_data['status'] = 'delivering'
+            queued_entries.pop(order_id, None)
+            batch.append((order_id, order_data))
+    if batch:
+        save_pending_orders(pending_orders, *[order_id for order_id, _ in batch])
+    return batch
+
+def deliver_orders(order_ids: List[str], admin_chat_id=None, from_queue=False) -> Dict[str, bool]:
+    """Выдача валюты по одному или нескольким заказам одного игрока за один перевод (from_queue — вызов из очереди выдачи)"""
+    # Одна учётная запись бота — одновременно возможна только одна сессия.
+    # Статус заказов меняется только под блокировкой: от delivering до итогового состояния
+    with delivery_lock:
+        batch = claim_orders(order_ids, from_queue)
+        if not batch:
+            return {}
+
+        # Бот недоступен — не тратим время на попытку, заказы ждут в очереди
+        if bot_health['state'] == 'open':
+            for order_id, _ in batch:
+                start_delivery(order_id, requeue=True)
+                metrics_inc('deliveries', 'deferred')
+            return {order_id: False for order_id, _ in batch}
+
+        username = batch[0][1].get('minecraft_username')
+        total_amount = sum(order_data.get('amount', 0) for _, order_data in batch)
+        ids_text = ", ".join(f"#{order_id}" for order_id, _ in batch)
+        # Один id на попытку выдачи — им помечены логи плагина, вывод Node-бота и /mc_trace
+        cid = uuid.uuid4().hex[:10]
+        set_worker_stage(f"выдача [{cid}]", [order_id for order_id, _ in batch])
+        delivery_logger.info(f"{LOGGER_PREFIX} [{cid}] Начинаем автозавершение заказов {ids_text} для {username} на сумму {total_amount:,}")
+
+        # Ни одному аккаунту бота не хватает средств — не тратим сессию на заведомо неуспешный перевод
+        account = choose_delivery_account(total_amount)
+        if account is None:
+            for order_id, _ in batch:
+                hold_for_funds(order_id)
+                metrics_inc('deliveries', 'waiting_funds')
+            check_funds_shortfall()
+            return {order_id: False for order_id, _ in batch}
+
+        # Пытаемся выдать валюту (заведомо невалидный никнейм до бота не доходит)
+        is_valid, reason = validate_minecraft_username(username)
+        if is_valid:
+            started = time.time()
             try:
-                bot.send_message(admin_chat_id, error_msg)
-                logger.info(f"{LOGGER_PREFIX} Уведомление об ошибке автовыдачи отправлено администратору")
+                currency_result = give_minecraft_currency(username, total_amount, delivery_deadline(), account, cid)
             except Exception as e:
-                logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления об ошибке: {e}")
-        
+                # Неожиданная ошибка посреди выдачи — перевод мог пройти, решает администратор
+                delivery_logger.error(f"{LOGGER_PREFIX} [{cid}] Ошибка выдачи: {e}")
+                delivery_logger.error(f"{LOGGER_PREFIX} Трейсбек: {traceback.format_exc()}")
+                currency_result = {'success': False, 'error': 'bot_execution_failed', 'outcome_unknown': True, 'message': f'Ошибка выдачи: {e}'}
+            record_service_time(time.time() - started)
+            update_balance_after_delivery(account, total_amount, currency_result)
+            apply_bot_timeline([order_id for order_id, _ in batch], currency_result.get('timeline'))
+        else:
+            started = time.time()
+            currency_result = {'success': False, 'error': 'invalid_username', 'message': f'Недопустимый никнейм: {reason}'}
+        record_delivery_attempt([order_id for order_id, _ in batch], cid, account, started, currency_result)
+
+        cause = record_delivery_outcome(currency_result)
+        if cause:
+            record_sales(**{'fail_' + cause: 1})
+
+        results = {}
+        outcome_unknown = payment_outcome_unknown(currency_result)
+        park_offline = currency_result.get('error') == 'player_offline' and load_config().get('park_offline_orders', True)
+        for order_id, order_data in batch:
+            if currency_result['success']:
+                complete_delivered_order(order_id, order_data)
+                outcome = 'success'
+            elif outcome_unknown:
+                # /pay уже ушёл на сервер — повторная выдача может заплатить дважды, решает администратор
+                report_failed_delivery(order_id, order_data, currency_result, admin_chat_id, outcome_unknown=True)
+                outcome = 'unknown'
+            elif park_offline:
+                # Игрок не в сети — откладываем заказ до его появления вместо повторных попыток
+                park_order(order_id, admin_chat_id)
+                outcome = 'parked'
+            elif cause in REQUEUE_CAUSES:
+                # Сбой на стороне сервера/аккаунта: перевод не состоялся, заказ ждёт восстановления в очереди
+                delivery_logger.warning(f"{LOGGER_PREFIX} [{cid}] Заказ #{order_id} возвращён в очередь: {FAILURE_CAUSE_NAMES[cause]}")
+                start_delivery(order_id, requeue=True)
+                outcome = 'requeued'
+            else:
+                report_failed_delivery(order_id, order_data, currency_result, admin_chat_id)
+                outcome = 'failed'
+            results[order_id] = outcome == 'success'
+            metrics_inc('deliveries', outcome)
+        with metrics_lock:
+            metrics['last_attempt'] = {'cid': cid, 'orders': ",".join(order_id for order_id, _ in batch), 'outcome': outcome, 'ts': time.time()}
+    return results
+
+def auto_complete_order_with_currency(order_id, admin_chat_id=None):
+    """Автоматическое завершение заказа с выдачей валюты"""
+    global pending_orders, orders_info
+    
+    # Находим заказ в ожидающих
+    order_data = pending_orders.get(order_id)
+    
+    if not order_data:
+        delivery_logger.error(f"{LOGGER_PREFIX} Заказ #{order_id} не найден в ожидающих для автозавершения")
+        return False
+    
+    if not order_data.get('minecraft_username'):
+        delivery_logger.error(f"{LOGGER_PREFIX} Не указан никнейм для заказа #{order_id}")
+        return False
+    
+    if order_data.get('status') in WORKER_STATUSES:
+        delivery_logger.warning(f"{LOGGER_PREFIX} Заказ #{order_id} уже в автовыдаче (статус {order_data.get('status')}), ручной запуск пропущен")
+        return False
+    
+    return deliver_orders([order_id], admin_chat_id).get(order_id, False)
+
+def delivery_key(order_data) -> Tuple[str, str]:
+    """Заказы с одинаковым ключом (сервер, игрок) можно выдать одним переводом"""
+    server = load_config().get('minecraft_bot', {}).get('server', 'funtime.su')
+    return server, (order_data.get('minecraft_username') or '').lower()
+
+def is_repeat_buyer(order_id) -> bool:
+    """Покупатель уже получал валюту раньше (не считая текущего заказа)"""
+    buyer_id = orders_info.get(order_id, {}).get('buyer_id')
+    entry = buyers_index.get(str(buyer_id)) if buyer_id is not None else None
+    if not entry:
         return False
+    return sum(stats.get('count', 0) for stats in entry['nicknames'].values()) > 1
 
-def minecraft_currency_handler(c: Cardinal, e, *args):
+def delivery_priority(order_id, order_data) -> Tuple[int, float]:
+    """Ключ очереди: закреплённые заказы первыми, затем время оплаты минус ограниченный бонус.
+    Ключ не зависит от момента вычисления — старение заложено в само время оплаты"""
+    sched = load_config().get('scheduler', {})
+    try:
+        paid_ts = datetime.strptime(order_data.get('date'), "%Y-%m-%d %H:%M:%S").timestamp()
+    except (TypeError, ValueError):
+        paid_ts = time.time()
+
+    boost = order_data.get('amount', 0) / 1_000_000 * sched.get('amount_boost_sec_per_million', 5)
+    try:
+        boost += float(order_data.get('price') or 0) / 100 * sched.get('price_boost_sec_per_100_rub', 0)
+    except (TypeError, ValueError):
+        pass
+    if is_repeat_buyer(order_id):
+        boost += sched.get('repeat_buyer_boost_sec', 60)
+    boost = min(boost, sched.get('max_boost_sec', 600))
+    return (0 if order_data.get('pinned') else 1, paid_ts - boost)
+
+def push_delivery(order_id):
+    """Добавляет (или переставляет) заказ в куче выдачи. Вызывается под delivery_queue_lock"""
+    entry = delivery_priority(order_id, pending_orders[order_id]) + (next(queue_seq), order_id)
+    queued_entries[order_id] = entry
+    heapq.heappush(delivery_queue, entry)
+
+def queue_snapshot() -> List[str]:
+    """Заказы очереди в порядке выдачи"""
+    with delivery_queue_lock:
+        entries = sorted(entry for order_id, entry in queued_entries.items() if order_id in pending_orders)
+    return [entry[-1] for entry in entries]
+
+def queue_position(order_id=None) -> int:
+    """Место заказа в очереди (1 — следующий); без order_id — место нового заказа за O(1).
+    Место заказа в очереди — O(n): закрепление и бонус повторным покупателям переставляют заказы,
+    поэтому порядковый номер постановки места не даёт, и заказы впереди пересчитываются"""
+    with delivery_queue_lock:
+        entry = queued_entries.get(order_id)
+        if entry is None:
+            return len(queued_entries) + 1
+        return 1 + sum(1 for other in queued_entries.values() if other < entry)
+
+def record_service_time(seconds: float):
+    """Обновление скользящей (EWMA) оценки длительности задания выдачи за O(1)"""
+    alpha = load_config().get('eta', {}).get('ewma_alpha', 0.2)
+    previous = service_time['ewma_sec']
+    service_time['ewma_sec'] = seconds if previous is None else alpha * seconds + (1 - alpha) * previous
+    service_time['samples'] += 1
+
+def estimate_wait_sec(position: int) -> float:
+    """Ожидание до выдачи заказа на указанном месте очереди"""
+    per_job = service_time['ewma_sec'] or load_config().get('eta', {}).get('default_service_sec', 40)
+    # Задание, которое бот выполняет прямо сейчас, тоже нужно дождаться
+    busy = 1 if delivery_lock.locked() else 0
+    return (position + busy) * per_job
+
+def format_eta(seconds: float) -> str:
+    """Ожидание для покупателя: «около минуты», «около 5 мин», «около 1 ч 20 мин»"""
+    minutes = max(1, int(-(-seconds // 60)))
+    if minutes == 1:
+        return "около минуты"
+    if minutes < 60:
+        return f"около {minutes} мин"
+    return f"около {minutes // 60} ч {minutes % 60} мин" if minutes % 60 else f"около {minutes // 60} ч"
+
+class SafeFormatDict(dict):
+    """Неизвестные переменные шаблона остаются в тексте как есть"""
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+def render_message(template: str, **values) -> str:
+    """Подстановка переменных в шаблон сообщения; при ошибке в шаблоне — текст без подстановки"""
+    try:
+        return template.format_map(SafeFormatDict(values))
+    except (ValueError, IndexError, KeyError):
+        return template
+
+def send_processing_message(c: Cardinal, order_id):
+    """Сообщение покупателю о принятии заказа в выдачу с местом в очереди и ожиданием"""
+    order_data = pending_orders.get(order_id)
+    chat_id = orders_info.get(order_id, {}).get('chat_id')
+    if not order_data or not chat_id:
+        return
+
+    position = queue_position(order_id)
+    text = render_message(load_config()['messages']['processing'],
+                          order_id=order_id,
+                          amount=order_data.get('amount', 0),
+                          username=order_data.get('minecraft_username'),
+                          position=position,
+                          eta=format_eta(estimate_wait_sec(position)))
+    try:
+        c.send_message(chat_id, text)
+    except Exception as e:
+        delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки сообщения об обработке покупателю: {e}")
+
+def pin_order(order_id) -> bool:
+    """Закрепляет заказ в начале очереди (повторный вызов снимает закрепление). Возвращает новое состояние"""
+    order_data = pending_orders[order_id]
+    order_data['pinned'] = not order_data.get('pinned', False)
+    save_pending_orders(pending_orders, order_id)
+    with delivery_queue_lock:
+        if order_id in queued_entries:
+            push_delivery(order_id)
+    delivery_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} {'закреплён в начале очереди' if order_data['pinned'] else 'откреплён'}")
+    return order_data['pinned']
+
+def next_delivery_batch() -> List[str]:
+    """Забирает из очереди следующий заказ вместе с остальными заказами того же игрока"""
+    with delivery_queue_lock:
+        first_id = None
+        while delivery_queue:
+            entry = heapq.heappop(delivery_queue)
+            order_id = entry[-1]
+            if queued_entries.get(order_id) is entry:
+                del queued_entries[order_id]
+                if order_id in pending_orders:
+                    first_id = order_id
+                    break
+        if first_id is None:
+            return []
+
+        if not load_config().get('coalesce_deliveries', True):
+            return [first_id]
+
+        key = delivery_key(pending_orders[first_id])
+        batch = [first_id]
+        for order_id, entry in sorted(queued_entries.items(), key=lambda item: item[1]):
+            order_data = pending_orders.get(order_id)
+            if order_data is None:
+                del queued_entries[order_id]
+            elif delivery_key(order_data) == key:
+                # Запись в куче становится устаревшей и будет пропущена
+                del queued_entries[order_id]
+                batch.append(order_id)
+
+    if len(batch) > 1:
+        delivery_logger.info(f"{LOGGER_PREFIX} Объединяем {len(batch)} заказов игрока {key[1]} в один перевод: {batch}")
+    return batch
+
+def delivery_worker_loop():
+    """Единственный исполнитель очереди выдачи"""
+    while True:
+        set_worker_stage('ожидание')
+        delivery_wakeup.wait(30)
+        delivery_wakeup.clear()
+        # Пока бот недоступен, заказы остаются в очереди
+        while bot_health['state'] != 'open':
+            batch = next_delivery_batch()
+            if not batch:
+                break
+            try:
+                deliver_orders(batch, load_config().get('notification_chat_id'), from_queue=True)
+            except Exception as e:
+                delivery_logger.error(f"{LOGGER_PREFIX} Ошибка выдачи заказов {batch}: {e}")
+                delivery_logger.error(f"{LOGGER_PREFIX} Трейсбек: {traceback.format_exc()}")
+            evaluate_load_shedding()
+
+def ensure_delivery_worker():
+    """Запускает исполнитель очереди выдачи, если он ещё не запущен"""
+    global delivery_worker_running
+    with delivery_queue_lock:
+        if delivery_worker_running:
+            return
+        delivery_worker_running = True
+    start_worker('delivery', delivery_worker_loop)
+
+def load_load_shedding() -> Dict:
+    """Загрузка состояния ограничения приёма (лоты могли остаться выключенными до перезапуска)"""
+    if os.path.exists(LOAD_SHEDDING_PATH):
+        try:
+            with open(LOAD_SHEDDING_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, Exception) as e:
+            storage_logger.error(f"{LOGGER_PREFIX} Ошибка при чтении файла {LOAD_SHEDDING_PATH}: {e}")
+    return {}
+
+def save_load_shedding():
+    """Сохранение состояния ограничения приёма"""
+    write_json_file(LOAD_SHEDDING_PATH, load_shedding)
+
+def set_lots_shed(shed: bool):
+    """Выключает лоты на время перегрузки или возвращает активность тем, что были включены"""
+    if not cardinal_instance:
+        return
+    lot_ids = synced_lot_ids() if shed else list(load_shedding['lots'])
+    for lot_id in lot_ids:
+        try:
+            lot_fields = cardinal_instance.account.get_lot_fields(int(lot_id))
+            if shed:
+                load_shedding['lots'][str(lot_id)] = bool(lot_fields.active)
+                if not lot_fields.active:
+                    continue
+                lot_fields.active = False
+            else:
+                if not load_shedding['lots'].get(str(lot_id)):
+                    continue
+                lot_fields.active = True
+            cardinal_instance.account.save_lot(lot_fields)
+            delivery_logger.info(f"{LOGGER_PREFIX} Лот {lot_id} {'выключен из-за очереди выдачи' if shed else 'снова включён'}")
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка переключения лота {lot_id}: {e}")
+    if not shed:
+        load_shedding['lots'] = {}
+        # Количество на лотах могло измениться, пока они были выключены
+        stock_sync_wakeup.set()
+
+def evaluate_load_shedding():
+    """Включает ограничение приёма выше порогов очереди и снимает его ниже low_water (гистерезис)"""
+    cfg = load_config()
+    shed_cfg = cfg.get('load_shedding', {})
+    if not shed_cfg.get('enabled', True) and not load_shedding['active']:
+        return
+
+    backlog = len(queued_entries)
+    drain_minutes = estimate_wait_sec(backlog) / 60 if backlog else 0
+    with load_shedding_lock:
+        if not load_shedding['active']:
+            if backlog > shed_cfg.get('max_backlog_orders', 20):
+                reason = f"в очереди {backlog} заказов"
+            elif drain_minutes > shed_cfg.get('max_drain_minutes', 30):
+                reason = f"очередь разберётся примерно за {drain_minutes:.0f} мин"
+            else:
+                return
+            load_shedding.update({'active': True, 'since': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'reason': reason})
+        elif (not shed_cfg.get('enabled', True)
+              or (backlog <= shed_cfg.get('low_water_orders', 10)
+                  and drain_minutes <= shed_cfg.get('low_water_drain_minutes', 15))):
+            reason = load_shedding['reason']
+            load_shedding.update({'active': False, 'since': None, 'reason': None})
+        else:
+            return
+        active = load_shedding['active']
+
+    actions = shed_cfg.get('actions', ['warn', 'delay_notice'])
+    if 'deactivate_lots' in actions or not active:
+        set_lots_shed(active)
+    save_load_shedding()
+
+    if active:
+        delivery_logger.warning(f"{LOGGER_PREFIX} 🚦 Ограничение приёма включено: {reason}")
+        text = f"🚦 ОЧЕРЕДЬ ВЫДАЧИ ПЕРЕГРУЖЕНА\n\n" \
+               f"Причина: {reason}\n" \
+               f"{'Лоты выключены до разгрузки очереди.' if 'deactivate_lots' in actions else 'Лоты остаются активными.'}\n" \
+               f"{'Новые покупатели получают предупреждение о задержке.' if 'delay_notice' in actions else ''}"
+    else:
+        delivery_logger.info(f"{LOGGER_PREFIX} 🚦 Ограничение приёма снято: очередь разгружена (было: {reason})")
+        text = f"✅ Очередь выдачи разгружена ({backlog} заказов), приём заказов в обычном режиме."
+
+    if 'warn' in actions and bot and cfg.get('notification_chat_id'):
+        try:
+            bot.send_message(cfg['notification_chat_id'], text.strip())
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления об ограничении приёма: {e}")
+
+def delay_notice_text() -> str:
+    """Предупреждение новому покупателю о задержке, пока очередь перегружена"""
+    shed_cfg = load_config().get('load_shedding', {})
+    if not load_shedding['active'] or 'delay_notice' not in shed_cfg.get('actions', ['warn', 'delay_notice']):
+        return ""
+    position = queue_position()
+    return render_message(shed_cfg.get('delay_notice', ''), position=position, eta=format_eta(estimate_wait_sec(position)))
+
+def park_order(order_id, admin_chat_id=None):
+    """Откладывает заказ до входа игрока на сервер"""
+    order_data = pending_orders.get(order_id)
+    if not order_data:
+        return
+
+    cfg = load_config()
+    timeout_minutes = cfg.get('parked_order_timeout_minutes', 120)
+    username = order_data.get('minecraft_username')
+
+    order_data.setdefault('parked_since', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    # Повторная парковка (игрок успел выйти) не продлевает срок ожидания
+    order_data.setdefault('parked_until', (datetime.now() + timedelta(minutes=timeout_minutes)).strftime("%Y-%m-%d %H:%M:%S"))
+    order_data['status'] = 'parked'
+    save_pending_orders(pending_orders, order_id)
+    flush_orders_info()
+    delivery_logger.info(f"{LOGGER_PREFIX} ⏸ Заказ #{order_id} отложен до входа игрока {username} (до {order_data['parked_until']})")
+
+    if order_id in orders_info:
+        try:
+            cardinal_instance.send_message(orders_info[order_id]['chat_id'],
+                                           f"🕒 Игрок {username} сейчас не в сети на сервере.\n"
+                                           f"Валюта будет выдана автоматически, как только вы зайдёте в игру.")
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления об ожидании покупателю: {e}")
+
+    if admin_chat_id and bot:
+        try:
+            bot.send_message(admin_chat_id, f"⏸ Заказ #{order_id} отложен: игрок {username} не в сети.\n"
+                                            f"Выдача произойдёт при его входе, крайний срок — {order_data['parked_until']}.")
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления администратору: {e}")
+
+    if bot_session and bot_session.is_alive():
+        bot_session.watch(username)
+    ensure_parked_monitor()
+
+def release_parked_orders(player: str):
+    """Игрок появился в сети — возвращаем его отложенные заказы в выдачу"""
+    released = []
+    # Статус меняется под блокировкой очереди, до снятия срока ожидания: истечение срока такой заказ уже не заберёт
+    with delivery_queue_lock:
+        for order_id, order_data in list(pending_orders.items()):
+            username = order_data.get('minecraft_username') or ''
+            if order_data.get('status') == 'parked' and username.lower() == (player or '').lower():
+                order_data['status'] = 'queued'
+                order_data.pop('parked_since', None)
+                order_data.pop('parked_until', None)
+                released.append(order_id)
+
+    if not released:
+        return
+
+    save_pending_orders(pending_orders, *released)
+    if bot_session and bot_session.is_alive():
+        bot_session.unwatch(player)
+    for order_id in released:
+        delivery_logger.info(f"{LOGGER_PREFIX} ▶️ Заказ #{order_id} возвращён в выдачу: игрок {player} в сети")
+        start_delivery(order_id)
+
+def expire_parked_order(order_id):
+    """Срок ожидания игрока истёк — передаём заказ администратору"""
+    with delivery_queue_lock:
+        order_data = pending_orders.get(order_id)
+        # Игрок мог появиться в сети как раз сейчас — тогда заказ уже ушёл в выдачу
+        if not order_data or order_data.get('status') != 'parked' or 'parked_until' not in order_data:
+            return
+        parked_since = order_data.pop('parked_since', None)
+        order_data.pop('parked_until', None)
+        order_data['status'] = 'ready_for_admin'
+
+    username = order_data.get('minecraft_username')
+    save_pending_orders(pending_orders, order_id)
+    delivery_logger.warning(f"{LOGGER_PREFIX} ⏰ Игрок {username} не появился в сети, заказ #{order_id} передан администратору")
+
+    cfg = load_config()
+    if bot and cfg.get('notification_chat_id'):
+        admin_msg = f"⏰ ИГРОК НЕ ПОЯВИЛСЯ В СЕТИ\n\n" \
+                    f"Заказ: #{order_id}\n" \
+                    f"Игрок: {username}\n" \
+                    f"Сумма: {order_data.get('amount', 0):,} монет\n" \
+                    f"Ожидание с: {parked_since}\n\n" \
+                    f"✅ /complete_{order_id} - Выдал вручную\n" \
+                    f"🤖 /auto_{order_id} - Попробовать снова\n" \
+                    f"❌ /cancel_{order_id} - Отменить заказ"
+        try:
+            bot.send_message(cfg['notification_chat_id'], admin_msg)
+        except Exception as e:
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления администратору: {e}")
+
+def parked_orders_loop():
+    """Держит постоянную сессию бота, пока есть отложенные заказы, и следит за их сроками"""
+    global bot_session, parked_monitor_running
+
+    retry_at = 0
+    try:
+        while True:
+            try:
+                parked = {order_id: data for order_id, data in list(pending_orders.items()) if data.get('status') == 'parked'}
+
+                now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                for order_id, order_data in parked.items():
+                    parked_until = order_data.get('parked_until')
+                    if parked_until and parked_until <= now_str:
+                        expire_parked_order(order_id)
+                parked = {order_id: data for order_id, data in parked.items() if data.get('status') == 'parked'}
+
+                if not parked:
+                    break
+                set_worker_stage('наблюдение за отложенными заказами', parked)
+
+                if not (bot_session and bot_session.is_alive()) and time.time() >= retry_at:
+                    bot_session = BotSession(on_player_online=release_parked_orders)
+                    if bot_session.start():
+                        for player in {data.get('minecraft_username') for data in parked.values()}:
+                            bot_session.watch(player)
+                    else:
+                        # Не удалось подключиться — повторим позже, не нагружая сервер
+                        retry_at = time.time() + 60
+            except Exception as e:
+                # Наблюдение не должно останавливаться: иначе сроки отложенных заказов никто не проверит
+                delivery_logger.error(f"{LOGGER_PREFIX} Ошибка наблюдения за отложенными заказами: {e}")
+                delivery_logger.error(f"{LOGGER_PREFIX} Трейсбек: {traceback.format_exc()}")
+                retry_at = time.time() + 60
+
+            time.sleep(15)
+    finally:
+        if bot_session:
+            bot_session.stop()
+            bot_session = None
+        parked_monitor_running = False
+        delivery_logger.info(f"{LOGGER_PREFIX} Отложенных заказов нет, постоянная сессия бота остановлена")
+
+    # Заказ мог быть отложен, пока сессия останавливалась
+    if any(data.get('status') == 'parked' for data in list(pending_orders.values())):
+        ensure_parked_monitor()
+
+def ensure_parked_monitor():
+    """Запускает наблюдение за отложенными заказами, если оно ещё не запущено"""
+    global parked_monitor_running
+    if parked_monitor_running:
+        return
+    parked_monitor_running = True
+    start_worker('parked-monitor', parked_orders_loop)
+
+def start_delivery(order_id, requeue=False):
+    """Постановка заказа в очередь автоматической выдачи (requeue — возврат заказа из текущей попытки выдачи)"""
+    with delivery_queue_lock:
+        order_data = pending_orders.get(order_id)
+        # Заказ уже выдаётся — его дальнейшую судьбу решает текущая попытка
+        if not order_data or (order_data.get('status') == 'delivering' and not requeue):
+            return
+        order_data['status'] = 'queued'
+        if order_id not in queued_entries:
+            push_delivery(order_id)
+    save_pending_orders(pending_orders, order_id)
+    mark_order_stage(order_id, 'queued')
+    delivery_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} поставлен в очередь выдачи (в очереди: {len(queued_entries)})")
+
+    ensure_delivery_worker()
+    delivery_wakeup.set()
+    check_funds_shortfall()
+    stock_sync_wakeup.set()
+    evaluate_load_shedding()
+
+def send_after_payment(c: Cardinal, order_id, buyer_id, buyer_chat_id):
+    """Отправка сообщения после оплаты с учётом истории никнеймов покупателя"""
+    if not buyer_chat_id:
+        return
+
+    cfg = load_config()
+    order_data = pending_orders.get(order_id)
+    last_nickname, used_count = get_last_nickname(buyer_id)
+    auto_confirmed = False
+    # Ожидание для нового заказа: он встанет в конец текущей очереди
+    position = queue_position()
+    after_payment = render_message(cfg['messages']['after_payment'],
+                                   order_id=order_id,
+                                   amount=order_data.get('amount', 0) if order_data else 0,
+                                   position=position,
+                                   eta=format_eta(estimate_wait_sec(position)))
+
+    if order_data and last_nickname and cfg.get('auto_confirm_returning_buyers', False):
+        # Повторный покупатель — сразу выдаём на прошлый никнейм
+        order_data['minecraft_username'] = last_nickname
+        order_data['waiting_for_username'] = False
+        order_data['waiting_for_confirmation'] = False
+        order_data['status'] = 'ready_for_admin'
+        save_pending_orders(pending_orders, order_id)
+        record_buyer_nickname(buyer_id, last_nickname)
+
+        intake_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id}: автоподтверждение никнейма {last_nickname} (использован {used_count} раз)")
+        mark_order_stage(order_id, 'confirmed')
+        auto_confirmed = True
+        text = f"{after_payment}\n\n" \
+               f"🔁 Валюта будет выдана на `{last_nickname}`, как в прошлый раз."
+    elif order_data and last_nickname and cfg.get('suggest_last_nickname', True):
+        # Предлагаем прошлый никнейм — покупателю достаточно ответить "+"
+        order_data['proposed_username'] = last_nickname
+        order_data['suggested_from_history'] = True
+        order_data['waiting_for_username'] = False
+        order_data['waiting_for_confirmation'] = True
+        order_data['status'] = 'awaiting_confirmation'
+        save_pending_orders(pending_orders, order_id)
+
+        intake_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id}: предложен никнейм из истории {last_nickname}")
+        text = f"{after_payment}\n\n" \
+               f"🔁 В прошлый раз вы указывали никнейм `{last_nickname}`.\n" \
+               f"Отправьте + чтобы выдать валюту на него, или напишите другой никнейм."
+    else:
+        text = after_payment
+
+    notice = delay_notice_text()
+    if notice:
+        text += f"\n\n{notice}"
+
+    try:
+        c.send_message(buyer_chat_id, text)
+        mark_order_stage(order_id, 'after_payment_sent')
+        intake_logger.info(f"{LOGGER_PREFIX} Отправлено сообщение покупателю в чат {buyer_chat_id}")
+    except Exception as msg_error:
+        intake_logger.error(f"{LOGGER_PREFIX} Ошибка отправки сообщения покупателю: {msg_error}")
+
+    if auto_confirmed:
+        start_delivery(order_id)
+        send_processing_message(c, order_id)
+
+def handle_event(c: Cardinal, e):
     """Основной обработчик событий"""
     global RUNNING, orders_info, pending_orders
 
@@ -466,34 +2571,35 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
         if isinstance(e, NewMessageEvent):
             # Обработка сообщений от покупателей
             if e.message.author_id == my_id:
-                logger.info(f"{LOGGER_PREFIX} Сообщение от самого себя, пропускаем")
+                intake_logger.info(f"{LOGGER_PREFIX} Сообщение от самого себя, пропускаем")
                 return
 
             msg_text = e.message.text.strip() if e.message.text else ""
             msg_author_id = e.message.author_id
             msg_chat_id = e.message.chat_id
             
-            logger.info(f"{LOGGER_PREFIX} Получено сообщение от пользователя {msg_author_id} в чате {msg_chat_id}: '{msg_text}'")
+            intake_logger.debug(f"{LOGGER_PREFIX} Получено сообщение от пользователя {msg_author_id} в чате {msg_chat_id}: '{msg_text}'")
 
             # Попытка распознать уведомление об оплате в чате (иногда FunPay шлёт текстовое сообщение вместо NewOrderEvent)
             try:
                 pay_match = re.search(r"оплатил(?:.|) заказ #([A-Z0-9]+)", msg_text, re.IGNORECASE)
                 if pay_match:
                     new_order_id = pay_match.group(1)
+                    paid_ts = time.time()
                     cfg_check = load_config()
                     trusted_senders = cfg_check.get('trusted_payment_senders', [0])
                     # Обрабатываем уведомления об оплате только от доверенных отправителей
                     if msg_author_id not in trusted_senders:
-                        logger.warning(f"{LOGGER_PREFIX} Игнорируем уведомление об оплате #{new_order_id} от недоверенного отправителя {msg_author_id}")
+                        intake_logger.warning(f"{LOGGER_PREFIX} Игнорируем уведомление об оплате #{new_order_id} от недоверенного отправителя {msg_author_id}")
                     else:
-                        logger.info(f"{LOGGER_PREFIX} Обнаружено уведомление об оплате заказа #{new_order_id} в сообщении чата от доверенного отправителя")
+                        intake_logger.info(f"{LOGGER_PREFIX} Обнаружено уведомление об оплате заказа #{new_order_id} в сообщении чата от доверенного отправителя")
                     # Если уже есть в ожидающих — пропускаем
                     if new_order_id in pending_orders:
-                        logger.info(f"{LOGGER_PREFIX} Заказ #{new_order_id} уже есть в pending_orders, пропускаем создание")
+                        intake_logger.info(f"{LOGGER_PREFIX} Заказ #{new_order_id} уже есть в pending_orders, пропускаем создание")
                     else:
                         try:
                             # Пытаемся получить полную информацию о заказе
-                            od_full = c.account.get_order(new_order_id)
+                            od_full = get_order_cached(c, new_order_id)
                             buyer_chat_id = od_full.chat_id
                             buyer_id = od_full.buyer_id
                             buyer_username = getattr(od_full, 'buyer_username', None)
@@ -521,21 +2627,17 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
                                 'waiting_for_username': True,
                                 'minecraft_username': None
                             }
-                            save_pending_orders(pending_orders)
-                            logger.info(f"{LOGGER_PREFIX} Заказ #{new_order_id} добавлен в ожидающие (по уведомлению в чате)")
+                            save_pending_orders(pending_orders, new_order_id)
+                            intake_logger.info(f"{LOGGER_PREFIX} Заказ #{new_order_id} добавлен в ожидающие (по уведомлению в чате)")
+                            mark_order_stage(new_order_id, 'paid', paid_ts)
+                            mark_order_stage(new_order_id, 'intake_done')
 
                             # Отправляем сообщение покупателю с просьбой указать никнейм
-                            cfg = load_config()
-                            if buyer_chat_id:
-                                try:
-                                    c.send_message(buyer_chat_id, cfg['messages']['after_payment'])
-                                    logger.info(f"{LOGGER_PREFIX} Отправлено сообщение покупателю в чат {buyer_chat_id} (по уведомлению)")
-                                except Exception as sm_err:
-                                    logger.error(f"{LOGGER_PREFIX} Ошибка отправки сообщения покупателю (по уведомлению): {sm_err}")
+                            send_after_payment(c, new_order_id, buyer_id, buyer_chat_id)
                         except Exception as ex_get:
-                            logger.error(f"{LOGGER_PREFIX} Ошибка получения информации о заказе {new_order_id} при разборе уведомления: {ex_get}")
+                            intake_logger.error(f"{LOGGER_PREFIX} Ошибка получения информации о заказе {new_order_id} при разборе уведомления: {ex_get}")
             except Exception as notify_ex:
-                logger.error(f"{LOGGER_PREFIX} Ошибка при разборе уведомления об оплате: {notify_ex}")
+                intake_logger.error(f"{LOGGER_PREFIX} Ошибка при разборе уведомления об оплате: {notify_ex}")
 
             # Сначала проверяем, не ожидает ли пользователь подтверждения ника
             for order_id, order_data in pending_orders.items():
@@ -551,34 +2653,27 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
                             # Нету предложённого ника — просим ввести ещё раз
                             order_data['waiting_for_confirmation'] = False
                             order_data['waiting_for_username'] = True
-                            save_pending_orders(pending_orders)
+                            save_pending_orders(pending_orders, order_id)
                             try:
                                 c.send_message(target_chat_id, "❗ Не найден предложённый никнейм. Пожалуйста, отправьте никнейм ещё раз:")
                             except Exception:
                                 pass
-                            logger.warning(f"{LOGGER_PREFIX} Пользователь попытался подтвердить ник, но proposed_username отсутствует для заказа #{order_id}")
+                            intake_logger.warning(f"{LOGGER_PREFIX} Пользователь попытался подтвердить ник, но proposed_username отсутствует для заказа #{order_id}")
                             return
 
                         # Сохраняем подтверждённый ник в основное поле и меняем статус
                         order_data['minecraft_username'] = proposed
                         order_data['waiting_for_confirmation'] = False
-                        order_data['status'] = 'ready_for_admin'
                         if 'proposed_username' in order_data:
                             del order_data['proposed_username']
-                        save_pending_orders(pending_orders)
-
-                        def give_thread():
-                            try:
-                                logger.info(f"{LOGGER_PREFIX} Пользователь подтвердил ник для заказа #{order_id}: {proposed}")
-                                auto_complete_order_with_currency(order_id, target_chat_id)
-                            except Exception as ex:
-                                logger.error(f"{LOGGER_PREFIX} Ошибка при автоматической выдаче после подтверждения: {ex}")
-
-                        threading.Thread(target=give_thread, daemon=True).start()
-                        try:
-                            c.send_message(target_chat_id, "✅ Подтверждение получено. Валюта будет выдана автоматически.")
-                        except Exception:
-                            pass
+                        order_data.pop('suggested_from_history', None)
+                        save_pending_orders(pending_orders, order_id)
+                        record_buyer_nickname(msg_author_id, proposed)
+
+                        intake_logger.info(f"{LOGGER_PREFIX} Пользователь подтвердил ник для заказа #{order_id}: {proposed}")
+                        mark_order_stage(order_id, 'confirmed')
+                        start_delivery(order_id)
+                        send_processing_message(c, order_id)
                         return
 
                     elif resp in ['-', 'минус', 'no', 'нет']:
@@ -587,12 +2682,20 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
                         order_data['waiting_for_username'] = True
                         if 'proposed_username' in order_data:
                             del order_data['proposed_username']
-                        save_pending_orders(pending_orders)
+                        order_data.pop('suggested_from_history', None)
+                        save_pending_orders(pending_orders, order_id)
                         try:
                             c.send_message(target_chat_id, "📥Введите новый никнейм.")
                         except Exception:
                             pass
                         return
+                    elif order_data.get('suggested_from_history'):
+                        # Вместо подтверждения никнейма из истории покупатель прислал другой никнейм
+                        order_data.pop('suggested_from_history', None)
+                        order_data.pop('proposed_username', None)
+                        order_data['waiting_for_confirmation'] = False
+                        order_data['waiting_for_username'] = True
+                        break
                     else:
                         # Неизвестный ответ
                         try:
@@ -613,45 +2716,60 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
                     if order_info and order_info.get("buyer_id") == msg_author_id:
                         found_order = order_data
                         found_order_id = order_id
-                        logger.info(f"{LOGGER_PREFIX} Найден заказ {order_id} для пользователя {msg_author_id}")
+                        intake_logger.info(f"{LOGGER_PREFIX} Найден заказ {order_id} для пользователя {msg_author_id}")
                         break
             
             if found_order:
-                logger.info(f"{LOGGER_PREFIX} Обрабатываем никнейм от пользователя: '{msg_text}'")
+                intake_logger.info(f"{LOGGER_PREFIX} Обрабатываем никнейм от пользователя: '{msg_text}'")
                 
-                # Получили никнейм от пользователя — сохраняем как предложенный и просим подтвердить
+                # Получили никнейм от пользователя — сначала проверяем его локально,
+                # чтобы заведомо невалидный ник не тратил сессию бота
                 username = msg_text
+                is_valid, reason = validate_minecraft_username(username)
+                if not is_valid:
+                    intake_logger.info(f"{LOGGER_PREFIX} Никнейм '{username}' для заказа #{found_order_id} отклонён: {reason}")
+                    try:
+                        c.send_message(orders_info[found_order_id]['chat_id'],
+                                       f"❌ Некорректный никнейм: {reason}.\nПожалуйста, отправьте никнейм ещё раз:")
+                    except Exception as send_error:
+                        intake_logger.error(f"{LOGGER_PREFIX} Ошибка отправки сообщения о некорректном никнейме: {send_error}")
+                    return
+
+                mark_order_stage(found_order_id, 'nickname_received')
+
+                # Сохраняем как предложенный и просим подтвердить
                 found_order['proposed_username'] = username
                 found_order['waiting_for_username'] = False
                 found_order['waiting_for_confirmation'] = True
                 found_order['status'] = 'awaiting_confirmation'
 
                 # Сохраняем обновленные данные
-                save_pending_orders(pending_orders)
+                save_pending_orders(pending_orders, found_order_id)
 
                 # Отправляем сообщение с просьбой подтвердить
                 cfg = load_config()
                 target_chat_id = orders_info[found_order_id]['chat_id']
                 try:
                     c.send_message(target_chat_id, f"❓Вы уверены в выдаче валюты на `{username}`? [+/-]")
-                    logger.info(f"{LOGGER_PREFIX} Запрошено подтверждение ника от пользователя в чат {target_chat_id}")
+                    intake_logger.info(f"{LOGGER_PREFIX} Запрошено подтверждение ника от пользователя в чат {target_chat_id}")
                 except Exception as send_error:
-                    logger.error(f"{LOGGER_PREFIX} Ошибка отправки запроса на подтверждение пользователю: {send_error}")
+                    intake_logger.error(f"{LOGGER_PREFIX} Ошибка отправки запроса на подтверждение пользователю: {send_error}")
 
                 return
                 
-                logger.info(f"{LOGGER_PREFIX} Автовыдача: {auto_give_enabled}, Бот: {bot_enabled}")
+                intake_logger.info(f"{LOGGER_PREFIX} Автовыдача: {auto_give_enabled}, Бот: {bot_enabled}")
                 
                 if auto_give_enabled and bot_enabled:
-                    logger.info(f"{LOGGER_PREFIX} Автовыдача включена, запускаем автоматическое завершение...")
+                    intake_logger.info(f"{LOGGER_PREFIX} Автовыдача включена, запускаем автоматическое завершение...")
                     
                     # Запускаем автоматическое завершение в отдельном потоке
                     def auto_complete_thread():
+                        set_worker_stage('автовыдача', [found_order['order_id']])
                         time.sleep(2)  # Небольшая задержка для стабильности
                         result = auto_complete_order_with_currency(found_order['order_id'], cfg.get('notification_chat_id'))
-                        logger.info(f"{LOGGER_PREFIX} Результат автозавершения заказа #{found_order['order_id']}: {result}")
+                        intake_logger.info(f"{LOGGER_PREFIX} Результат автозавершения заказа #{found_order['order_id']}: {result}")
 
-                    threading.Thread(target=auto_complete_thread, daemon=True).start()
+                    start_worker('auto-complete', auto_complete_thread)
                 else:
                     # Если автовыдача выключена - уведомляем администратора
                     if cfg.get('admin_notifications', True) and cfg.get('notification_chat_id'):
@@ -667,29 +2785,29 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
                         
                         try:
                             bot_.send_message(cfg['notification_chat_id'], admin_msg)
-                            logger.info(f"{LOGGER_PREFIX} Отправлено уведомление администратору")
+                            intake_logger.info(f"{LOGGER_PREFIX} Отправлено уведомление администратору")
                         except Exception as admin_error:
-                            logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления администратору: {admin_error}")
+                            intake_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления администратору: {admin_error}")
                 
-                logger.info(f"{LOGGER_PREFIX} Получен никнейм {username} для заказа #{found_order['order_id']}")
+                intake_logger.info(f"{LOGGER_PREFIX} Получен никнейм {username} для заказа #{found_order['order_id']}")
             else:
-                logger.info(f"{LOGGER_PREFIX} Нет ожидающего заказа для пользователя {msg_author_id}")
-                # Логируем все доступные ожидающие заказы для отладки
-                logger.info(f"{LOGGER_PREFIX} Доступные ожидающие заказы: {list(pending_orders.keys())}")
-                logger.info(f"{LOGGER_PREFIX} Доступные orders_info: {list(orders_info.keys())}")
-                
-                # Детализированная отладка
-                for order_id, order_data in pending_orders.items():
-                    order_info = orders_info.get(order_id, {})
-                    logger.info(f"{LOGGER_PREFIX} Заказ {order_id}: waiting={order_data.get('waiting_for_username', False)}, buyer_id={order_info.get('buyer_id')}")
+                intake_logger.debug(f"{LOGGER_PREFIX} Нет ожидающего заказа для пользователя {msg_author_id}")
+                # Дамп всех ожидающих заказов строится только при уровне DEBUG
+                if intake_logger.isEnabledFor(logging.DEBUG):
+                    intake_logger.debug(f"{LOGGER_PREFIX} Доступные ожидающие заказы: {list(pending_orders.keys())}")
+                    intake_logger.debug(f"{LOGGER_PREFIX} Доступные orders_info: {list(orders_info.keys())}")
+                    for order_id, order_data in pending_orders.items():
+                        order_info = orders_info.get(order_id, {})
+                        intake_logger.debug(f"{LOGGER_PREFIX} Заказ {order_id}: waiting={order_data.get('waiting_for_username', False)}, buyer_id={order_info.get('buyer_id')}")
 
         elif isinstance(e, NewOrderEvent):
             # Обработка новых заказов
-            logger.info(f"{LOGGER_PREFIX} Получен новый заказ, проверяем...")
+            intake_logger.info(f"{LOGGER_PREFIX} Получен новый заказ, проверяем...")
+            paid_ts = time.time()
             
             try:
                 if e.order.buyer_id == my_id:
-                    logger.info(f"{LOGGER_PREFIX} Заказ от самого себя, пропускаем")
+                    intake_logger.info(f"{LOGGER_PREFIX} Заказ от самого себя, пропускаем")
                     return
 
                 order_id = e.order.id
@@ -697,23 +2815,23 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
                 order_amount = e.order.amount
                 order_price = e.order.price
                 
-                logger.info(f"{LOGGER_PREFIX} Новый заказ #{order_id}: {order_desc}, x{order_amount}")
+                intake_logger.info(f"{LOGGER_PREFIX} Новый заказ #{order_id}: {order_desc}, x{order_amount}")
                 
                 # Проверяем, разрешен ли лот для обработки
                 if not is_allowed_lot(c, e):
-                    logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} пропущен - лот не в списке разрешенных")
+                    intake_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} пропущен - лот не в списке разрешенных")
                     return
                 
-                logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} прошел проверку ID лота - начинаем обработку")
+                intake_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} прошел проверку ID лота - начинаем обработку")
                 
                 # Получаем полную информацию о заказе
                 try:
-                    od_full = c.account.get_order(order_id)
+                    od_full = get_order_cached(c, order_id)
                     buyer_chat_id = od_full.chat_id
                     buyer_id = od_full.buyer_id
                     buyer_username = od_full.buyer_username
                     
-                    logger.info(f"{LOGGER_PREFIX} Полная информация: buyer_id={buyer_id}, chat_id={buyer_chat_id}, username={buyer_username}")
+                    intake_logger.info(f"{LOGGER_PREFIX} Полная информация: buyer_id={buyer_id}, chat_id={buyer_chat_id}, username={buyer_username}")
 
                     # Сохраняем информацию о заказе для связи с чатом
                     orders_info[order_id] = {
@@ -725,7 +2843,7 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
                     save_orders_info(orders_info)
                     
                 except Exception as full_order_error:
-                    logger.error(f"{LOGGER_PREFIX} Ошибка получения полной информации о заказе: {full_order_error}")
+                    intake_logger.error(f"{LOGGER_PREFIX} Ошибка получения полной информации о заказе: {full_order_error}")
                     buyer_chat_id = e.order.chat_id if hasattr(e.order, 'chat_id') else None
                     buyer_id = e.order.buyer_id
                     
@@ -738,7 +2856,7 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
                 
                 # Получаем информацию о количестве валюты
                 amount, lot_title = get_lot_info_by_order(c, e)
-                logger.info(f"{LOGGER_PREFIX} Определены параметры заказа: {amount:,} монет, '{lot_title}'")
+                intake_logger.info(f"{LOGGER_PREFIX} Определены параметры заказа: {amount:,} монет, '{lot_title}'")
                 
                 # Создаем запись об ожидающем заказе
                 pending_orders[order_id] = {
@@ -752,44 +2870,60 @@ def minecraft_currency_handler(c: Cardinal, e, *args):
                     'minecraft_username': None
                 }
 
-                save_pending_orders(pending_orders)
-                logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} добавлен в ожидающие")
+                save_pending_orders(pending_orders, order_id)
+                intake_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} добавлен в ожидающие")
+                mark_order_stage(order_id, 'paid', paid_ts)
+                mark_order_stage(order_id, 'intake_done')
                 
                 # Отправляем сообщение покупателю с просьбой указать никнейм
-                cfg = load_config()
-                if buyer_chat_id:
-                    try:
-                        c.send_message(buyer_chat_id, cfg['messages']['after_payment'])
-                        logger.info(f"{LOGGER_PREFIX} Отправлено сообщение покупателю в чат {buyer_chat_id}")
-                    except Exception as msg_error:
-                        logger.error(f"{LOGGER_PREFIX} Ошибка отправки сообщения покупателю: {msg_error}")
+                send_after_payment(c, order_id, buyer_id, buyer_chat_id)
                 
             except Exception as handler_error:
-                logger.error(f"{LOGGER_PREFIX} Ошибка в обработчике новых заказов: {handler_error}")
-                logger.error(f"{LOGGER_PREFIX} Трейсбек: {traceback.format_exc()}")
+                intake_logger.error(f"{LOGGER_PREFIX} Ошибка в обработчике новых заказов: {handler_error}")
+                intake_logger.error(f"{LOGGER_PREFIX} Трейсбек: {traceback.format_exc()}")
 
     except Exception as main_error:
-        logger.error(f"{LOGGER_PREFIX} Глобальная ошибка в обработчике событий: {main_error}")
-        logger.error(f"{LOGGER_PREFIX} Глобальный трейсбек: {traceback.format_exc()}")
+        intake_logger.error(f"{LOGGER_PREFIX} Глобальная ошибка в обработчике событий: {main_error}")
+        intake_logger.error(f"{LOGGER_PREFIX} Глобальный трейсбек: {traceback.format_exc()}")
+
+def minecraft_currency_handler(c: Cardinal, e, *args):
+    """Точка входа событий Cardinal: на время обработки поток Cardinal виден в /mc_debug"""
+    order = getattr(e, 'order', None)
+    set_worker_stage('приём заказа' if order else 'приём сообщения', [order.id] if order else None)
+    try:
+        handle_event(c, e)
+    finally:
+        clear_worker_stage()
+
+def take_pending_order(chat_id, order_id):
+    """Убирает заказ из ожидающих для ручного завершения или отмены; заказ, который бот выдаёт прямо сейчас, не трогаем"""
+    with delivery_queue_lock:
+        order_data = pending_orders.get(order_id)
+        delivering = order_data is not None and order_data.get('status') == 'delivering'
+        if order_data and not delivering:
+            del pending_orders[order_id]
 
-def complete_order(message: types.Message, order_id: str):
-    """Завершение заказа администратором"""
+    if not order_data:
+        bot.send_message(chat_id, f"❌ Заказ #{order_id} не найден в ожидающих.")
+        return None
+    if delivering:
+        bot.send_message(chat_id, f"⏳ Заказ #{order_id} сейчас выдаётся ботом — дождитесь результата выдачи.")
+        return None
+    return order_data
+
+def complete_order(message: types.Message, order_id: str, admin_id=None):
+    """Завершение заказа администратором (admin_id — если команда пришла кнопкой, а не сообщением)"""
     global pending_orders, orders_info
     
-    # Находим заказ в ожидающих
-    order_data = pending_orders.get(order_id)
-    
+    # Находим заказ в ожидающих и забираем его, если бот сейчас не выдаёт его сам
+    order_data = take_pending_order(message.chat.id, order_id)
     if not order_data:
-        bot.send_message(message.chat.id, f"❌ Заказ #{order_id} не найден в ожидающих.")
         return
     
     # Отмечаем заказ как выполненный
     order_data['status'] = 'completed'
     order_data['completed_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    order_data['completed_by'] = message.from_user.id
-    
-    # Удаляем из ожидающих
-    del pending_orders[order_id]
+    order_data['completed_by'] = admin_id or message.from_user.id
     save_pending_orders(pending_orders)
     
     # Уведомляем покупателя
@@ -805,35 +2939,34 @@ def complete_order(message: types.Message, order_id: str):
         target_chat_id = orders_info[order_id]['chat_id']
         try:
             cardinal_instance.send_message(target_chat_id, completion_msg)
-            logger.info(f"{LOGGER_PREFIX} Уведомление о завершении отправлено покупателю в чат {target_chat_id}")
+            mark_order_stage(order_id, 'buyer_notified')
+            delivery_logger.info(f"{LOGGER_PREFIX} Уведомление о завершении отправлено покупателю в чат {target_chat_id}")
         except Exception as e:
-            logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления покупателю: {e}")
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления покупателю: {e}")
     
     # Краткое подтверждение администратору
     admin_msg = f"✅ Заказ #{order_id} отмечен как выполненный"
     
     bot.send_message(message.chat.id, admin_msg)
     
-    logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} завершен администратором - уведомлен только покупатель")
+    finalize_order_timeline(order_id)
+    record_sale(order_id, order_data)
+    archive_order(order_id, order_data)
+    delivery_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} завершен администратором - уведомлен только покупатель")
 
-def cancel_order(message: types.Message, order_id: str):
-    """Отмена заказа администратором"""
+def cancel_order(message: types.Message, order_id: str, admin_id=None):
+    """Отмена заказа администратором (admin_id — если команда пришла кнопкой, а не сообщением)"""
     global pending_orders, orders_info
     
-    # Находим заказ в ожидающих
-    order_data = pending_orders.get(order_id)
-    
+    # Находим заказ в ожидающих и забираем его, если бот сейчас не выдаёт его сам
+    order_data = take_pending_order(message.chat.id, order_id)
     if not order_data:
-        bot.send_message(message.chat.id, f"❌ Заказ #{order_id} не найден в ожидающих.")
         return
     
     # Отмечаем заказ как отмененный
     order_data['status'] = 'cancelled'
     order_data['cancelled_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    order_data['cancelled_by'] = message.from_user.id
-    
-    # Удаляем из ожидающих
-    del pending_orders[order_id]
+    order_data['cancelled_by'] = admin_id or message.from_user.id
     save_pending_orders(pending_orders)
     
     # Уведомляем покупателя
@@ -845,15 +2978,17 @@ def cancel_order(message: types.Message, order_id: str):
         target_chat_id = orders_info[order_id]['chat_id']
         try:
             cardinal_instance.send_message(target_chat_id, cancel_msg)
-            logger.info(f"{LOGGER_PREFIX} Уведомление об отмене отправлено в чат {target_chat_id}")
+            delivery_logger.info(f"{LOGGER_PREFIX} Уведомление об отмене отправлено в чат {target_chat_id}")
         except Exception as e:
-            logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления об отмене: {e}")
+            delivery_logger.error(f"{LOGGER_PREFIX} Ошибка отправки уведомления об отмене: {e}")
     
     # Уведомляем администратора
     admin_msg = f"❌ Заказ #{order_id} отменен."
     bot.send_message(message.chat.id, admin_msg)
     
-    logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} отменен администратором")
+    record_sales(cancelled=1)
+    archive_order(order_id, order_data)
+    delivery_logger.info(f"{LOGGER_PREFIX} Заказ #{order_id} отменен администратором")
 
 def show_pending_orders(message: types.Message):
     """Показать все ожидающие заказы"""
@@ -864,7 +2999,7 @@ def show_pending_orders(message: types.Message):
     msg = "📋 **ОЖИДАЮЩИЕ ЗАКАЗЫ**\n\n"
     
     for order_id, data in pending_orders.items():
-        status_emoji = "⏳" if data['status'] == 'waiting_username' else "✅"
+        status_emoji = {"waiting_username": "⏳", "parked": "🕒", "queued": "📦", "delivering": "🚚", "waiting_funds": "💸"}.get(data['status'], "✅")
         username = data.get('minecraft_username', 'не указан')
         
         msg += f"{status_emoji} Заказ #{data['order_id']}\n" \
@@ -873,6 +3008,14 @@ def show_pending_orders(message: types.Message):
                f"📅 Дата: {data['date']}\n" \
                f"💵 Оплачено: {data.get('price', 0)} руб.\n"
         
+        if data['status'] == 'parked':
+            msg += f"🕒 Ждём входа игрока до {data.get('parked_until')}\n" \
+                   f"✅ /complete_{data['order_id']} | ❌ /cancel_{data['order_id']}\n"
+        
+        if data['status'] == 'waiting_funds':
+            msg += f"💸 Ждём пополнения баланса бота (/mc_balance)\n" \
+                   f"✅ /complete_{data['order_id']} | ❌ /cancel_{data['order_id']}\n"
+        
         if data['status'] == 'ready_for_admin':
             msg += f"✅ /complete_{data['order_id']} | 🤖 /auto_{data['order_id']} | ❌ /cancel_{data['order_id']}\n"
         
@@ -902,7 +3045,7 @@ def clear_all_orders(message: types.Message):
           f"✅ Система готова к работе с новыми заказами"
     
     bot.send_message(message.chat.id, msg, parse_mode='Markdown')
-    logger.info(f"{LOGGER_PREFIX} Администратор очистил все заказы: pending={pending_count}, info={info_count}")
+    telegram_logger.info(f"{LOGGER_PREFIX} Администратор очистил все заказы: pending={pending_count}, info={info_count}")
 
 def minecraft_currency_settings(message: types.Message):
     """Показать интерактивное меню настроек плагина"""
@@ -1021,11 +3164,24 @@ def show_full_settings(message: types.Message):
 • `/mc_pending` - Показать ожидающие заказы
 • `/mc_clear` - Очистить все заказы (ожидающие + данные)
 • `/mc_toggle_auto` - Переключить автовыдачу валюты (ВКЛ/ВЫКЛ)
+• `/mc_toggle_autoconfirm` - Автоподтверждение прошлого никнейма повторных покупателей
 • `/mc_process_all` - Обработать все ожидающие заказы ботом
 • `/mc_test_pay` - Тестовый перевод валюты (для отладки)
 • `/mc_force_auto` - Принудительно запустить автовыдачу для всех готовых заказов
 • `/mc_settings` - Интерактивное меню настроек
 • `/mc_test_bot` - Тестировать Minecraft бота
+• `/mc_health` - Состояние автовыдачи (circuit breaker)
+• `/mc_balance` - Перечитать баланс аккаунтов бота
+• `/mc_stock` - Пересчитать и выставить количество на лотах
+• `/mc_queue` - Очередь выдачи в порядке обработки
+• `/mc_stats` - Длительность этапов заказа (p50/p95/p99 за день и неделю)
+• `/mc_pin [ID]` - Закрепить заказ в начале очереди (повторно — открепить)
+• `/mc_trace [ID]` - Таймлайн заказа по всем попыткам выдачи (плагин и Node-бот)
+• `/mc_profile [сек]` - Профиль обработчиков и выдачи за заданное время (горячие точки)
+• `/mc_debug [mem on|off]` - Потоки плагина, очереди, размеры данных, память Node-процессов
+• `/mc_export [csv|ndjson] [с] [по] [статусы]` - История заказов файлами .gz (даты ГГГГ-ММ-ДД)
+• `/mc_report day|week|month` - Продажи: заказы, монеты, выручка, время выдачи, сбои
+• `/mc_find [запрос]` - Поиск заказа по началу номера, нику, логину или id покупателя
 • `/complete_[ID]` - Выдал валюту (заказ ID)
 • `/auto_[ID]` - Автоматическая выдача валюты
 • `/cancel_[ID]` - Отменить заказ (заказ ID)
@@ -1121,7 +3277,7 @@ def show_bot_category(chat_id, message_id=None):
             bot.send_message(chat_id, msg, parse_mode='Markdown', reply_markup=markup)
             
     except Exception as e:
-        logger.error(f"{LOGGER_PREFIX} Ошибка в show_bot_category: {e}")
+        telegram_logger.error(f"{LOGGER_PREFIX} Ошибка в show_bot_category: {e}")
         error_msg = "❌ **ОШИБКА ЗАГРУЗКИ НАСТРОЕК БОТА**\n\n" \
                    f"Произошла ошибка: {e}\n\n" \
                    "Попробуйте обновить меню или перезапустить плагин."
@@ -1189,7 +3345,7 @@ def show_messages_category(chat_id, message_id=None):
             bot.send_message(chat_id, msg, parse_mode='Markdown', reply_markup=markup)
             
     except Exception as e:
-        logger.error(f"{LOGGER_PREFIX} Ошибка в show_messages_category: {e}")
+        telegram_logger.error(f"{LOGGER_PREFIX} Ошибка в show_messages_category: {e}")
         error_msg = "❌ **ОШИБКА ЗАГРУЗКИ НАСТРОЕК СООБЩЕНИЙ**\n\n" \
                    f"Произошла ошибка: {e}\n\n" \
                    "Попробуйте обновить меню или перезапустить плагин."
@@ -1212,6 +3368,9 @@ def show_orders_category(chat_id, message_id=None):
             InlineKeyboardButton("🗑️ Очистить файлы", callback_data="clear_order_files"),
             InlineKeyboardButton("📤 Выгрузить файлы", callback_data="export_order_files")
         )
+        markup.add(
+            InlineKeyboardButton("📊 История заказов (CSV)", callback_data="export_order_history")
+        )
         markup.add(
             InlineKeyboardButton("🔙 Назад к главному меню", callback_data="back_to_main")
         )
@@ -1243,6 +3402,7 @@ def show_orders_category(chat_id, message_id=None):
 📋 **ДОСТУПНЫЕ ДЕЙСТВИЯ:**
 • Очистить все файлы заказов
 • Выгрузить файлы для резервного копирования
+• Выгрузить историю заказов в CSV (с фильтрами — /mc_export)
 
 ⚠️ **ВНИМАНИЕ:**
 Очистка файлов удалит ВСЕ данные о заказах безвозвратно!
@@ -1255,7 +3415,7 @@ def show_orders_category(chat_id, message_id=None):
             bot.send_message(chat_id, msg, parse_mode='Markdown', reply_markup=markup)
             
     except Exception as e:
-        logger.error(f"{LOGGER_PREFIX} Ошибка в show_orders_category: {e}")
+        telegram_logger.error(f"{LOGGER_PREFIX} Ошибка в show_orders_category: {e}")
         error_msg = "❌ **ОШИБКА ЗАГРУЗКИ УПРАВЛЕНИЯ ЗАКАЗАМИ**\n\n" \
                    f"Произошла ошибка: {e}\n\n" \
                    "Попробуйте обновить меню или перезапустить плагин."
@@ -1277,7 +3437,7 @@ def show_lots_category(chat_id, message_id=None):
         else:
             bot.send_message(chat_id, msg, parse_mode='Markdown')
     except Exception as e:
-        logger.error(f"{LOGGER_PREFIX} Ошибка в show_lots_category: {e}")
+        telegram_logger.error(f"{LOGGER_PREFIX} Ошибка в show_lots_category: {e}")
 
 
 def show_general_category(chat_id, message_id=None):
@@ -1331,7 +3491,7 @@ def show_general_category(chat_id, message_id=None):
             bot.send_message(chat_id, msg, parse_mode='Markdown', reply_markup=markup)
             
     except Exception as e:
-        logger.error(f"{LOGGER_PREFIX} Ошибка в show_general_category: {e}")
+        telegram_logger.error(f"{LOGGER_PREFIX} Ошибка в show_general_category: {e}")
         error_msg = "❌ **ОШИБКА ЗАГРУЗКИ ОБЩИХ НАСТРОЕК**\n\n" \
                    f"Произошла ошибка: {e}\n\n" \
                    "Попробуйте обновить меню или перезапустить плагин."
@@ -1346,7 +3506,7 @@ def show_general_category(chat_id, message_id=None):
 
 def start_minecraft_plugin(message: types.Message):
     """Запуск плагина"""
-    global RUNNING, IS_STARTED, orders_info, pending_orders
+    global RUNNING, IS_STARTED, orders_info, pending_orders, buyers_index
     
     if RUNNING:
         bot.send_message(message.chat.id, "✅ Плагин уже запущен.")
@@ -1355,9 +3515,12 @@ def start_minecraft_plugin(message: types.Message):
     RUNNING = True
     IS_STARTED = True
     
-    # Загружаем данные при запуске
+    # Загружаем данные при запуске (несохранённые этапы заказов сначала пишем на диск)
+    flush_orders_info()
     orders_info = load_orders_info()
     pending_orders = load_pending_orders()
+    buyers_index = load_buyers_index()
+    bot_balances.update(load_bot_balances())
     
     logger.info(f"{LOGGER_PREFIX} Загружено {len(orders_info)} заказов в память")
     logger.info(f"{LOGGER_PREFIX} Загружено {len(pending_orders)} ожидающих заказов")
@@ -1391,12 +3554,568 @@ def toggle_auto_give(message: types.Message):
     state_text = "✅ ВКЛЮЧЕНА" if new_state else "❌ ОТКЛЮЧЕНА"
     bot.send_message(message.chat.id, f"🤖 Автоматическая выдача валюты: {state_text}")
     
-    logger.info(f"{LOGGER_PREFIX} Автовыдача валюты {'включена' if new_state else 'отключена'} администратором")
+    telegram_logger.info(f"{LOGGER_PREFIX} Автовыдача валюты {'включена' if new_state else 'отключена'} администратором")
     
     # Если включили автовыдачу - обрабатываем все ожидающие заказы
     if new_state:
         process_pending_orders_auto(message)
 
+def show_bot_health(message: types.Message):
+    """Показать состояние circuit breaker бота"""
+    state_names = {
+        'closed': '🟢 РАБОТАЕТ',
+        'half_open': '🟡 ПРОБНАЯ ВЫДАЧА',
+        'open': '🔴 ПРИОСТАНОВЛЕНА'
+    }
+    last_cause = bot_health.get('last_cause')
+    msg = f"🩺 СОСТОЯНИЕ АВТОВЫДАЧИ\n\n" \
+          f"• Состояние: {state_names.get(bot_health['state'], bot_health['state'])}\n" \
+          f"• Сбоев подряд: {bot_health['failures']}\n" \
+          f"• Последняя причина: {FAILURE_CAUSE_NAMES.get(last_cause, '—') if last_cause else '—'}\n" \
+          f"• Последняя ошибка: {bot_health.get('last_error') or '—'}\n" \
+          f"• Изменено: {bot_health.get('changed_at') or '—'}\n" \
+          f"• В очереди выдачи: {len(queued_entries)}\n" \
+          f"• Ограничение приёма: {('🚦 с ' + load_shedding['since'] + ' (' + load_shedding['reason'] + ')') if load_shedding['active'] else 'нет'}"
+    bot.send_message(message.chat.id, msg)
+
+def show_bot_balance(message: types.Message):
+    """Перечитать и показать балансы аккаунтов бота"""
+    bot.send_message(message.chat.id, "💰 Читаю баланс аккаунтов бота...")
+
+    def worker():
+        set_worker_stage('чтение баланса бота')
+        balances = refresh_bot_balances()
+        queued_sum = sum(data.get('amount', 0) for data in list(pending_orders.values())
+                         if data.get('status') in ('queued', 'waiting_funds'))
+        msg = "💰 БАЛАНС БОТА\n\n"
+        for account, entry in balances.items():
+            if entry:
+                msg += f"• {account}: {entry['balance']:,} монет (на {entry['updated_at']})\n"
+            else:
+                msg += f"• {account}: неизвестно\n"
+        msg += f"\nЗаказы в очереди: {queued_sum:,} монет"
+        bot.send_message(message.chat.id, msg)
+
+    start_worker('balance', worker)
+
+def show_lot_stock(message: types.Message):
+    """Пересчитать количество на лотах по балансу бота и показать результат"""
+    units = calculate_available_units()
+    if units is None:
+        bot.send_message(message.chat.id, "📦 Баланс бота ещё неизвестен — выполните /mc_balance.")
+        return
+
+    sync_lot_stock(force=True)
+    msg = f"📦 КОЛИЧЕСТВО НА ЛОТАХ\n\nДоступно к продаже: {units} ед.\n\n"
+    if not stock_state:
+        msg += "Лоты для синхронизации не заданы (stock_sync.lot_ids / allowed_lot_ids)."
+    for lot_id, state in stock_state.items():
+        msg += f"• Лот {lot_id}: {state['amount']} ед., {'активен' if state['active'] else 'выключен'}\n"
+    bot.send_message(message.chat.id, msg)
+
+def show_delivery_queue(message: types.Message):
+    """Показать очередь выдачи в порядке обработки"""
+    order_ids = queue_snapshot()
+    if not order_ids:
+        bot.send_message(message.chat.id, "📦 Очередь выдачи пуста.")
+        return
+
+    msg = f"📦 ОЧЕРЕДЬ ВЫДАЧИ ({len(order_ids)})\n\n"
+    for position, order_id in enumerate(order_ids, 1):
+        data = pending_orders.get(order_id, {})
+        pin_mark = "📌 " if data.get('pinned') else ""
+        msg += f"{position}. {pin_mark}#{order_id} — {data.get('amount', 0):,} монет, {data.get('minecraft_username')} " \
+               f"(оплачен {data.get('date')}, выдача {format_eta(estimate_wait_sec(position))})\n"
+    bot.send_message(message.chat.id, msg)
+
+def toggle_pin(message: types.Message):
+    """Закрепление заказа в начале очереди выдачи: /mc_pin ID"""
+    parts = message.text.split()
+    if len(parts) < 2:
+        bot.send_message(message.chat.id, "❌ Укажите номер заказа: /mc_pin ID")
+        return
+
+    order_id = parts[1].lstrip('#')
+    if order_id not in pending_orders:
+        bot.send_message(message.chat.id, f"❌ Заказ #{order_id} не найден в ожидающих.")
+        return
+
+    pinned = pin_order(order_id)
+    bot.send_message(message.chat.id, f"📌 Заказ #{order_id} закреплён в начале очереди." if pinned else f"Заказ #{order_id} откреплён.")
+
+def show_stage_stats(message: types.Message):
+    """Перцентили длительности этапов заказа за сегодня и за неделю"""
+    msg = "📊 ДЛИТЕЛЬНОСТЬ ЭТАПОВ ЗАКАЗА\n"
+    for title, days in (("За сегодня", 1), ("За 7 дней", 7)):
+        merged = merged_stage_counts(days)
+        msg += f"\n{title}:\n"
+        if not merged:
+            msg += "• нет выданных заказов\n"
+            continue
+        for stage in ORDER_STAGES[1:] + ('total',):
+            counts = merged.get(stage)
+            if not counts:
+                continue
+            msg += f"• {STAGE_NAMES[stage]} (n={sum(counts)}): " \
+                   f"p50 {format_duration(histogram_percentile(counts, 0.5))} / " \
+                   f"p95 {format_duration(histogram_percentile(counts, 0.95))} / " \
+                   f"p99 {format_duration(histogram_percentile(counts, 0.99))}\n"
+    bot.send_message(message.chat.id, msg)
+
+def show_sales_report(message: types.Message):
+    """Отчёт о продажах из агрегатов: /mc_report day|week|month"""
+    parts = message.text.split()
+    period = parts[1].lower() if len(parts) > 1 else 'day'
+    titles = {'day': "за 24 часа", 'week': "за 7 дней", 'month': "за 30 дней"}
+    if period not in titles:
+        bot.send_message(message.chat.id, "❌ Период: /mc_report day|week|month")
+        return
+
+    totals = sales_totals(period)
+    average = format_duration(totals['delivery_sec'] / totals['delivered']) if totals['delivered'] else "—"
+    msg = f"💹 ПРОДАЖИ {titles[period].upper()}\n\n" \
+          f"• Заказов выполнено: {totals['orders']}\n" \
+          f"• Выдано монет: {totals['coins']:,}\n" \
+          f"• Выручка: {totals['rubles']:,.2f} ₽\n" \
+          f"• Среднее время от оплаты до выдачи: {average}\n" \
+          f"• Отменено: {totals['cancelled']}\n"
+    failures = [(cause, totals['fail_' + cause]) for cause in FAILURE_CAUSE_NAMES if totals['fail_' + cause]]
+    msg += "\nСбои выдачи:\n" if failures else "\nСбоев выдачи не было.\n"
+    for cause, count in failures:
+        msg += f"• {FAILURE_CAUSE_NAMES[cause]}: {count}\n"
+    bot.send_message(message.chat.id, msg)
+
+def show_order_trace(message: types.Message):
+    """Полный таймлайн заказа: этапы плагина и каждая попытка выдачи с этапами Node-бота: /mc_trace ID"""
+    parts = message.text.split()
+    if len(parts) < 2:
+        bot.send_message(message.chat.id, "❌ Укажите номер заказа: /mc_trace ID")
+        return
+
+    order_id = parts[1].lstrip('#')
+    info = orders_info.get(order_id) or find_archived_order(order_id)
+    if not info:
+        bot.send_message(message.chat.id, f"❌ Заказ #{order_id} не найден.")
+        return
+
+    # Этапы бота в таймлайне — только от последней попытки, поэтому берём их из записей попыток
+    events = [(ts, "plugin", STAGE_NAMES.get(stage, stage)) for stage, ts in info.get('timeline', {}).items() if stage not in BOT_STAGES]
+    for attempt in info.get('attempts', []):
+        tag = f"[{attempt['cid']}]"
+        events.append((attempt['started'], tag, f"попытка выдачи{' (' + attempt['account'] + ')' if attempt.get('account') else ''}"))
+        for stage, ts_ms in attempt.get('timeline', {}).items():
+            events.append((ts_ms / 1000, f"{tag} node", STAGE_NAMES.get(stage, stage)))
+        result_text = "успешно" if attempt['success'] else f"{attempt.get('error')}" + (f" на этапе {attempt['stage']}" if attempt.get('stage') else "")
+        events.append((attempt['finished'], tag, f"итог: {result_text}"))
+
+    if not events:
+        bot.send_message(message.chat.id, f"ℹ️ По заказу #{order_id} нет отметок этапов.")
+        return
+
+    events.sort(key=lambda event: event[0])
+    first_ts = events[0][0]
+    msg = f"🧭 ТРАССИРОВКА ЗАКАЗА #{order_id}\n\n"
+    for ts, source, text in events:
+        msg += f"{datetime.fromtimestamp(ts).strftime('%H:%M:%S.%f')[:-3]} (+{format_duration(ts - first_ts)}) {source} {text}\n"
+    bot.send_message(message.chat.id, msg)
+
+def sample_plugin_stacks(seconds: float) -> Counter:
+    """Сэмплирующий профиль: стеки всех потоков, в которых есть код плагина (вне захвата ничего не работает)"""
+    own_ident = threading.get_ident()
+    stacks = Counter()
+    end = time.time() + seconds
+    while time.time() < end:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident or os.path.basename(frame.f_code.co_filename) in PROFILE_IDLE_MODULES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append((frame.f_code.co_filename, frame.f_code.co_name, frame.f_code.co_firstlineno))
+                frame = frame.f_back
+            if any(filename == __file__ for filename, _, _ in stack):
+                stacks[(names.get(ident, str(ident)), tuple(reversed(stack)))] += 1
+        time.sleep(PROFILE_INTERVAL_SEC)
+    return stacks
+
+def format_profile_frame(frame) -> str:
+    filename, name, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def run_profile(seconds: int, chat_id):
+    """Захват профиля на seconds секунд: горячие точки — в Telegram, полный дамп — в storage/logs"""
+    try:
+        stacks = sample_plugin_stacks(seconds)
+        total = sum(stacks.values())
+        by_thread, leaf_hits, plugin_hits = Counter(), Counter(), Counter()
+        for (thread_name, stack), count in stacks.items():
+            by_thread[thread_name] += count
+            leaf_hits[stack[-1]] += count
+            for frame in set(frame for frame in stack if frame[0] == __file__):
+                plugin_hits[frame] += count
+
+        dump_path = os.path.join(LOG_DIR, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+        with open(dump_path, 'w', encoding='utf-8') as f:
+            f.write(f"# /mc_profile {seconds} сек, сэмплов: {total}, период {PROFILE_INTERVAL_SEC * 1000:.0f} мс\n")
+            f.write("# Свёрнутые стеки (поток;кадр;...;кадр число) — формат flamegraph.pl / speedscope\n")
+            for (thread_name, stack), count in stacks.most_common():
+                f.write(";".join([thread_name] + [format_profile_frame(frame) for frame in stack]) + f" {count}\n")
+
+        if not total:
+            bot.send_message(chat_id, f"⏱ За {seconds} сек код плагина не выполнялся (все потоки простаивали).\nДамп: {dump_path}")
+            return
+
+        msg = f"⏱ ПРОФИЛЬ ЗА {seconds} СЕК ({total} сэмплов)\n\nПотоки:\n"
+        for thread_name, count in by_thread.most_common(5):
+            msg += f"• {thread_name}: {count * 100 / total:.0f}%\n"
+        msg += "\nФункции плагина (включая вызванные):\n"
+        for frame, count in plugin_hits.most_common(10):
+            msg += f"• {count * 100 / total:.0f}% {format_profile_frame(frame)}\n"
+        msg += "\nСобственное время (верх стека):\n"
+        for frame, count in leaf_hits.most_common(10):
+            msg += f"• {count * 100 / total:.0f}% {format_profile_frame(frame)}\n"
+        msg += f"\nПолный дамп: {dump_path}"
+        bot.send_message(chat_id, msg)
+    except Exception as e:
+        logger.error(f"{LOGGER_PREFIX} Ошибка профилирования: {e}")
+        bot.send_message(chat_id, f"❌ Ошибка профилирования: {e}")
+    finally:
+        profile_lock.release()
+
+def start_profile(message: types.Message):
+    """Профилирование обработчиков, выдачи и записи хранилища на заданное время: /mc_profile [секунды]"""
+    parts = message.text.split()
+    seconds = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 30
+    seconds = max(1, min(seconds, PROFILE_MAX_SEC))
+    if not profile_lock.acquire(blocking=False):
+        bot.send_message(message.chat.id, "⏳ Профилирование уже идёт, дождитесь результата.")
+        return
+
+    start_worker('profile', run_profile, seconds, message.chat.id)
+    bot.send_message(message.chat.id, f"⏱ Профилирование запущено на {seconds} сек.")
+
+def render_find_page(query: str, page: int):
+    """Страница результатов /mc_find: текст и кнопки действий для активных заказов"""
+    results = search_orders(query)
+    if not results:
+        return f"🔎 По запросу «{query}» заказов не найдено.", None
+
+    pages = (len(results) + FIND_PAGE_SIZE - 1) // FIND_PAGE_SIZE
+    page = max(0, min(page, pages - 1))
+    msg = f"🔎 Найдено {len(results)} по запросу «{query}» (стр. {page + 1}/{pages})\n\n"
+    markup = InlineKeyboardMarkup(row_width=3)
+    for order_id in results[page * FIND_PAGE_SIZE:(page + 1) * FIND_PAGE_SIZE]:
+        with search_lock:
+            status, amount, nick, buyer, date, _ = search_index['orders'][order_id][1]
+        active = pending_orders.get(order_id)
+        if active:
+            status = active.get('status', status)
+        # Ручные действия — только для заказов, ждущих администратора; остальными распоряжается бот
+        if active and status == 'ready_for_admin':
+            markup.row(InlineKeyboardButton(f"✅ #{order_id}", callback_data=f"mcf:complete:{order_id}"),
+                       InlineKeyboardButton("🤖 Авто", callback_data=f"mcf:auto:{order_id}"),
+                       InlineKeyboardButton("❌ Отмена", callback_data=f"mcf:cancel:{order_id}"))
+        msg += f"#{order_id} — {ORDER_STATUS_NAMES.get(status, status)}\n" \
+               f"💰 {amount or 0:,} монет, 👤 {nick or 'ник не указан'}, покупатель {buyer or '—'}\n" \
+               f"📅 {date}\n\n"
+
+    # callback_data ограничен 64 байтами
+    short_query = query[:40]
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f"mcf:page:{page - 1}:{short_query}"))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f"mcf:page:{page + 1}:{short_query}"))
+    if navigation:
+        markup.row(*navigation)
+    return msg, markup
+
+def show_find(message: types.Message):
+    """Поиск заказа: /mc_find <номер или его начало | ник | логин покупателя | id покупателя>"""
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        bot.send_message(message.chat.id, "❌ Укажите запрос: /mc_find <номер заказа | ник | покупатель | id>")
+        return
+    msg, markup = render_find_page(parts[1].strip(), 0)
+    bot.send_message(message.chat.id, msg, reply_markup=markup)
+
+def handle_find_callback(call: types.CallbackQuery):
+    """Листание результатов /mc_find и действия с найденным заказом"""
+    _, action, value = call.data.split(':', 2)
+    if action == 'page':
+        page, query = value.split(':', 1)
+        msg, markup = render_find_page(query, int(page))
+        try:
+            bot.edit_message_text(msg, call.message.chat.id, call.message.message_id, reply_markup=markup)
+        except Exception:
+            pass
+        bot.answer_callback_query(call.id)
+        return
+
+    order_id = value
+    bot.answer_callback_query(call.id)
+    # С момента показа результатов заказ мог уйти в выдачу или быть закрыт
+    status = pending_orders.get(order_id, {}).get('status')
+    if status != 'ready_for_admin':
+        bot.send_message(call.message.chat.id, f"⚠️ Заказ #{order_id} уже не ждёт администратора "
+                                               f"({ORDER_STATUS_NAMES.get(status, 'не найден в ожидающих')}). Повторите /mc_find.")
+        return
+    if action == 'complete':
+        complete_order(call.message, order_id, call.from_user.id)
+    elif action == 'cancel':
+        cancel_order(call.message, order_id, call.from_user.id)
+    elif action == 'auto':
+        start_auto_give(call.message.chat.id, order_id)
+
+def start_auto_give(chat_id, order_id):
+    """Ручной запуск автоматической выдачи заказа администратором"""
+    # Проверяем, что заказ существует
+    if order_id not in pending_orders:
+        bot.send_message(chat_id, f"❌ Заказ #{order_id} не найден в ожидающих.")
+        return
+    
+    order_data = pending_orders[order_id]
+    username = order_data.get('minecraft_username')
+    amount = order_data.get('amount', 0)
+    
+    if not username:
+        bot.send_message(chat_id, f"❌ Для заказа #{order_id} не указан никнейм Minecraft.")
+        return
+    
+    # Ручная автовыдача — только для заказов, ждущих администратора: остальные ещё у покупателя или у бота
+    status = order_data.get('status')
+    if status != 'ready_for_admin':
+        bot.send_message(chat_id, f"⏳ Заказ #{order_id} сейчас не ждёт администратора ({ORDER_STATUS_NAMES.get(status, status)}).")
+        return
+    
+    bot.send_message(chat_id, f"🤖 Запускаем автоматическую выдачу {amount:,} монет игроку {username}...")
+    
+    def auto_give_thread():
+        try:
+            result = auto_complete_order_with_currency(order_id, chat_id)
+            if result:
+                bot.send_message(chat_id, f"✅ Валюта успешно выдана автоматически!")
+            else:
+                bot.send_message(chat_id, f"❌ Ошибка автоматической выдачи валюты. Проверьте логи.")
+        except Exception as e:
+            bot.send_message(chat_id, f"❌ Критическая ошибка автовыдачи: {e}")
+    
+    start_worker('auto-give', auto_give_thread)
+
+def parse_export_args(tokens: List[str]):
+    """Аргументы /mc_export: формат, даты «с» и «по», статусы через запятую (в любом порядке)"""
+    fmt, dates, statuses = 'csv', [], set()
+    for token in tokens:
+        if token.lower() in ('csv', 'ndjson'):
+            fmt = token.lower()
+        elif re.fullmatch(r"\d{4}-\d{2}-\d{2}", token):
+            dates.append(token)
+        else:
+            statuses.update(status for status in token.split(',') if status)
+    since = dates[0] if dates else None
+    until = dates[1] if len(dates) > 1 else None
+    return fmt, since, until, statuses
+
+def run_export(chat_id, fmt: str, since=None, until=None, statuses=None):
+    """Выгрузка истории заказов в Telegram по частям: каждая часть отправляется и удаляется сразу после записи"""
+    set_worker_stage('выгрузка истории заказов')
+    max_part_bytes = int(load_config().get('export', {}).get('max_part_mb', 45) * 1024 * 1024)
+    period = f"{since or 'начала'} — {until or 'сегодня'}"
+    total, parts = 0, 0
+    export_parts = export_order_history(iter_order_history(since, until, statuses), fmt, max_part_bytes)
+    try:
+        for path, rows in export_parts:
+            parts += 1
+            total += rows
+            try:
+                with open(path, 'rb') as f:
+                    bot.send_document(chat_id, f, caption=f"📊 История заказов ({period}), часть {parts}: {rows} заказов")
+            finally:
+                os.remove(path)
+        if parts:
+            bot.send_message(chat_id, f"✅ Выгрузка завершена: {total} заказов в {parts} файл(ах) {fmt.upper()}.gz")
+        else:
+            bot.send_message(chat_id, f"ℹ️ Нет заказов за период {period}" + (f" со статусом {', '.join(sorted(statuses))}" if statuses else ""))
+    except Exception as e:
+        # Недописанная часть закрывается и удаляется при закрытии генератора
+        export_parts.close()
+        storage_logger.error(f"{LOGGER_PREFIX} Ошибка выгрузки истории заказов: {e}")
+        bot.send_message(chat_id, f"❌ Ошибка выгрузки истории заказов: {e}")
+
+def start_export(message: types.Message):
+    """Выгрузка истории заказов: /mc_export [csv|ndjson] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД] [статус,статус]"""
+    fmt, since, until, statuses = parse_export_args(message.text.split()[1:])
+    bot.send_message(message.chat.id, f"📤 Готовлю выгрузку истории заказов в {fmt.upper()}...")
+    start_worker('export', run_export, message.chat.id, fmt, since, until, statuses)
+
+def process_rss_kib(pid: int):
+    """Резидентная память процесса, КиБ (из /proc; на других системах — None)"""
+    try:
+        with open(f"/proc/{pid}/status", encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def format_rss(pid: int) -> str:
+    rss = process_rss_kib(pid)
+    return f"{rss / 1024:.1f} МБ" if rss is not None else "н/д"
+
+def show_debug(message: types.Message):
+    """Состояние плагина изнутри: потоки, очереди, размеры словарей, Node-процессы, память: /mc_debug [mem on|off]"""
+    parts = message.text.split()
+    if len(parts) > 2 and parts[1] == 'mem':
+        if parts[2] == 'on' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif parts[2] == 'off' and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        bot.send_message(message.chat.id, f"🧠 Трассировка памяти {'включена' if tracemalloc.is_tracing() else 'выключена'}.")
+        return
+
+    now = time.time()
+    msg = "🛠 ОТЛАДКА ПЛАГИНА\n\nПотоки:\n"
+    with workers_lock:
+        entries = sorted(workers.values(), key=lambda entry: entry['name'])
+    for entry in entries:
+        orders_text = f" — {', '.join('#' + str(order_id) for order_id in entry['orders'][:5])}" if entry['orders'] else ""
+        msg += f"• {entry['name']}: {entry['stage']} ({now - entry['since']:.0f} сек){orders_text}\n"
+    if not entries:
+        msg += "• нет\n"
+
+    statuses = Counter(data.get('status') for data in list(pending_orders.values()))
+    msg += "\nОчереди:\n"
+    msg += f"• Приём: ждут ника {statuses.get('waiting_username', 0)}, ждут подтверждения ника {statuses.get('awaiting_confirmation', 0)}, " \
+           f"ждут администратора {statuses.get('ready_for_admin', 0)}\n"
+    msg += f"• Выдача: {len(queued_entries)} заказов (записей в куче {len(delivery_queue)}), выдаются {statuses.get('delivering', 0)}, " \
+           f"отложено {statuses.get('parked', 0)}, ждут средств {statuses.get('waiting_funds', 0)}\n"
+    msg += f"• Лог: {log_listener.queue.qsize() if log_listener else 0} записей\n"
+
+    msg += "\nРазмеры:\n"
+    for name, value in (('pending_orders', pending_orders), ('orders_info', orders_info), ('buyers_index', buyers_index),
+                        ('order_cache', order_cache), ('bot_balances', bot_balances), ('stock_state', stock_state),
+                        ('stage_stats', stage_stats), ('user_states', user_states), ('search_index', search_index['orders'])):
+        msg += f"• {name}: {len(value)}\n"
+
+    msg += f"\nПамять: плагин (Cardinal) {format_rss(os.getpid())}\n"
+    for pid, (mode, started, process) in list(node_processes.items()):
+        if process.poll() is not None:
+            node_processes.pop(pid, None)
+            continue
+        msg += f"• node {mode} (pid {pid}, {now - started:.0f} сек): {format_rss(pid)}\n"
+
+    if tracemalloc.is_tracing():
+        msg += "\nТоп выделений памяти (tracemalloc):\n"
+        for stat in tracemalloc.take_snapshot().statistics('lineno')[:10]:
+            frame = stat.traceback[0]
+            msg += f"• {stat.size / 1024:.0f} КиБ в {stat.count} блоках — {os.path.basename(frame.filename)}:{frame.lineno}\n"
+    else:
+        msg += "\nТрассировка памяти выключена: /mc_debug mem on"
+    bot.send_message(message.chat.id, msg)
+
+def render_metrics() -> str:
+    """Метрики плагина в текстовом формате Prometheus"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    with metrics_lock:
+        snapshot = json.loads(json.dumps(metrics))
+
+    metric("mc_delivery_queue_depth", "gauge", "Orders waiting in the delivery queue", [({}, len(queued_entries))])
+    metric("mc_deliveries_in_flight", "gauge", "Delivery jobs currently running", [({}, 1 if delivery_lock.locked() else 0)])
+    metric("mc_deliveries_total", "counter", "Delivered orders by outcome",
+           [({'outcome': outcome}, count) for outcome, count in sorted(snapshot['deliveries'].items())])
+    metric("mc_circuit_breaker_state", "gauge", "Circuit breaker state (1 for the current state)",
+           [({'state': state}, 1 if bot_health['state'] == state else 0) for state in ('closed', 'half_open', 'open')])
+    metric("mc_circuit_breaker_failures", "gauge", "Consecutive infrastructure failures", [({}, bot_health['failures'])])
+    last_attempt = snapshot['last_attempt']
+    if last_attempt:
+        metric("mc_last_delivery_attempt_timestamp_seconds", "gauge", "Last delivery attempt, labelled with its correlation id",
+               [({'cid': last_attempt['cid'], 'orders': last_attempt['orders'], 'outcome': last_attempt['outcome']}, round(last_attempt['ts'], 3))])
+    metric("mc_load_shedding_active", "gauge", "Whether intake is being shed", [({}, 1 if load_shedding['active'] else 0)])
+
+    metric("mc_node_spawns_total", "counter", "Node helper processes started",
+           [({'mode': mode}, stats[0]) for mode, stats in sorted(snapshot['node_runs'].items())])
+    metric("mc_node_run_seconds_total", "counter", "Total wall time of Node helper runs",
+           [({'mode': mode}, round(stats[1], 6)) for mode, stats in sorted(snapshot['node_runs'].items()) if mode != 'daemon'])
+
+    metric("mc_get_order_cache_requests_total", "counter", "get_order lookups by cache result",
+           [({'result': result}, count) for result, count in sorted(snapshot['get_order_cache'].items())])
+
+    metric("mc_persistence_writes_total", "counter", "JSON file writes",
+           [({'file': name}, stats[0]) for name, stats in sorted(snapshot['writes'].items())])
+    metric("mc_persistence_write_seconds_total", "counter", "Time spent writing JSON files",
+           [({'file': name}, round(stats[1], 6)) for name, stats in sorted(snapshot['writes'].items())])
+    metric("mc_persistence_write_bytes_total", "counter", "Bytes written to JSON files",
+           [({'file': name}, stats[2]) for name, stats in sorted(snapshot['writes'].items())])
+
+    lines.append("# HELP mc_stage_latency_seconds Time between consecutive order stages")
+    lines.append("# TYPE mc_stage_latency_seconds histogram")
+    for stage, (counts, total_sec) in sorted(snapshot['stage_latency'].items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'mc_stage_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'mc_stage_latency_seconds_sum{{stage="{stage}"}} {round(total_sec, 6)}')
+        lines.append(f'mc_stage_latency_seconds_count{{stage="{stage}"}} {cumulative}')
+
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics — метрики плагина для Prometheus"""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Запросы Prometheus не засоряют stderr Cardinal
+        pass
+
+def start_metrics_server():
+    """Запускает локальный HTTP-сервер метрик, если он включён в настройках"""
+    global metrics_server
+    metrics_cfg = load_config().get('metrics', {})
+    if metrics_server or not metrics_cfg.get('enabled', False):
+        return
+    host = metrics_cfg.get('host', '127.0.0.1')
+    port = metrics_cfg.get('port', 9787)
+    try:
+        metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.error(f"{LOGGER_PREFIX} Не удалось запустить сервер метрик на {host}:{port}: {e}")
+        return
+    start_worker('metrics-http', metrics_server.serve_forever)
+    logger.info(f"{LOGGER_PREFIX} Метрики доступны на http://{host}:{port}/metrics")
+
+def toggle_auto_confirm(message: types.Message):
+    """Переключение автоподтверждения никнейма для повторных покупателей"""
+    cfg = load_config()
+    new_state = not cfg.get('auto_confirm_returning_buyers', False)
+    cfg['auto_confirm_returning_buyers'] = new_state
+    save_config(cfg)
+
+    state_text = "✅ ВКЛЮЧЕНО" if new_state else "❌ ОТКЛЮЧЕНО"
+    bot.send_message(message.chat.id,
+                     f"🔁 Автоподтверждение прошлого никнейма: {state_text}\n\n"
+                     f"{'Повторным покупателям валюта выдаётся сразу на прошлый никнейм.' if new_state else 'Повторным покупателям предлагается прошлый никнейм, подтверждение — [+].'}")
+
+    telegram_logger.info(f"{LOGGER_PREFIX} Автоподтверждение никнейма {'включено' if new_state else 'отключено'} администратором")
+
 def process_pending_orders_auto(message: types.Message):
     """Автоматическая обработка всех ожидающих заказов"""
     global pending_orders
@@ -1422,23 +4141,23 @@ def process_pending_orders_auto(message: types.Message):
         
         for order_id, order_data in ready_orders:
             try:
-                logger.info(f"{LOGGER_PREFIX} Автообработка заказа #{order_id}")
+                telegram_logger.info(f"{LOGGER_PREFIX} Автообработка заказа #{order_id}")
                 result = auto_complete_order_with_currency(order_id, message.chat.id)
                 processed += 1
                 
                 if result:
                     successful += 1
-                    logger.info(f"{LOGGER_PREFIX} ✅ Заказ #{order_id} успешно обработан автоматически")
+                    telegram_logger.info(f"{LOGGER_PREFIX} ✅ Заказ #{order_id} успешно обработан автоматически")
                 else:
                     failed += 1
-                    logger.error(f"{LOGGER_PREFIX} ❌ Ошибка автообработки заказа #{order_id}")
+                    telegram_logger.error(f"{LOGGER_PREFIX} ❌ Ошибка автообработки заказа #{order_id}")
                 
                 # Небольшая пауза между заказами
                 time.sleep(3)
                 
             except Exception as e:
                 failed += 1
-                logger.error(f"{LOGGER_PREFIX} Критическая ошибка обработки заказа #{order_id}: {e}")
+                telegram_logger.error(f"{LOGGER_PREFIX} Критическая ошибка обработки заказа #{order_id}: {e}")
         
         # Отчет о результатах
         report_msg = f"📊 **АВТООБРАБОТКА ЗАВЕРШЕНА**\n\n" \
@@ -1455,10 +4174,10 @@ def process_pending_orders_auto(message: types.Message):
         try:
             bot.send_message(message.chat.id, report_msg, parse_mode='Markdown')
         except Exception as e:
-            logger.error(f"{LOGGER_PREFIX} Ошибка отправки отчета: {e}")
+            telegram_logger.error(f"{LOGGER_PREFIX} Ошибка отправки отчета: {e}")
     
     # Запускаем обработку в отдельном потоке
-    threading.Thread(target=process_all_orders, daemon=True).start()
+    start_worker('process-all', process_all_orders)
 
 def handle_settings_callback(call):
     """Обработка нажатий кнопок в меню настроек"""
@@ -1553,7 +4272,7 @@ def handle_settings_callback(call):
             bot.edit_message_text(msg, call.message.chat.id, call.message.message_id, parse_mode='Markdown', reply_markup=markup)
             
         except Exception as e:
-            logger.error(f"{LOGGER_PREFIX} Ошибка в back_to_main: {e}")
+            telegram_logger.error(f"{LOGGER_PREFIX} Ошибка в back_to_main: {e}")
             bot.edit_message_text(f"❌ **ОШИБКА ЗАГРУЗКИ ГЛАВНОГО МЕНЮ**\n\nПроизошла ошибка: {e}", 
                                 call.message.chat.id, call.message.message_id, parse_mode='Markdown')
         
@@ -1658,6 +4377,11 @@ def handle_settings_callback(call):
             )
         bot.answer_callback_query(call.id)
         return
+    
+    elif call.data == "export_order_history":
+        bot.answer_callback_query(call.id, "📤 Готовлю выгрузку...")
+        start_worker('export', run_export, call.message.chat.id, 'csv')
+        return
             
     elif call.data == "change_bot_username":
         user_states[user_id] = "waiting_bot_username"
@@ -1754,7 +4478,8 @@ def handle_settings_callback(call):
             "💬 **ИЗМЕНЕНИЕ ТЕКСТА ПОСЛЕ ОПЛАТЫ**\n\n"
             f"**Текущий текст:**\n```\n{current_text}\n```\n\n"
             "Введите новый текст сообщения, которое будет отправлено покупателю после оплаты заказа.\n\n"
-            "💡 Этот текст должен объяснять покупателю, что нужно указать никнейм в Minecraft.",
+            "💡 Этот текст должен объяснять покупателю, что нужно указать никнейм в Minecraft.\n\n"
+            "Доступные переменные: {order_id}, {amount}, {position}, {eta}",
             call.message.chat.id,
             call.message.message_id,
             parse_mode='Markdown'
@@ -1773,12 +4498,12 @@ def handle_settings_callback(call):
                 "⏳ ИЗМЕНЕНИЕ ТЕКСТА ОБРАБОТКИ\n\n"
                 "Текущий текст:\n" + f"<pre>{esc}</pre>\n\n"
                 "Введите новый текст сообщения при обработке заказа.\n\n"
-                "Доступные переменные: {order_id}, {amount}, {username}\n\n"
+                "Доступные переменные: {order_id}, {amount}, {username}, {position}, {eta}\n\n"
                 "Этот текст отправляется когда покупатель указал никнейм и заказ принят в обработку."
             )
             bot.edit_message_text(msg_html, call.message.chat.id, call.message.message_id, parse_mode='HTML')
         except Exception as e:
-            logger.error(f"{LOGGER_PREFIX} Ошибка редактирования сообщения (change_processing): {e}")
+            telegram_logger.error(f"{LOGGER_PREFIX} Ошибка редактирования сообщения (change_processing): {e}")
             try:
                 esc = html.escape(str(current_text))
                 fallback_html = "⏳ Введите новый текст для сообщения при обработке заказа (текущее):\n" + f"<pre>{esc}</pre>"
@@ -1803,7 +4528,7 @@ def handle_settings_callback(call):
             )
             bot.edit_message_text(msg_html, call.message.chat.id, call.message.message_id, parse_mode='HTML')
         except Exception as e:
-            logger.error(f"{LOGGER_PREFIX} Ошибка редактирования сообщения (change_completed): {e}")
+            telegram_logger.error(f"{LOGGER_PREFIX} Ошибка редактирования сообщения (change_completed): {e}")
             try:
                 esc = html.escape(str(current_text))
                 fallback_html = "✅ Введите новый текст для сообщения после завершения заказа (текущее):\n" + f"<pre>{esc}</pre>"
@@ -1851,16 +4576,10 @@ def handle_settings_input(message: types.Message):
     
     if state == "waiting_bot_username":
         # Изменяем никнейм бота
-        if len(new_value) < 3 or len(new_value) > 16:
+        is_valid, reason = validate_minecraft_username(new_value)
+        if not is_valid:
             bot.send_message(message.chat.id, 
-                           "❌ Никнейм должен быть от 3 до 16 символов!\n"
-                           "Попробуйте еще раз:")
-            return
-            
-        # Проверяем на допустимые символы (буквы, цифры, подчеркивания)
-        if not new_value.replace('_', '').isalnum():
-            bot.send_message(message.chat.id, 
-                           "❌ Никнейм может содержать только буквы, цифры и подчеркивания!\n"
+                           f"❌ Некорректный никнейм: {reason}!\n"
                            "Попробуйте еще раз:")
             return
             
@@ -1884,7 +4603,7 @@ def handle_settings_input(message: types.Message):
                         f"💡 Проверьте подключение бота командой /mc_test_bot",
                         parse_mode='Markdown')
         
-        logger.info(f"{LOGGER_PREFIX} Администратор изменил никнейм бота: {old_username} → {new_value}")
+        telegram_logger.info(f"{LOGGER_PREFIX} Администратор изменил никнейм бота: {old_username} → {new_value}")
         
     elif state == "waiting_bot_password":
         # Изменяем пароль бота
@@ -1912,7 +4631,7 @@ def handle_settings_input(message: types.Message):
                         f"💡 Проверьте подключение бота командой /mc_test_bot",
                         parse_mode='Markdown')
 
-        logger.info(f"{LOGGER_PREFIX} Администратор изменил пароль бота (длина: {len(new_value)} символов)")
+        telegram_logger.info(f"{LOGGER_PREFIX} Администратор изменил пароль бота (длина: {len(new_value)} символов)")
 
         # Удаляем сообщение с паролем для безопасности
         try:
@@ -1922,16 +4641,10 @@ def handle_settings_input(message: types.Message):
         
     elif state == "waiting_test_username":
         # Изменяем тестовый никнейм
-        if len(new_value) < 3 or len(new_value) > 16:
+        is_valid, reason = validate_minecraft_username(new_value)
+        if not is_valid:
             bot.send_message(message.chat.id, 
-                           "❌ Никнейм должен быть от 3 до 16 символов!\n"
-                           "Попробуйте еще раз:")
-            return
-            
-        # Проверяем на допустимые символы (буквы, цифры, подчеркивания)
-        if not new_value.replace('_', '').isalnum():
-            bot.send_message(message.chat.id, 
-                           "❌ Никнейм может содержать только буквы, цифры и подчеркивания!\n"
+                           f"❌ Некорректный никнейм: {reason}!\n"
                            "Попробуйте еще раз:")
             return
             
@@ -1956,7 +4669,7 @@ def handle_settings_input(message: types.Message):
                         f"💡 Убедитесь, что этот игрок онлайн при тестировании!",
                         parse_mode='Markdown')
         
-        logger.info(f"{LOGGER_PREFIX} Администратор изменил тестовый никнейм: {old_test_username} → {new_value}")
+        telegram_logger.info(f"{LOGGER_PREFIX} Администратор изменил тестовый никнейм: {old_test_username} → {new_value}")
     
     elif state == "waiting_server_ip":
         # Ожидаем ввода нового хоста или ip[:port]
@@ -1998,7 +4711,7 @@ def handle_settings_input(message: types.Message):
                         f"✅ **СЕРВЕР ИЗМЕНЁН**\n\n**Новый сервер:** `{cfg['minecraft_bot']['server']}:{cfg['minecraft_bot'].get('port', 25565)}`\n\nНастройки сохранены. Теперь все операции будут выполняться на указанном сервере.",
                         parse_mode='Markdown')
 
-        logger.info(f"{LOGGER_PREFIX} Администратор изменил сервер Minecraft: {cfg['minecraft_bot']['server']}:{cfg['minecraft_bot'].get('port', 25565)}")
+        telegram_logger.info(f"{LOGGER_PREFIX} Администратор изменил сервер Minecraft: {cfg['minecraft_bot']['server']}:{cfg['minecraft_bot'].get('port', 25565)}")
         
     elif state == "waiting_after_payment":
         # Изменяем текст после оплаты
@@ -2017,7 +4730,7 @@ def handle_settings_input(message: types.Message):
                         f"🔄 Настройки сохранены! Этот текст будет отправляться покупателям после оплаты.",
                         parse_mode='Markdown')
         
-        logger.info(f"{LOGGER_PREFIX} Администратор изменил текст после оплаты")
+        telegram_logger.info(f"{LOGGER_PREFIX} Администратор изменил текст после оплаты")
         
     elif state == "waiting_processing":
         # Изменяем текст обработки
@@ -2050,7 +4763,7 @@ def handle_settings_input(message: types.Message):
                         f"🔄 Настройки сохранены! Этот текст будет отправляться при обработке заказов.",
                         parse_mode='Markdown')
         
-        logger.info(f"{LOGGER_PREFIX} Администратор изменил текст обработки заказа")
+        telegram_logger.info(f"{LOGGER_PREFIX} Администратор изменил текст обработки заказа")
         
     elif state == "waiting_completed":
         # Изменяем текст завершения
@@ -2083,7 +4796,7 @@ def handle_settings_input(message: types.Message):
                         f"🔄 Настройки сохранены! Этот текст будет отправляться после успешного завершения заказов.",
                         parse_mode='Markdown')
         
-        logger.info(f"{LOGGER_PREFIX} Администратор изменил текст завершения заказа")
+        telegram_logger.info(f"{LOGGER_PREFIX} Администратор изменил текст завершения заказа")
         
     elif state == "confirm_processing":
         # Если админ отвечает 'да' — сохраняем temp; иначе воспринимаем ответ как новый текст
@@ -2102,7 +4815,7 @@ def handle_settings_input(message: types.Message):
             # Очистим состояние текущего пользователя
             if user_id in user_states:
                 del user_states[user_id]
-            logger.info(f"{LOGGER_PREFIX} Администратор подтвердил изменение текста обработки")
+            telegram_logger.info(f"{LOGGER_PREFIX} Администратор подтвердил изменение текста обработки")
         else:
             # Воспринять ввод как новый текст — валидировать и сохранить при успехе
             if len(new_value) > 1000:
@@ -2139,7 +4852,7 @@ def handle_settings_input(message: types.Message):
             if user_id in user_states:
                 del user_states[user_id]
 
-            logger.info(f"{LOGGER_PREFIX} Администратор изменил текст обработки заказа")
+            telegram_logger.info(f"{LOGGER_PREFIX} Администратор изменил текст обработки заказа")
 
     elif state == "confirm_completed":
         # Если админ отвечает 'да' — сохраняем temp; иначе воспринимаем ответ как новый текст
@@ -2157,7 +4870,7 @@ def handle_settings_input(message: types.Message):
             user_states.pop(f"{user_id}_temp", None)
             if user_id in user_states:
                 del user_states[user_id]
-            logger.info(f"{LOGGER_PREFIX} Администратор подтвердил изменение текста завершения")
+            telegram_logger.info(f"{LOGGER_PREFIX} Администратор подтвердил изменение текста завершения")
         else:
             # Воспринять ввод как новый текст — валидировать и сохранить при успехе
             if len(new_value) > 1000:
@@ -2192,7 +4905,7 @@ def handle_settings_input(message: types.Message):
             if user_id in user_states:
                 del user_states[user_id]
 
-            logger.info(f"{LOGGER_PREFIX} Администратор изменил текст завершения заказа")
+            telegram_logger.info(f"{LOGGER_PREFIX} Администратор изменил текст завершения заказа")
         
     elif state == "confirm_clear_files" and new_value == "ОЧИСТИТЬ":
         # Подтверждение очистки файлов заказов
@@ -2230,7 +4943,7 @@ def handle_settings_input(message: types.Message):
                             f"✅ Система очищена и готова к работе с новыми заказами!",
                             parse_mode='Markdown')
             
-            logger.info(f"{LOGGER_PREFIX} Администратор очистил файлы заказов: pending={pending_count}, info={info_count}")
+            telegram_logger.info(f"{LOGGER_PREFIX} Администратор очистил файлы заказов: pending={pending_count}, info={info_count}")
             
         except Exception as e:
             bot.send_message(message.chat.id, 
@@ -2238,7 +4951,7 @@ def handle_settings_input(message: types.Message):
                             f"Не удалось очистить файлы: {e}\n\n"
                             f"Попробуйте выполнить команду /mc_clear для очистки через альтернативный способ.",
                             parse_mode='Markdown')
-            logger.error(f"{LOGGER_PREFIX} Ошибка очистки файлов: {e}")
+            telegram_logger.error(f"{LOGGER_PREFIX} Ошибка очистки файлов: {e}")
             
     elif state == "confirm_clear_files":
         # Неправильное подтверждение
@@ -2250,7 +4963,7 @@ def handle_settings_input(message: types.Message):
     elif state == "waiting_lot_add" or state == "waiting_lot_remove":
         # Функционал управления лотами отключён
         bot.send_message(message.chat.id, "⚠️ Функция управления ID лотов отключена в этой сборке.")
-        logger.info(f"{LOGGER_PREFIX} Попытка использования управления лотами — функция отключена")
+        telegram_logger.info(f"{LOGGER_PREFIX} Попытка использования управления лотами — функция отключена")
     
     # Очищаем состояние пользователя
     if user_id in user_states:
@@ -2263,15 +4976,45 @@ def init_commands(c_: Cardinal):
     cardinal_instance = c_
     bot = c_.telegram.bot
     
-    logger.info(f"{LOGGER_PREFIX} Инициализация плагина...")
+    telegram_logger.info(f"{LOGGER_PREFIX} Инициализация плагина...")
     
     # Загружаем данные в глобальные переменные
-    global orders_info, pending_orders
+    global orders_info, pending_orders, buyers_index
     orders_info = load_orders_info()
     pending_orders = load_pending_orders()
+    buyers_index = load_buyers_index()
+    bot_balances.update(load_bot_balances())
+    trim_orders_info()
+    build_search_index()
+    # Этапы заказов, накопленные с последнего сохранения, не теряются при остановке
+    atexit.register(flush_orders_info)
     
-    logger.info(f"{LOGGER_PREFIX} Загружено {len(orders_info)} заказов в память")
-    logger.info(f"{LOGGER_PREFIX} Загружено {len(pending_orders)} ожидающих заказов")
+    telegram_logger.info(f"{LOGGER_PREFIX} Загружено {len(orders_info)} заказов в память")
+    telegram_logger.info(f"{LOGGER_PREFIX} Загружено {len(pending_orders)} ожидающих заказов")
+    telegram_logger.info(f"{LOGGER_PREFIX} Загружена история никнеймов {len(buyers_index)} покупателей")
+    
+    # Отложенные до входа игрока заказы переживают перезапуск
+    if any(data.get('status') == 'parked' for data in pending_orders.values()):
+        ensure_parked_monitor()
+    
+    # Количество на лотах следует за балансом бота
+    stock_state.update(load_stock_state())
+    start_metrics_server()
+    stage_stats.update(load_stage_stats())
+    sales_stats.update(load_sales_stats())
+    load_shedding.update(load_load_shedding())
+    ensure_stock_sync()
+    
+    # Заказы, стоявшие в очереди выдачи до перезапуска, возвращаем в очередь
+    for order_id, order_data in list(pending_orders.items()):
+        if order_data.get('status') == 'queued':
+            start_delivery(order_id)
+        elif order_data.get('status') == 'delivering':
+            # Плагин остановился посреди выдачи — перевод мог пройти, решает администратор
+            report_failed_delivery(order_id, order_data, {'message': 'Плагин перезапущен во время выдачи'},
+                                   load_config().get('notification_chat_id'), outcome_unknown=True)
+    # Ограничение приёма, включённое до перезапуска, снимается, если очередь уже разгружена
+    evaluate_load_shedding()
     
     # Регистрация команд
     @bot.message_handler(commands=['mc_settings'])
@@ -2298,6 +5041,58 @@ def init_commands(c_: Cardinal):
     def mc_toggle_auto_handler(message):
         toggle_auto_give(message)
     
+    @bot.message_handler(commands=['mc_health'])
+    def mc_health_handler(message):
+        show_bot_health(message)
+    
+    @bot.message_handler(commands=['mc_balance'])
+    def mc_balance_handler(message):
+        show_bot_balance(message)
+    
+    @bot.message_handler(commands=['mc_stock'])
+    def mc_stock_handler(message):
+        show_lot_stock(message)
+    
+    @bot.message_handler(commands=['mc_queue'])
+    def mc_queue_handler(message):
+        show_delivery_queue(message)
+    
+    @bot.message_handler(commands=['mc_pin'])
+    def mc_pin_handler(message):
+        toggle_pin(message)
+    
+    @bot.message_handler(commands=['mc_stats'])
+    def mc_stats_handler(message):
+        show_stage_stats(message)
+    
+    @bot.message_handler(commands=['mc_trace'])
+    def mc_trace_handler(message):
+        show_order_trace(message)
+    
+    @bot.message_handler(commands=['mc_profile'])
+    def mc_profile_handler(message):
+        start_profile(message)
+    
+    @bot.message_handler(commands=['mc_debug'])
+    def mc_debug_handler(message):
+        show_debug(message)
+    
+    @bot.message_handler(commands=['mc_export'])
+    def mc_export_handler(message):
+        start_export(message)
+    
+    @bot.message_handler(commands=['mc_report'])
+    def mc_report_handler(message):
+        show_sales_report(message)
+    
+    @bot.message_handler(commands=['mc_find'])
+    def mc_find_handler(message):
+        show_find(message)
+    
+    @bot.message_handler(commands=['mc_toggle_autoconfirm'])
+    def mc_toggle_autoconfirm_handler(message):
+        toggle_auto_confirm(message)
+    
     @bot.message_handler(commands=['mc_process_all'])
     def mc_process_all_handler(message):
         process_pending_orders_auto(message)
@@ -2336,7 +5131,7 @@ def init_commands(c_: Cardinal):
             except Exception as e:
                 bot.send_message(message.chat.id, f"❌ Критическая ошибка: {e}")
         
-        threading.Thread(target=test_pay_thread, daemon=True).start()
+        start_worker('test-pay', test_pay_thread)
     
     @bot.message_handler(commands=['mc_force_auto'])
     def mc_force_auto_handler(message):
@@ -2348,10 +5143,10 @@ def init_commands(c_: Cardinal):
                 global pending_orders
                 ready_orders = []
                 
-                # Находим ВСЕ заказы со статусом ready_for_admin или имеющие никнейм
+                # Находим ВСЕ заказы с никнеймом, кроме тех, что уже в очереди автовыдачи
                 for order_id, order_data in pending_orders.items():
                     username = order_data.get('minecraft_username')
-                    if username and username != 'не указан':
+                    if username and username != 'не указан' and order_data.get('status') not in WORKER_STATUSES:
                         ready_orders.append((order_id, order_data))
                         bot.send_message(message.chat.id, f"🎯 Найден заказ #{order_id} для {username}")
                 
@@ -2376,7 +5171,7 @@ def init_commands(c_: Cardinal):
             except Exception as e:
                 bot.send_message(message.chat.id, f"❌ Критическая ошибка: {e}")
         
-        threading.Thread(target=force_auto_thread, daemon=True).start()
+        start_worker('force-auto', force_auto_thread)
     
     @bot.message_handler(commands=['mc_test_bot'])
     def mc_test_bot_handler(message):
@@ -2393,7 +5188,7 @@ def init_commands(c_: Cardinal):
             except Exception as e:
                 bot.send_message(message.chat.id, f"❌ Критическая ошибка тестирования: {e}")
         
-        threading.Thread(target=test_thread, daemon=True).start()
+        start_worker('bot-test', test_thread)
     
     # Команды управления лотами удалены
     
@@ -2414,45 +5209,23 @@ def init_commands(c_: Cardinal):
     def auto_complete_handler(message):
         """Автоматическая выдача валюты"""
         order_id = message.text.replace('/auto_', '')
-        
-        # Проверяем, что заказ существует
-        if order_id not in pending_orders:
-            bot.send_message(message.chat.id, f"❌ Заказ #{order_id} не найден в ожидающих.")
-            return
-        
-        order_data = pending_orders[order_id]
-        username = order_data.get('minecraft_username')
-        amount = order_data.get('amount', 0)
-        
-        if not username:
-            bot.send_message(message.chat.id, f"❌ Для заказа #{order_id} не указан никнейм Minecraft.")
-            return
-        
-        bot.send_message(message.chat.id, f"🤖 Запускаем автоматическую выдачу {amount:,} монет игроку {username}...")
-        
-        def auto_give_thread():
-            try:
-                result = auto_complete_order_with_currency(order_id, message.chat.id)
-                if result:
-                    bot.send_message(message.chat.id, f"✅ Валюта успешно выдана автоматически!")
-                else:
-                    bot.send_message(message.chat.id, f"❌ Ошибка автоматической выдачи валюты. Проверьте логи.")
-            except Exception as e:
-                bot.send_message(message.chat.id, f"❌ Критическая ошибка автовыдачи: {e}")
-        
-        threading.Thread(target=auto_give_thread, daemon=True).start()
+        start_auto_give(message.chat.id, order_id)
     
     # Обработчик для настроек (инлайн кнопки)
     @bot.callback_query_handler(func=lambda call: call.data in [
         'show_bot_category', 'show_messages_category', 'show_orders_category', 'show_general_category',
     'back_to_main', 'change_bot_username', 'change_bot_password', 'change_test_username', 'change_after_payment', 
         'change_processing', 'change_completed', 'show_all_settings', 'refresh_settings', 
-        'show_password', 'clear_order_files', 'export_order_files', 'bot_category_header', 
+        'show_password', 'clear_order_files', 'export_order_files', 'export_order_history', 'bot_category_header', 
     'set_server_spooky', 'change_server_ip', 'messages_category_header', 'orders_category_header', 'general_category_header'
     ])
     def settings_callback_handler(call):
         handle_settings_callback(call)
     
+    @bot.callback_query_handler(func=lambda call: call.data and call.data.startswith('mcf:'))
+    def find_callback_handler(call):
+        handle_find_callback(call)
+    
     # Обработчик для ввода новых значений настроек
     @bot.message_handler(func=lambda message: message.from_user.id in user_states)
     def settings_input_handler(message):
@@ -2468,16 +5241,16 @@ def init_commands(c_: Cardinal):
     if cfg.get('auto_start', True):
         global RUNNING
         RUNNING = True
-        logger.info(f"{LOGGER_PREFIX} Автозапуск плагина активирован")
+        telegram_logger.info(f"{LOGGER_PREFIX} Автозапуск плагина активирован")
     
-    logger.info(f"{LOGGER_PREFIX} Плагин успешно инициализирован")
+    telegram_logger.info(f"{LOGGER_PREFIX} Плагин успешно инициализирован")
     
     # Выводим начальную информацию
-    logger.info(f"{LOGGER_PREFIX} ========================================")
-    logger.info(f"{LOGGER_PREFIX} MINECRAFT CURRENCY PLUGIN v{VERSION}")
-    logger.info(f"{LOGGER_PREFIX} {DESCRIPTION}")
-    logger.info(f"{LOGGER_PREFIX} Создатель @ilpajj, funpay - https://funpay.com/users/5327459/")
-    logger.info(f"{LOGGER_PREFIX} ========================================")
+    telegram_logger.info(f"{LOGGER_PREFIX} ========================================")
+    telegram_logger.info(f"{LOGGER_PREFIX} MINECRAFT CURRENCY PLUGIN v{VERSION}")
+    telegram_logger.info(f"{LOGGER_PREFIX} {DESCRIPTION}")
+    telegram_logger.info(f"{LOGGER_PREFIX} Создатель @ilpajj, funpay - https://funpay.com/users/5327459/")
+    telegram_logger.info(f"{LOGGER_PREFIX} ========================================")
 
 # Регистрация обработчиков
 BIND_TO_PRE_INIT = [init_commands]